@@ -1,45 +1,408 @@
+import argparse
+import bisect
+import itertools
+import math
+import operator
+import os
+import re
 import sqlite3
+import threading
+import time
+from array import array
+from collections import Counter, OrderedDict, deque
 
-DB_NAME = r"D:\pythonvs\KKurs.db"  # Путь к базе данных
+DB_NAME = os.environ.get("KKURS_DB", r"D:\pythonvs\KKurs.db")  # Путь к базе данных
 
-# --- Вспомогательные функции ---
+# --- Подключение ---
+
+CACHED_STATEMENTS = 256  # Сколько подготовленных запросов sqlite3 держит на подключение
+
+# Наборы PRAGMA, которые выполняются при подключении (порядок важен: journal_mode первым)
+PRAGMA_PROFILES = {
+    # Настройки SQLite по умолчанию: журнал отката, полный fsync, внешние ключи не проверяются
+    "default": {},
+    # WAL: читатели не блокируют писателя, fsync только на контрольных точках; кэш 64 МБ, mmap 256 МБ
+    "fast": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "foreign_keys": "ON",
+        "cache_size": -64 * 1024,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    },
+}
+PRAGMA_PROFILE = os.environ.get("KKURS_PRAGMA_PROFILE", "fast")
+
+def parse_pragmas(text):
+    """Разбирает строку вида "cache_size=-200000,mmap_size=0" в словарь PRAGMA."""
+    pragmas = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        name, _, value = item.partition("=")
+        pragmas[name.strip()] = value.strip()
+    return pragmas
+
+def connection_pragmas(profile=None):
+    """PRAGMA для подключения: профиль плюс переопределения из переменной окружения KKURS_PRAGMAS."""
+    pragmas = dict(PRAGMA_PROFILES[profile or PRAGMA_PROFILE])
+    pragmas.update(parse_pragmas(os.environ.get("KKURS_PRAGMAS", "")))
+    return pragmas
+
+def apply_pragmas(conn, pragmas):
+    """Выполняет PRAGMA на подключении."""
+    for name, value in pragmas.items():
+        if not re.fullmatch(r"\w+", name) or not re.fullmatch(r"-?\w+", str(value)):
+            raise ValueError(f"Некорректная PRAGMA: {name}={value}")
+        conn.execute(f"PRAGMA {name} = {value}")
+
+class KKursConnection(sqlite3.Connection):
+    """Подключение, которое помнит, какое состояние базы последним видел кэш справочников (см. ReferenceCache),
+    и держит граф персон (см. person_graph)."""
+    database = None
+    seen = None
+    graph = None
+
+    def cursor(self, factory=None):
+        """Курсор; при включённых замерах (QUERY_STATS) по умолчанию KKursCursor."""
+        return super().cursor(factory or (KKursCursor if QUERY_STATS else sqlite3.Cursor))
+
+    # sqlite3.Connection.execute создаёт курсор сам, не через cursor(), поэтому переопределяем и его
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def get_connection(db_name=None, profile=None):
+    """Подключается к базе данных, применяет профиль PRAGMA и доводит схему до последней версии."""
+    conn = sqlite3.connect(db_name or DB_NAME, cached_statements=CACHED_STATEMENTS, factory=KKursConnection)
+    apply_pragmas(conn, connection_pragmas(profile))
+    migrate(conn)
+    return conn
+
+# --- Замеры запросов ---
+
+# Замеры выключены по умолчанию: KKursCursor считает время каждой строки в Python, и это заметно
+# замедляет чтение (см. benchmarks.py queries). Включаются KKURS_QUERY_STATS=1 или --query-report.
+QUERY_STATS = os.environ.get("KKURS_QUERY_STATS", "0") != "0"  # 1 - подключения замеряют запросы
+SLOW_QUERY_MS = float(os.environ.get("KKURS_SLOW_QUERY_MS", "100"))  # Запросы дольше этого попадают в журнал медленных
+SLOW_LOG = os.environ.get("KKURS_SLOW_LOG")  # Файл журнала медленных запросов (дописывается); без него - только в памяти
+SLOW_KEEP = 100  # Сколько последних медленных запросов держать в памяти
+MAX_STATEMENTS = 1000  # Сколько разных запросов учитывать отдельно; остальные идут в одну строку OTHER_STATEMENT
+OTHER_STATEMENT = "(другие запросы)"
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)  # Границы гистограммы, секунды
+EXPLAINED = ("SELECT", "WITH", "UPDATE", "DELETE")  # Для каких запросов смотреть план
+
+class KKursCursor(sqlite3.Cursor):
+    """Курсор, который замеряет свои запросы и отдаёт итог в query_stats.
+
+    Время запроса - это время execute и всех fetch (без пауз между ними, когда строки обрабатывает
+    вызывающий код), строки - прочитанные строки для SELECT и rowcount для записи. Запрос считается
+    завершённым, когда строки кончились, курсор закрыт, выполнен следующий запрос или курсор удалён.
+    """
+    query = None  # [текст, параметры, секунды, строки] запроса, строки которого ещё читаются
+
+    def execute(self, sql, parameters=()):
+        self.finish()
+        start = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        except sqlite3.Error:
+            query_stats.record(self.connection, sql, parameters, time.perf_counter() - start, 0, error=True)
+            raise
+        self.started(sql, parameters, time.perf_counter() - start)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self.finish()
+        start = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        except sqlite3.Error:
+            query_stats.record(self.connection, sql, None, time.perf_counter() - start, 0, error=True)
+            raise
+        self.started(sql, None, time.perf_counter() - start)
+        return self
+
+    def started(self, sql, parameters, seconds):
+        if self.description is None:
+            query_stats.record(self.connection, sql, parameters, seconds, max(self.rowcount, 0))
+        else:
+            self.query = [sql, parameters, seconds, 0]
+
+    def fetched(self, start, rows, done):
+        query = self.query
+        if query is not None:
+            query[2] += time.perf_counter() - start
+            query[3] += rows
+            if done:
+                self.finish()
+
+    def finish(self, error=False):
+        """Передаёт замер незавершённого запроса в query_stats."""
+        query = self.query
+        if query is not None:
+            self.query = None
+            query_stats.record(self.connection, query[0], query[1], query[2], query[3], error)
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self.fetched(start, 0, True)
+            raise
+        except sqlite3.Error:
+            self.finish(error=True)
+            raise
+        self.fetched(start, 1, False)
+        return row
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self.fetched(start, row is not None, row is None)
+        return row
 
-def get_connection():
-    """Подключается к базе данных."""
-    return sqlite3.connect(DB_NAME)
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self.fetched(start, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self.fetched(start, len(rows), True)
+        return rows
+
+    def close(self):
+        self.finish()
+        super().close()
+
+    def __del__(self):
+        if self.query is not None and query_stats is not None:
+            self.finish()
+
+def full_scans(conn, sql, parameters):
+    """(таблицы, которые запрос читает целиком, план) по EXPLAIN QUERY PLAN; None, если план не получить.
+
+    Полным просмотром считается строка плана SCAN - кроме виртуальных таблиц (FTS, R*Tree, у них свои
+    индексы) и подзапросов. SCAN по индексу тоже попадает сюда: он читает весь индекс, если у запроса
+    нет LIMIT, который остановит его раньше.
+    """
+    try:
+        # Обычный курсор, а не KKursCursor: сам EXPLAIN замерять не нужно
+        plan = [row[3] for row in sqlite3.Cursor(conn).execute("EXPLAIN QUERY PLAN " + sql, parameters or ())]
+    except (sqlite3.Error, ValueError):
+        return None
+    tables = []
+    for detail in plan:
+        words = detail.split()
+        if words[0] != "SCAN" or "VIRTUAL" in words or words[1] in ("CONSTANT", "SUBQUERY") or words[1].startswith("("):
+            continue
+        table = words[2] if words[1] == "TABLE" else words[1]  # Старые версии SQLite пишут "SCAN TABLE имя"
+        if table not in tables:
+            tables.append(table)
+    return tables, plan
+
+class QueryStats:
+    """Статистика запросов всех подключений процесса: число, ошибки, время (гистограмма), строки, полные просмотры.
+
+    Запросы группируются по тексту SQL без лишних пробелов; значения в запросы подставляются через "?",
+    так что один запрос из функции - одна строка статистики. При первом выполнении запроса SELECT,
+    UPDATE или DELETE смотрится его план (full_scans). Запросы дольше slow_ms пишутся в журнал.
+    """
+
+    def __init__(self, slow_ms=SLOW_QUERY_MS, slow_log=SLOW_LOG):
+        self.slow_ms = slow_ms
+        self.slow_log = slow_log
+        self.lock = threading.Lock()
+        self.keys = {}  # Текст запроса -> ключ статистики
+        self.statements = {}  # Ключ -> счётчики
+        self.slow = deque(maxlen=SLOW_KEEP)
+        self.slow_total = 0
+
+    def key(self, sql):
+        key = self.keys.get(sql)
+        if key is None:
+            key = " ".join(sql.split())
+            if len(self.keys) < MAX_STATEMENTS * 4:
+                self.keys[sql] = key
+        return key
+
+    def record(self, conn, sql, parameters, seconds, rows, error=False):
+        """Учитывает одно выполнение запроса."""
+        key = self.key(sql)
+        with self.lock:
+            entry = self.statements.get(key)
+            new = entry is None
+            if new:
+                if len(self.statements) >= MAX_STATEMENTS:
+                    key = OTHER_STATEMENT
+                    entry = self.statements.get(key)
+                    new = False
+                if entry is None:
+                    entry = self.statements[key] = {"count": 0, "errors": 0, "seconds": 0.0, "max": 0.0, "rows": 0,
+                                                    "buckets": [0] * (len(LATENCY_BUCKETS) + 1), "scans": None,
+                                                    "plan": None}
+            entry["count"] += 1
+            entry["errors"] += error
+            entry["seconds"] += seconds
+            entry["rows"] += rows
+            entry["buckets"][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            if seconds > entry["max"]:
+                entry["max"] = seconds
+        if new and not error and key.split(" ", 1)[0].upper() in EXPLAINED:
+            entry["scans"], entry["plan"] = full_scans(conn, sql, parameters) or (None, None)
+        if seconds * 1000 >= self.slow_ms:
+            self.log_slow(key, parameters, seconds, rows, error)
+
+    def log_slow(self, key, parameters, seconds, rows, error):
+        line = f"{time.strftime('%Y-%m-%d %H:%M:%S')} {seconds * 1000:.1f} мс, строк {rows}"
+        if error:
+            line += ", ошибка"
+        line += f": {key}"
+        if parameters:
+            text = repr(tuple(parameters) if isinstance(parameters, list) else parameters)
+            line += f" -- {text[:200]}{'...' if len(text) > 200 else ''}"
+        with self.lock:
+            self.slow.append(line)
+            self.slow_total += 1
+        if self.slow_log:
+            try:
+                with open(self.slow_log, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except OSError as e:
+                print(f"Ошибка записи журнала медленных запросов: {e}")
+
+    def stats(self):
+        """Счётчики по запросам, самые долгие в сумме первыми."""
+        with self.lock:
+            items = [(key, dict(entry, buckets=list(entry["buckets"]))) for key, entry in self.statements.items()]
+        items.sort(key=lambda item: item[1]["seconds"], reverse=True)
+        return [dict(entry, sql=key, mean=entry["seconds"] / entry["count"]) for key, entry in items]
+
+    def reset(self):
+        with self.lock:
+            self.statements.clear()
+            self.slow.clear()
+            self.slow_total = 0
+
+    def report(self, limit=20):
+        """Таблица самых долгих запросов для вывода на экран."""
+        lines = [f"{'всего, мс':>10} {'раз':>7} {'сред, мс':>9} {'макс, мс':>9} {'строк':>9}  запрос"]
+        for entry in self.stats()[:limit]:
+            sql = entry["sql"] if len(entry["sql"]) <= 100 else entry["sql"][:97] + "..."
+            lines.append(f"{entry['seconds'] * 1000:>10.1f} {entry['count']:>7} {entry['mean'] * 1000:>9.2f} "
+                         f"{entry['max'] * 1000:>9.2f} {entry['rows']:>9}  {sql}")
+            if entry["errors"]:
+                lines.append(f"{'':>49}  ошибок: {entry['errors']}")
+            if entry["scans"]:
+                lines.append(f"{'':>49}  полный просмотр: {', '.join(entry['scans'])}")
+        return "\n".join(lines)
+
+    def prometheus(self):
+        """Статистика в текстовом формате Prometheus."""
+        def label(text):
+            return text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        stats = self.stats()
+        lines = ["# HELP kkurs_query_duration_seconds Время выполнения SQL-запроса.",
+                 "# TYPE kkurs_query_duration_seconds histogram"]
+        for entry in stats:
+            query = label(entry["sql"])
+            total = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), entry["buckets"]):
+                total += count
+                lines.append(f'kkurs_query_duration_seconds_bucket{{query="{query}",le="{bound}"}} {total}')
+            lines.append(f'kkurs_query_duration_seconds_sum{{query="{query}"}} {entry["seconds"]!r}')
+            lines.append(f'kkurs_query_duration_seconds_count{{query="{query}"}} {entry["count"]}')
+        for name, field, help_ in (("kkurs_query_rows_total", "rows", "Строк прочитано или изменено запросом."),
+                                   ("kkurs_query_errors_total", "errors", "Выполнений запроса с ошибкой.")):
+            lines += [f"# HELP {name} {help_}", f"# TYPE {name} counter"]
+            lines += [f'{name}{{query="{label(entry["sql"])}"}} {entry[field]}' for entry in stats]
+        lines += ["# HELP kkurs_query_full_scan Запрос читает таблицы целиком (по EXPLAIN QUERY PLAN).",
+                  "# TYPE kkurs_query_full_scan gauge"]
+        lines += [f'kkurs_query_full_scan{{query="{label(entry["sql"])}",tables="{label(",".join(entry["scans"]))}"}} 1'
+                  for entry in stats if entry["scans"]]
+        lines += ["# HELP kkurs_slow_queries_total Запросов дольше порога журнала медленных.",
+                  "# TYPE kkurs_slow_queries_total counter",
+                  f"kkurs_slow_queries_total {self.slow_total}"]
+        return "\n".join(lines) + "\n"
+
+query_stats = QueryStats()
+
+# --- Вспомогательные функции ---
 
 def is_leap_year(year):
     """Проверяет, является ли год високосным."""
     return (year % 4 == 0 and year % 100 != 0) or (year % 400 == 0)
 
-def validate_date(date_str):
-    """Проверяет формат даты ГГГГ-ММ-ДД, год ≤ 2025, месяц ≤ 12, день ≤ 31 с учётом високосного года."""
-    if not date_str:
-        return None
+# Коды ошибок проверки значений; 0 - значение правильное
+VALID = 0
+ERROR_FORMAT = 1
+ERROR_DIGITS = 2
+ERROR_YEAR = 3
+ERROR_MONTH = 4
+ERROR_DAY = 5
+ERROR_NUMBER = 6
+ERROR_EMPTY = 7
+ERROR_MESSAGES = {
+    ERROR_FORMAT: "дата должна быть ГГГГ-ММ-ДД (например, 2023-05-15).",
+    ERROR_DIGITS: "некорректная дата (используйте цифры).",
+    ERROR_YEAR: "год не может быть больше 2025.",
+    ERROR_MONTH: "месяц должен быть от 1 до 12.",
+    ERROR_DAY: "день вне диапазона для этого месяца.",
+    ERROR_NUMBER: "значение должно быть числом (например, 55.7558).",
+    ERROR_EMPTY: "значение не заполнено.",
+}
+
+def days_in_month(year, month):
+    """Число дней в месяце с учётом високосного года."""
+    return [31, 29 if is_leap_year(year) else 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31][month - 1]
+
+def date_code(date_str):
+    """Проверяет формат даты ГГГГ-ММ-ДД, год ≤ 2025, месяц ≤ 12, день ≤ 31 с учётом високосного года.
+
+    Возвращает код ошибки (ERROR_*) или VALID. Ничего не печатает.
+    """
     # Проверка формата ГГГГ-ММ-ДД
     parts = date_str.split('-')
     if len(parts) != 3 or len(parts[0]) != 4 or len(parts[1]) != 2 or len(parts[2]) != 2:
-        print("Ошибка: дата должна быть ГГГГ-ММ-ДД (например, 2023-05-15).")
-        return None
+        return ERROR_FORMAT
     try:
         year = int(parts[0])
         month = int(parts[1])
         day = int(parts[2])
-        if year > 2025:
-            print("Ошибка: год не может быть больше 2025.")
-            return None
-        if month < 1 or month > 12:
-            print("Ошибка: месяц должен быть от 1 до 12.")
-            return None
-        # Проверка количества дней в месяце
-        days_in_month = [31, 29 if is_leap_year(year) else 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
-        if day < 1 or day > days_in_month[month - 1]:
-            print(f"Ошибка: день должен быть от 1 до {days_in_month[month - 1]} для {month}-го месяца {year} года.")
-            return None
-        return date_str
     except ValueError:
-        print("Ошибка: некорректная дата (используйте цифры).")
+        return ERROR_DIGITS
+    if year > 2025:
+        return ERROR_YEAR
+    if month < 1 or month > 12:
+        return ERROR_MONTH
+    # Проверка количества дней в месяце
+    if day < 1 or day > days_in_month(year, month):
+        return ERROR_DAY
+    return VALID
+
+def date_error(date_str):
+    """Проверяет дату (см. date_code); возвращает текст ошибки или None, если дата правильная. Ничего не печатает."""
+    code = date_code(date_str)
+    if code == ERROR_DAY:
+        year, month, _ = map(int, date_str.split('-'))
+        return f"день должен быть от 1 до {days_in_month(year, month)} для {month}-го месяца {year} года."
+    return ERROR_MESSAGES.get(code)
+
+def validate_date(date_str):
+    """Проверяет дату (см. date_error) и печатает ошибку; возвращает дату или None."""
+    if not date_str:
+        return None
+    error = date_error(date_str)
+    if error:
+        print(f"Ошибка: {error}")
         return None
+    return date_str
 
 def validate_float(value, field):
     """Проверяет, является ли значение числом."""
@@ -49,38 +412,1393 @@ def validate_float(value, field):
         print(f"Ошибка: {field} должно быть числом (например, 55.7558).")
         return None
 
+# --- Проверка столбцов ---
+# Пакетные версии date_code и validate_float для целых столбцов (импорт, массовые правки): возвращают
+# маску правильных значений и коды ошибок, ничего не печатают. Правила те же, что при ручном вводе.
+
+def column_values(values):
+    """Столбец как последовательность Python-значений (список, кортеж, массив NumPy или Arrow)."""
+    if hasattr(values, "to_pylist"):
+        return values.to_pylist()
+    if not hasattr(values, "__len__"):
+        return list(values)
+    return values
+
+def validate_dates(values, allow_empty=True):
+    """Проверяет столбец дат; возвращает (маска правильных, коды ошибок ERROR_*).
+
+    Каждое различное значение проверяется date_code один раз (в столбцах дат значения повторяются),
+    а раскладка результатов по строкам и маска строятся через map без цикла на Python.
+    Пустые значения (None и "") правильны, если allow_empty, иначе получают ERROR_EMPTY.
+    """
+    values = column_values(values)
+    empty = VALID if allow_empty else ERROR_EMPTY
+    codes_by_value = {}
+    for value in set(values):
+        if value is None or value == "":
+            codes_by_value[value] = empty
+        elif isinstance(value, str):
+            codes_by_value[value] = date_code(value)
+        else:
+            codes_by_value[value] = ERROR_FORMAT
+    codes = list(map(codes_by_value.__getitem__, values))
+    return list(map(operator.not_, codes)), codes
+
+def float_code(value, allow_empty=True):
+    """Код ошибки для одного числа: как validate_float, но без печати."""
+    if value is None or value == "":
+        return VALID if allow_empty else ERROR_EMPTY
+    try:
+        float(value)
+    except (TypeError, ValueError):
+        return ERROR_NUMBER
+    return VALID
+
+def validate_floats(values, allow_empty=True):
+    """Проверяет столбец чисел (широта, долгота); возвращает (маска правильных, коды ошибок ERROR_*).
+
+    Сначала весь столбец переводится в float через map без цикла на Python и без хранения результата.
+    Если где-то ошибка, значения проверяются по одному.
+    """
+    values = column_values(values)
+    try:
+        deque(map(float, values), maxlen=0)
+        return [True] * len(values), [VALID] * len(values)
+    except (TypeError, ValueError):
+        pass
+    empty = VALID if allow_empty else ERROR_EMPTY
+    codes = []
+    append = codes.append
+    for value in values:
+        try:
+            float(value)
+            append(VALID)
+        except ValueError:
+            append(empty if value == "" else ERROR_NUMBER)
+        except TypeError:
+            append(empty if value is None else ERROR_NUMBER)
+    return list(map(operator.not_, codes)), codes
+
+# --- Миграции схемы ---
+
+# Таблица -> столбцы, которые зеркалируются в полнотекстовый индекс <Таблица>_fts (первый - заголовок)
+FTS_TABLES = {
+    "Sources": ("title", "content"),
+    "Persons": ("surname", "biography"),
+    "Events": ("name", "description"),
+    "Tex": ("name", "content"),
+}
+
+def fts_migration(table, columns):
+    """SQL для FTS5-индекса над столбцами таблицы и триггеров, которые держат его в актуальном состоянии."""
+    fts = f"{table}_fts"
+    cols = ", ".join(columns)
+    new = ", ".join(f"new.{c}" for c in columns)
+    old = ", ".join(f"old.{c}" for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({cols}, content='{table}', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='3 5')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN "
+        f"INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new}); END",
+        f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')",
+    ]
+
+# Таблица со ссылкой resource_id на Sources -> столбец счётчика в SourceUsage
+SOURCE_REFERENCES = {
+    "Events": "events",
+    "Tex": "texts",
+    "Places": "places",
+    "PeopleInteractions": "interactions",
+}
+
+def usage_migration(table, column):
+    """SQL триггеров, которые меняют счётчик column в SourceUsage при записи в таблицу table.
+
+    Счётчик относится к id источника, а не к строке Sources: ссылки на уже удалённый источник тоже считаются.
+    """
+    add = (f"INSERT INTO SourceUsage (source_id, {column}, total) SELECT new.resource_id, 1, 1 "
+           f"WHERE new.resource_id IS NOT NULL "
+           f"ON CONFLICT (source_id) DO UPDATE SET {column} = {column} + 1, total = total + 1;")
+    remove = f"UPDATE SourceUsage SET {column} = {column} - 1, total = total - 1 WHERE source_id = old.resource_id;"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_usage_ai AFTER INSERT ON {table} BEGIN {add} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_usage_ad AFTER DELETE ON {table} BEGIN {remove} END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_usage_au AFTER UPDATE OF resource_id ON {table} "
+        f"WHEN old.resource_id IS NOT new.resource_id BEGIN {remove} {add} END",
+    ]
+
+def source_usage_rebuild():
+    """SQL, который пересчитывает SourceUsage заново по таблицам из SOURCE_REFERENCES."""
+    statements = ["DELETE FROM SourceUsage"]
+    for table, column in SOURCE_REFERENCES.items():
+        statements.append(
+            f"INSERT INTO SourceUsage (source_id, {column}, total) SELECT resource_id, COUNT(*), COUNT(*) FROM {table} "
+            f"WHERE resource_id IS NOT NULL GROUP BY resource_id "
+            f"ON CONFLICT (source_id) DO UPDATE SET {column} = excluded.{column}, total = total + excluded.total")
+    return statements
+
+# Таблицы, изменения которых пишутся в ChangeLog; номер таблицы в журнале - позиция в кортеже, поэтому
+# новые таблицы добавляются только в конец
+CHANGELOG_TABLES = ("Sources", "Coordinates", "Persons", "Events", "Tex", "Places", "PeopleInteractions")
+
+def changelog_migration(table):
+    """SQL триггеров, которые пишут в ChangeLog id каждой добавленной, изменённой или удалённой строки таблицы.
+
+    В журнал попадает только (номер таблицы, id): значения строки читающий журнал берёт из самой таблицы.
+    """
+    code = CHANGELOG_TABLES.index(table)
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_changelog_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO ChangeLog (tbl, row_id) VALUES ({code}, new.id); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_changelog_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO ChangeLog (tbl, row_id) VALUES ({code}, old.id); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_changelog_au AFTER UPDATE ON {table} BEGIN "
+        f"INSERT INTO ChangeLog (tbl, row_id) VALUES ({code}, new.id); "
+        f"INSERT INTO ChangeLog (tbl, row_id) SELECT {code}, old.id WHERE old.id IS NOT new.id; END",
+    ]
+
+# Уникальные индексы миграции 1: имя -> (таблица, выражения ключа). SQLite считает NULL-значения разными,
+# поэтому необязательные части составных ключей берутся через ifnull - иначе источник без имени автора
+# или персона без отчества могли бы повторяться сколько угодно раз
+UNIQUE_INDEXES = {
+    "idx_sources_title_name": ("Sources", ("title", "ifnull(name, '')")),
+    "idx_coordinates_name": ("Coordinates", ("name",)),
+    "idx_coordinates_lat_lon": ("Coordinates", ("latitude", "longitude")),
+    "idx_persons_full_name": ("Persons", ("surname", "ifnull(name, '')", "ifnull(patronymic, '')")),
+    "idx_events_name": ("Events", ("name",)),
+    "idx_tex_name": ("Tex", ("name",)),
+    "idx_places_name": ("Places", ("name",)),
+}
+
+def unique_index_sql(index):
+    table, key = UNIQUE_INDEXES[index]
+    return f"CREATE UNIQUE INDEX IF NOT EXISTS {index} ON {table} ({', '.join(key)})"
+
+# Каждая миграция - список SQL-команд. Номер применённой миграции хранится в PRAGMA user_version,
+# поэтому порядок элементов менять нельзя, новые миграции добавляются только в конец.
+MIGRATIONS = [
+    # 1: индексы для поиска по названиям и для соединений по внешним ключам,
+    # уникальность там, где функции *_add ожидают IntegrityError
+    [unique_index_sql(index) for index in UNIQUE_INDEXES] + [
+        "CREATE INDEX IF NOT EXISTS idx_events_resource_id ON Events (resource_id)",
+        "CREATE INDEX IF NOT EXISTS idx_tex_resource_id ON Tex (resource_id)",
+        "CREATE INDEX IF NOT EXISTS idx_places_resource_id ON Places (resource_id)",
+        "CREATE INDEX IF NOT EXISTS idx_places_coordinate_id ON Places (coordinate_id)",
+        "CREATE INDEX IF NOT EXISTS idx_interactions_description ON PeopleInteractions (description)",
+        "CREATE INDEX IF NOT EXISTS idx_interactions_resource_id ON PeopleInteractions (resource_id)",
+        "CREATE INDEX IF NOT EXISTS idx_interactions_person_id ON PeopleInteractions (person_id)",
+    ],
+    # 2: индексы по столбцам сортировки *_list_all для постраничного вывода по (ключ, id)
+    [
+        "CREATE INDEX IF NOT EXISTS idx_sources_title ON Sources (title)",
+        "CREATE INDEX IF NOT EXISTS idx_coordinates_latitude ON Coordinates (latitude)",
+        "CREATE INDEX IF NOT EXISTS idx_persons_surname ON Persons (surname)",
+        "CREATE INDEX IF NOT EXISTS idx_events_data ON Events (data)",
+        "CREATE INDEX IF NOT EXISTS idx_tex_data ON Tex (data)",
+    ],
+    # 3: полнотекстовый поиск по большим текстовым столбцам
+    [sql for table, columns in FTS_TABLES.items() for sql in fts_migration(table, columns)],
+    # 4: пространственный индекс R*Tree по координатам (точка - прямоугольник нулевого размера)
+    [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS Coordinates_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)",
+        "CREATE TRIGGER IF NOT EXISTS Coordinates_rtree_ai AFTER INSERT ON Coordinates "
+        "WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN "
+        "INSERT INTO Coordinates_rtree VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude); END",
+        "CREATE TRIGGER IF NOT EXISTS Coordinates_rtree_ad AFTER DELETE ON Coordinates BEGIN "
+        "DELETE FROM Coordinates_rtree WHERE id = old.id; END",
+        "CREATE TRIGGER IF NOT EXISTS Coordinates_rtree_au AFTER UPDATE OF id, latitude, longitude ON Coordinates BEGIN "
+        "DELETE FROM Coordinates_rtree WHERE id = old.id; "
+        "INSERT INTO Coordinates_rtree SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude "
+        "WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL; END",
+        "INSERT INTO Coordinates_rtree SELECT id, latitude, latitude, longitude, longitude FROM Coordinates "
+        "WHERE latitude IS NOT NULL AND longitude IS NOT NULL",
+    ],
+    # 5: счётчики ссылок на источники, которые ведут триггеры таблиц со столбцом resource_id
+    [
+        "CREATE TABLE IF NOT EXISTS SourceUsage (source_id INTEGER PRIMARY KEY, "
+        + ", ".join(f"{column} INTEGER NOT NULL DEFAULT 0" for column in SOURCE_REFERENCES.values())
+        + ", total INTEGER NOT NULL DEFAULT 0)",
+        "CREATE INDEX IF NOT EXISTS idx_source_usage_total ON SourceUsage (total)",
+    ] + [sql for table, column in SOURCE_REFERENCES.items() for sql in usage_migration(table, column)]
+    + source_usage_rebuild(),
+    # 6: журнал изменений для реплик (sync.py); ChangeLogReaders - докуда дочитали реплики,
+    # ChangeLogState - граница сжатия. Без AUTOINCREMENT (он втрое дороже на вставку): seq не повторяется,
+    # потому что сжатие никогда не удаляет последнюю запись журнала
+    [
+        "CREATE TABLE IF NOT EXISTS ChangeLog (seq INTEGER PRIMARY KEY, tbl INTEGER NOT NULL, row_id INTEGER NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS ChangeLogReaders (name TEXT PRIMARY KEY, seq INTEGER NOT NULL, updated TEXT)",
+        "CREATE TABLE IF NOT EXISTS ChangeLogState (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    ] + [sql for table in CHANGELOG_TABLES for sql in changelog_migration(table)],
+]
+
+# Какие уникальные индексы создаёт миграция: перед ней базу проверяют на повторяющиеся строки
+MIGRATION_UNIQUE = {1: list(UNIQUE_INDEXES)}
+DUPLICATE_SAMPLE = 5  # Сколько групп повторяющихся строк показывать в ошибке миграции
+
+def schema_version(conn):
+    """Возвращает номер последней применённой миграции."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def duplicate_rows(conn, index, limit=DUPLICATE_SAMPLE):
+    """Строки, которые не дают создать уникальный индекс index: список групп id (каждая по возрастанию).
+
+    Строки с NULL в части ключа не повторяются (SQLite считает NULL разными), поэтому не учитываются.
+    limit - сколько групп вернуть (None - все).
+    """
+    table, key = UNIQUE_INDEXES[index]
+    groups = conn.execute(
+        f"SELECT group_concat(id) FROM {table} WHERE {' AND '.join(f'{part} IS NOT NULL' for part in key)} "
+        f"GROUP BY {', '.join(key)} HAVING count(*) > 1 LIMIT ?", (-1 if limit is None else limit,)).fetchall()
+    return [sorted(int(row_id) for row_id in ids.split(",")) for ids, in groups]
+
+def check_unique(conn, number):
+    """Перед миграцией number: если в базе есть строки, которые не дадут создать её уникальные индексы,
+    - sqlite3.IntegrityError со списком этих строк (исправить: python integrity.py dedupe)."""
+    problems = []
+    for index in MIGRATION_UNIQUE.get(number, ()):
+        groups = duplicate_rows(conn, index)
+        if groups:
+            table, key = UNIQUE_INDEXES[index]
+            problems.append(f"{table} ({', '.join(key)}): "
+                            + "; ".join("id " + ", ".join(map(str, ids)) for ids in groups))
+    if problems:
+        raise sqlite3.IntegrityError("повторяются строки " + " | ".join(problems)
+                                     + ". Объедините их: python integrity.py dedupe")
+
+def migrate(conn):
+    """Применяет недостающие миграции, каждую в отдельной транзакции."""
+    version = schema_version(conn)
+    for number, statements in enumerate(MIGRATIONS[version:], version + 1):
+        try:
+            conn.execute("BEGIN")
+            check_unique(conn, number)
+            for sql in statements:
+                conn.execute(sql)
+            conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            raise sqlite3.DatabaseError(f"Миграция {number} не применена: {e}") from e
+
+# --- Постраничный вывод ---
+
+PAGE_SIZE = int(os.environ.get("KKURS_PAGE_SIZE", "50"))  # Строк на странице, 0 - выводить всё без остановок
+FETCH_BATCH = 1000  # Сколько строк забирать из курсора за раз в потоковом режиме
+
+def iter_rows(cursor, batch_size=FETCH_BATCH):
+    """Перебирает строки курсора пачками через fetchmany, не загружая всю выборку в память."""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+def keyset_page(conn, columns, source, key, id_column, limit, after=None):
+    """Возвращает до limit строк, идущих в порядке (key, id_column) после позиции after.
+
+    after - пара (ключ, id) последней уже показанной строки или None для первой страницы.
+    Страница ищется по ключу (keyset), а не через OFFSET, поэтому стоит O(limit) на любой
+    глубине. В каждой строке два последних столбца - key и id_column.
+    """
+    base = f"SELECT {columns}, {key}, {id_column} FROM {source}"
+    rows = []
+    # SQLite ставит NULL первыми, поэтому сначала идут строки без ключа (по id), затем остальные
+    if after is None or after[0] is None:
+        if after is None:
+            rows = conn.execute(f"{base} WHERE {key} IS NULL ORDER BY {id_column} LIMIT ?", (limit,)).fetchall()
+        else:
+            rows = conn.execute(f"{base} WHERE {key} IS NULL AND {id_column} > ? ORDER BY {id_column} LIMIT ?",
+                                (after[1], limit)).fetchall()
+        if len(rows) < limit:
+            rows += conn.execute(f"{base} WHERE {key} IS NOT NULL ORDER BY {key}, {id_column} LIMIT ?",
+                                 (limit - len(rows),)).fetchall()
+    else:
+        rows = conn.execute(f"{base} WHERE ({key}, {id_column}) > (?, ?) ORDER BY {key}, {id_column} LIMIT ?",
+                            (after[0], after[1], limit)).fetchall()
+    return rows
+
+def iter_keyset(conn, columns, source, key, id_column, batch_size):
+    """Перебирает выборку в порядке (key, id_column), забирая по batch_size строк за запрос (см. keyset_page)."""
+    after = None
+    while True:
+        rows = keyset_page(conn, columns, source, key, id_column, batch_size, after)
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        after = tuple(rows[-1][-2:])
+
+# Представление -> (столбцы, источник строк, ключ сортировки, id) для *_list_all; используется и при экспорте
+LIST_VIEWS = {
+    "sources": ("title, type, link, content, name", "Sources", "title", "id"),
+    "coordinates": ("latitude, longitude, name", "Coordinates", "latitude", "id"),
+    "persons": ("surname, name, patronymic, date_of_birth, biography", "Persons", "surname", "id"),
+    "events": ("Events.name, Events.data, Events.description, Sources.title AS source",
+               "Events LEFT JOIN Sources ON Events.resource_id = Sources.id", "Events.data", "Events.id"),
+    "texts": ("Tex.name, Tex.data, Tex.content, Sources.title AS source",
+              "Tex LEFT JOIN Sources ON Tex.resource_id = Sources.id", "Tex.data", "Tex.id"),
+    "places": ("Places.name, Coordinates.latitude, Coordinates.longitude, Sources.title AS source",
+               "Places LEFT JOIN Coordinates ON Places.coordinate_id = Coordinates.id LEFT JOIN Sources ON Places.resource_id = Sources.id",
+               "Places.name", "Places.id"),
+    "interactions": ("PeopleInteractions.description, Persons.surname AS person, Sources.title AS source",
+                     "PeopleInteractions LEFT JOIN Persons ON PeopleInteractions.person_id = Persons.id LEFT JOIN Sources ON PeopleInteractions.resource_id = Sources.id",
+                     "PeopleInteractions.description", "PeopleInteractions.id"),
+}
+
+def show_list(conn, view, empty_message, page_size=None):
+    """Выводит представление из LIST_VIEWS в порядке (ключ, id) по странице за раз (из снимка, если он свежий).
+
+    Строка выводится методом describe записи представления (RECORDS, view_record).
+    """
+    columns, source, key, id_column = LIST_VIEWS[view]
+    page_size = PAGE_SIZE if page_size is None else page_size
+    snap = open_snapshot(conn)
+    if snap is not None:
+        rows = snap.view_rows(view)
+    elif page_size <= 0:
+        cursor = conn.execute(f"SELECT {columns} FROM {source} ORDER BY {key}, {id_column}")
+        rows = iter_rows(cursor)
+    else:
+        rows = iter_keyset(conn, columns, source, key, id_column, page_size)
+    shown = 0
+    row = next(rows, None)
+    while row is not None:
+        print(view_record(view, row).describe())
+        shown += 1
+        row = next(rows, None)
+        if row is not None and page_size > 0 and shown % page_size == 0:
+            if input("Enter - следующая страница, 0 - хватит: ") == "0":
+                break
+    if not shown:
+        print(empty_message)
+
+# --- Кэш справочников ---
+
+REFERENCE_TABLES = ("Sources", "Coordinates", "Persons")
+CACHE_SIZE = int(os.environ.get("KKURS_CACHE_SIZE", "1024"))  # Сколько результатов держать в кэше, 0 - не кэшировать
+
+class ReferenceCache:
+    """LRU-кэш чтений справочников (Sources, Coordinates, Persons), общий для всех подключений процесса.
+
+    Кэшируются результаты find_matches и get_row. Записи через insert_row/update_row/delete_row сразу
+    сбрасывают свою таблицу. Остальные изменения замечаются при следующем чтении: чужой commit (другое
+    подключение или процесс) меняет PRAGMA data_version, а запись на этом же подключении - total_changes.
+    Работает только с подключениями KKursConnection (get_connection); внутри транзакции кэш не используется.
+    """
+
+    def __init__(self, max_size=CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()  # (база, таблица, запрос...) -> результат; в конце - недавно использованные
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def database(self, conn):
+        """Ключ базы подключения или None, если сейчас кэшировать нельзя; сбрасывает кэш, если база изменилась."""
+        if not self.max_size or not isinstance(conn, KKursConnection) or conn.in_transaction:
+            return None
+        database_path(conn)
+        seen = (conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+        if seen != conn.seen:
+            # Первое чтение на подключении тоже сбрасывает кэш: неизвестно, что менялось до него
+            self.invalidate(conn.database)
+            conn.seen = seen
+        return conn.database
+
+    def get(self, conn, key, load):
+        """Результат load() для ключа (таблица, ...), из кэша, если он там есть."""
+        database = self.database(conn)
+        if database is None:
+            return load()
+        key = (database,) + key
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+        value = load()
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def invalidate(self, database=None, table=None):
+        """Удаляет из кэша записи базы (или всех баз) и таблицы (или всех таблиц)."""
+        with self.lock:
+            self.invalidations += 1
+            if database is None and table is None:
+                self.entries.clear()
+                return
+            for key in [key for key in self.entries
+                        if (database is None or key[0] == database) and (table is None or key[1] == table)]:
+                del self.entries[key]
+
+    def stats(self):
+        """Счётчики кэша."""
+        with self.lock:
+            requests = self.hits + self.misses
+            return {"size": len(self.entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / requests if requests else 0.0, "evictions": self.evictions,
+                    "invalidations": self.invalidations}
+
+reference_cache = ReferenceCache()
+
+def database_path(conn):
+    """Полный путь к файлу базы подключения или None для базы в памяти (на KKursConnection запоминается)."""
+    path = getattr(conn, "database", None)
+    if path is None:
+        name = conn.execute("PRAGMA database_list").fetchone()[2]
+        path = os.path.realpath(name) if name else f":memory:{id(conn)}"
+        if isinstance(conn, KKursConnection):
+            conn.database = path
+    return None if path.startswith(":memory:") else path
+
+def invalidate_reference(conn, table):
+    """Сбрасывает кэш таблицы после записи в неё на подключении conn, а после записи в PeopleInteractions -
+    и граф персон подключения: свои изменения не меняют PRAGMA data_version, по которой его проверяет person_graph."""
+    if table in REFERENCE_TABLES:
+        reference_cache.invalidate(getattr(conn, "database", None), table)
+    if table == "PeopleInteractions" and isinstance(conn, KKursConnection):
+        conn.graph = None  # Граф перестроится при следующем запросе
+
+# --- Снимок для чтения ---
+
+USE_SNAPSHOT = os.environ.get("KKURS_SNAPSHOT", "1") != "0"  # 0 - всегда читать из SQLite
+
+def open_snapshot(conn):
+    """Снимок базы (snapshot.py), если он построен и не устарел, иначе None - тогда читаем из SQLite.
+
+    Внутри транзакции снимок не используется: в нём нет её незафиксированных изменений.
+    """
+    if not USE_SNAPSHOT or conn.in_transaction:
+        return None
+    path = database_path(conn)
+    if path is None or not os.path.exists(path + ".snap"):
+        return None
+    import snapshot  # Здесь, а не в начале файла: snapshot сам импортирует этот модуль
+    return snapshot.fresh(path)
+
+# --- Доступ к данным ---
+
+# Представление -> (таблица, столбцы, которые можно задавать при добавлении и обновлении)
+TABLES = {
+    "sources": ("Sources", ("title", "type", "link", "content", "name")),
+    "coordinates": ("Coordinates", ("latitude", "longitude", "name")),
+    "persons": ("Persons", ("surname", "name", "patronymic", "date_of_birth", "biography")),
+    "events": ("Events", ("name", "data", "description", "resource_id")),
+    "texts": ("Tex", ("name", "content", "data", "resource_id")),
+    "places": ("Places", ("name", "resource_id", "coordinate_id")),
+    "interactions": ("PeopleInteractions", ("description", "resource_id", "person_id")),
+}
+DATE_COLUMNS = ("date_of_birth", "data")
+FLOAT_COLUMNS = ("latitude", "longitude")
+
+# Функции этого раздела ничего не печатают и не вызывают commit: транзакцией управляет вызывающий код.
+
+def list_page(conn, view, limit=None, after=None):
+    """Страница представления из LIST_VIEWS; возвращает (строки, позиция для следующей страницы или None).
+
+    Строки - столбцы представления и id последним (см. list_columns).
+    """
+    limit = limit or PAGE_SIZE or 50
+    snap = open_snapshot(conn)
+    rows = snap.view_page(view, limit, after) if snap is not None else None
+    if rows is None:
+        rows = keyset_page(conn, *LIST_VIEWS[view], limit, after)
+    next_after = tuple(rows[-1][-2:]) if len(rows) == limit else None
+    return [row[:-2] + row[-1:] for row in rows], next_after
+
+def list_columns(view):
+    """Имена столбцов строк, которые возвращают list_page и get_row (псевдоним или имя без таблицы)."""
+    columns = LIST_VIEWS[view][0]
+    return [column.split(" AS ")[-1].split(".")[-1].strip() for column in columns.split(",")] + ["id"]
+
+def get_row(conn, view, row_id):
+    """Строка представления по id (столбцы как у list_page) или None; строки справочников берутся из кэша."""
+    columns, source, _, id_column = LIST_VIEWS[view]
+
+    def load():
+        return conn.execute(f"SELECT {columns}, {id_column} FROM {source} WHERE {id_column} = ?", (row_id,)).fetchone()
+
+    table, _ = TABLES[view]
+    if table in REFERENCE_TABLES:
+        return reference_cache.get(conn, (table, "row", row_id), load)
+    return load()
+
+def check_values(view, values):
+    """Проверяет столбцы и значения для добавления или обновления; возвращает текст ошибки или None."""
+    _, columns = TABLES[view]
+    for column, value in values.items():
+        if column not in columns:
+            return f"неизвестное поле {column}"
+        if value is None:
+            continue
+        if column in DATE_COLUMNS:
+            error = date_error(str(value))
+            if error:
+                return error
+        if column in FLOAT_COLUMNS and float_code(value):
+            return f"{column} должно быть числом (например, 55.7558)."
+    return None
+
+def insert_row(conn, view, values):
+    """Добавляет строку из словаря {столбец: значение}; возвращает её id."""
+    error = check_values(view, values)
+    if error:
+        raise ValueError(error)
+    table, _ = TABLES[view]
+    columns = list(values)
+    cursor = conn.execute(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                          [values[column] for column in columns])
+    invalidate_reference(conn, table)
+    return cursor.lastrowid
+
+def update_row(conn, view, row_id, values):
+    """Меняет у строки столбцы со значением не None (остальные не трогает); возвращает число найденных строк."""
+    error = check_values(view, values)
+    if error:
+        raise ValueError(error)
+    table, _ = TABLES[view]
+    values = {column: value for column, value in values.items() if value is not None}
+    if not values:
+        return len(conn.execute(f"SELECT 1 FROM {table} WHERE id = ?", (row_id,)).fetchall())
+    assignments = ", ".join(f"{column} = ?" for column in values)
+    cursor = conn.execute(f"UPDATE {table} SET {assignments} WHERE id = ?", list(values.values()) + [row_id])
+    invalidate_reference(conn, table)
+    return cursor.rowcount
+
+def delete_row(conn, view, row_id, report=None):
+    """Удаляет строку по id; возвращает число удалённых строк.
+
+    Ссылки на строку из других таблиц обрабатываются по режимам integrity_modes: при restrict строка, на
+    которую ссылаются, не удаляется (IntegrityError с перечнем ссылок), при cascade ссылающиеся строки
+    удаляются, при set-null ссылка в них очищается. Если передан словарь report, в него записывается,
+    что сделано со ссылками (см. apply_references).
+    """
+    table, _ = TABLES[view]
+    modes = integrity_modes()
+    usage = restricting_usage(conn, table, row_id, modes)
+    if usage:
+        raise sqlite3.IntegrityError(f"{RESTRICT_LABELS[table]} ({format_usage(usage)})")
+    done = apply_references(conn, table, "?", (row_id,), modes)
+    if report is not None:
+        report.update(done)
+    count = conn.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,)).rowcount
+    invalidate_reference(conn, table)
+    return count
+
+# --- Записи ---
+
+# Записи - строки таблиц с полями-атрибутами вместо row[0], row[3]. У классов __slots__ и нет __dict__,
+# поэтому запись занимает столько же, сколько кортеж той же длины, а не втрое больше. Кроме столбцов
+# таблицы, в записи есть поля, которые приходят из представлений LIST_VIEWS (source - название источника,
+# person - фамилия персоны, широта и долгота места): поле, которого нет в запросе, равно None.
+
+NOT_SET = "Не указано"
+
+class Record:
+    """Базовый класс записей: Record(*значения по порядку __slots__, **поля), остальные поля - None."""
+    __slots__ = ()
+
+    def __init__(self, *values, **fields):
+        for field, value in itertools.zip_longest(self.__slots__, values):
+            setattr(self, field, fields.pop(field, value))
+        if fields:
+            raise TypeError(f"у {type(self).__name__} нет полей {', '.join(fields)}")
+
+    def __iter__(self):
+        return (getattr(self, field) for field in self.__slots__)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and tuple(self) == tuple(other)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{field}={getattr(self, field)!r}' for field in self.__slots__)})"
+
+    def as_dict(self):
+        return dict(zip(self.__slots__, self))
+
+class Source(Record):
+    __slots__ = ("id", "title", "type", "link", "content", "name")
+
+    def describe(self):
+        return (f"Название: {self.title}, Тип: {self.type or NOT_SET}, Ссылка: {self.link or NOT_SET}, "
+                f"Содержание: {self.content or NOT_SET}, Имя: {self.name or NOT_SET}")
+
+class Coordinate(Record):
+    __slots__ = ("id", "latitude", "longitude", "name")
+
+    def describe(self):
+        return f"Широта: {self.latitude}, Долгота: {self.longitude}, Название: {self.name or NOT_SET}"
+
+class Person(Record):
+    __slots__ = ("id", "surname", "name", "patronymic", "date_of_birth", "biography")
+
+    def describe(self):
+        return (f"Фамилия: {self.surname}, Имя: {self.name or NOT_SET}, Отчество: {self.patronymic or NOT_SET}, "
+                f"Дата рождения: {self.date_of_birth or NOT_SET}, Биография: {self.biography or NOT_SET}")
+
+    def title(self):
+        """Фамилия и имя для вывода."""
+        return " ".join(filter(None, (self.surname, self.name)))
+
+class Event(Record):
+    __slots__ = ("id", "name", "data", "description", "resource_id", "source")
+
+    def describe(self):
+        return (f"Название: {self.name}, Дата: {self.data or NOT_SET}, Описание: {self.description or NOT_SET}, "
+                f"Источник: {self.source or 'Источник не найден'}")
+
+class Text(Record):
+    __slots__ = ("id", "name", "content", "data", "resource_id", "source")
+
+    def describe(self):
+        return (f"Название: {self.name}, Дата: {self.data or NOT_SET}, Содержание: {self.content or NOT_SET}, "
+                f"Источник: {self.source or 'Источник не найден'}")
+
+class Place(Record):
+    __slots__ = ("id", "name", "resource_id", "coordinate_id", "latitude", "longitude", "source")
+
+    def describe(self):
+        # Координат может не быть: ссылка очищена или повисла
+        coordinates = ("Координаты не найдены" if self.latitude is None and self.longitude is None
+                       else f"Широта: {self.latitude}, Долгота: {self.longitude}")
+        return f"Название: {self.name}, {coordinates}, Источник: {self.source or 'Источник не найден'}"
+
+class Interaction(Record):
+    __slots__ = ("id", "description", "resource_id", "person_id", "person", "source")
+
+    def describe(self):
+        return (f"Описание: {self.description or NOT_SET}, Персона: {self.person or 'Персона не найдена'}, "
+                f"Источник: {self.source or 'Источник не найден'}")
+
+# Представление (ключ TABLES и LIST_VIEWS) -> класс записи
+RECORDS = {
+    "sources": Source,
+    "coordinates": Coordinate,
+    "persons": Person,
+    "events": Event,
+    "texts": Text,
+    "places": Place,
+    "interactions": Interaction,
+}
+
+# Представление -> имена его столбцов без id (list_columns)
+VIEW_FIELDS = {view: list_columns(view)[:-1] for view in LIST_VIEWS}
+
+def view_record(view, row):
+    """Строка представления (list_page, get_row, show_list) -> запись RECORDS[view]; id - последний столбец,
+    если он есть после столбцов представления."""
+    names = VIEW_FIELDS[view]
+    if len(row) > len(names):
+        return record_builder(RECORDS[view], names + ["id"])(None, row[:len(names)] + row[-1:])
+    return record_builder(RECORDS[view], names)(None, row)
+
+_builders = {}  # (класс записи, имена столбцов) -> функция сборки
+
+def record_builder(cls, names):
+    """Функция build(cursor, row), которая делает запись cls из строки со столбцами names; поля, которых нет
+    в names, - None.
+
+    Функция генерируется один раз на раскладку столбцов, как namedtuple генерирует __new__: прямые
+    присваивания r.поле = row[i] в Python 3.11 специализируются под __slots__ и втрое быстрее setattr в цикле.
+    """
+    key = (cls, tuple(names))
+    build = _builders.get(key)
+    if build is None:
+        unknown = [name for name in names if name not in cls.__slots__]
+        if unknown:
+            raise ValueError(f"у {cls.__name__} нет полей {', '.join(map(str, unknown))}")
+        lines = [f"    r.{name} = row[{i}]" for i, name in enumerate(names)]
+        lines += [f"    r.{field} = None" for field in cls.__slots__ if field not in names]
+        namespace = {"new": object.__new__, "cls": cls}
+        exec("def build(cursor, row):\n    r = new(cls)\n" + "\n".join(lines) + "\n    return r", namespace)
+        build = _builders[key] = namespace["build"]
+    return build
+
+def record_factory(cls):
+    """row_factory, которая делает из строк записи cls по именам столбцов запроса (cursor.description).
+
+    Ставится на курсор, а не на всё подключение: остальные функции этого файла ждут кортежи.
+    Раскладка столбцов (record_builder) находится один раз на запрос, а не на строку.
+    """
+    layout = [None, None]  # description, функция сборки
+
+    def factory(cursor, row):
+        description = cursor.description
+        if layout[0] is not description:
+            layout[:] = [description, record_builder(cls, [column[0] for column in description])]
+        return layout[1](cursor, row)
+
+    return factory
+
+def fetch_records(conn, cls, sql, parameters=()):
+    """Выполняет запрос и возвращает курсор, который выдаёт записи cls (см. record_factory)."""
+    cursor = conn.cursor()
+    cursor.row_factory = record_factory(cls)
+    return cursor.execute(sql, parameters)
+
+class RecordBatch:
+    """Много строк одного класса записей по столбцам: список или array на поле вместо объекта на строку.
+
+    Целые и дробные столбцы без NULL хранятся в array (8 байт на значение), повторяющиеся строки -
+    одним объектом на значение. Индекс и перебор выдают записи, column(поле) - весь столбец.
+    """
+
+    def __init__(self, cls, columns, length):
+        self.cls = cls
+        self.columns = columns  # поле -> list или array; полей, которых не было в запросе, здесь нет
+        self.length = length
+
+    @classmethod
+    def from_cursor(cls, record_cls, cursor, batch_size=FETCH_BATCH):
+        """Читает все строки курсора (с обычной row_factory) в столбцы record_cls по именам столбцов запроса."""
+        names = [column[0] for column in cursor.description]
+        record_builder(record_cls, names)  # Проверяет имена столбцов
+        columns = [[] for _ in names]
+        length = 0
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            length += len(rows)
+            for column, values in zip(columns, zip(*rows)):
+                column.extend(values)
+        return cls(record_cls, {name: compact_column(column) for name, column in zip(names, columns)}, length)
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if not -self.length <= index < self.length:
+            raise IndexError("номер строки вне пакета")
+        return record_builder(self.cls, list(self.columns))(None, [column[index] for column in self.columns.values()])
+
+    def __iter__(self):
+        build = record_builder(self.cls, list(self.columns))
+        for values in zip(*self.columns.values()):
+            yield build(None, values)
+
+    def column(self, name):
+        """Значения поля по строкам (список или array); поле, которого не было в запросе, - None на каждую строку."""
+        if name not in self.cls.__slots__:
+            raise KeyError(name)
+        return self.columns.get(name, [None] * self.length)
+
+def compact_column(values):
+    """Столбец в компактном виде: array('q') или array('d'), если все значения целые или дробные,
+    иначе список, в котором одинаковые строки - один объект."""
+    kinds = set(map(type, values))
+    if kinds == {int}:
+        return array("q", values)
+    if kinds == {float}:
+        return array("d", values)
+    if str in kinds or bytes in kinds:
+        unique = {}
+        return list(map(unique.setdefault, values, values))  # Значения из SQLite все хешируемые
+    return values
+
+# --- Использование источников ---
+
+CITED_LIMIT = 20  # Сколько источников показывать в отчёте о самых цитируемых
+USAGE_LABELS = {"events": "события", "texts": "тексты", "places": "места", "interactions": "взаимодействия"}
+
+# Счётчики SourceUsage ведут триггеры (миграция 5), поэтому проверка одного источника - поиск по
+# первичному ключу, а отчёт - чтение начала индекса по total, без соединений с большими таблицами.
+
+def source_usage(conn, source_id):
+    """Сколько строк ссылаются на источник: словарь {столбец SourceUsage: число} без нулевых значений."""
+    columns = list(SOURCE_REFERENCES.values())
+    row = conn.execute(f"SELECT {', '.join(columns)} FROM SourceUsage WHERE source_id = ?", (source_id,)).fetchone()
+    return {column: count for column, count in zip(columns, row or ()) if count}
+
+def format_usage(usage):
+    """Словарь source_usage -> строка вида "события: 3, места: 1"."""
+    return ", ".join(f"{USAGE_LABELS[column]}: {count}" for column, count in usage.items())
+
+def most_cited_sources(conn, limit=CITED_LIMIT):
+    """Источники с наибольшим числом ссылок: строки (id, title, name, total, события, тексты, места, взаимодействия)."""
+    columns = ", ".join(f"SourceUsage.{column}" for column in SOURCE_REFERENCES.values())
+    return conn.execute(
+        f"SELECT Sources.id, Sources.title, Sources.name, SourceUsage.total, {columns} FROM SourceUsage "
+        "JOIN Sources ON Sources.id = SourceUsage.source_id WHERE SourceUsage.total > 0 "
+        "ORDER BY SourceUsage.total DESC LIMIT ?", (limit,)).fetchall()
+
+def rebuild_source_usage(conn):
+    """Пересчитывает счётчики SourceUsage по самим таблицам (если их меняли в обход триггеров)."""
+    for sql in source_usage_rebuild():
+        conn.execute(sql)
+
+# --- Ссылочная целостность ---
+
+# Связи (таблица, столбец, таблица, на которую он ссылается) - внешние ключи из soshina_2.sql
+REFERENCES = (
+    ("Events", "resource_id", "Sources"),
+    ("Tex", "resource_id", "Sources"),
+    ("Places", "resource_id", "Sources"),
+    ("Places", "coordinate_id", "Coordinates"),
+    ("PeopleInteractions", "resource_id", "Sources"),
+    ("PeopleInteractions", "person_id", "Persons"),
+)
+INTEGRITY_ACTIONS = ("restrict", "cascade", "set-null")
+# Что делать при удалении строки, на которую ссылаются: "Таблица.столбец=режим" через запятую, "*" - все связи
+# (применяются по порядку); по умолчанию restrict. Например: KKURS_INTEGRITY="*=set-null,PeopleInteractions.person_id=cascade"
+INTEGRITY = os.environ.get("KKURS_INTEGRITY", "")
+RESTRICT_LABELS = {"Sources": "источник используется", "Coordinates": "координаты используются",
+                   "Persons": "персона используется"}
+
+# Режимы выполняются здесь, а не в объявлении FOREIGN KEY: ON DELETE в SQLite не поменять без пересоздания
+# таблиц, и так они действуют и с выключенной PRAGMA foreign_keys (профиль default). Каждая проверка и
+# каждое изменение - один запрос по индексу на столбце ссылки (миграция 1), для ссылок на источники
+# restrict проверяется по счётчикам SourceUsage.
+
+def integrity_modes(text=None):
+    """Режимы связей: {(таблица, столбец): режим} для всех REFERENCES из строки вида KKURS_INTEGRITY."""
+    modes = {(table, column): "restrict" for table, column, _ in REFERENCES}
+    for name, mode in parse_pragmas(INTEGRITY if text is None else text).items():
+        if mode not in INTEGRITY_ACTIONS:
+            raise ValueError(f"Неизвестный режим {mode} для {name}: нужен один из {', '.join(INTEGRITY_ACTIONS)}")
+        keys = list(modes) if name == "*" else [tuple(name.split(".", 1))]
+        for key in keys:
+            if key not in modes:
+                raise ValueError(f"Нет такой связи: {name} (нужно Таблица.столбец, например Places.coordinate_id)")
+            modes[key] = mode
+    return modes
+
+def references_to(table):
+    """Связи, которые ссылаются на table: [(таблица, столбец)]."""
+    return [(child, column) for child, column, parent in REFERENCES if parent == table]
+
+def restricting_usage(conn, table, row_id, modes):
+    """Ссылки на строку по связям с режимом restrict: {столбец SourceUsage: число} (как у source_usage)."""
+    restricted = [child for child, column in references_to(table) if modes[(child, column)] == "restrict"]
+    if table == "Sources":
+        usage = source_usage(conn, row_id)
+        return {column: usage[column] for column in map(SOURCE_REFERENCES.get, restricted) if column in usage}
+    usage = {}
+    for child, column in references_to(table):
+        if child in restricted:
+            count = conn.execute(f"SELECT count(*) FROM {child} WHERE {column} = ?", (row_id,)).fetchone()[0]
+            if count:
+                usage[SOURCE_REFERENCES[child]] = count
+    return usage
+
+def restricting_ids(table, modes):
+    """SQL, выбирающий id строк table, которые нельзя удалить из-за связей restrict, или None, если таких связей нет."""
+    restricted = [(child, column) for child, column in references_to(table) if modes[(child, column)] == "restrict"]
+    if not restricted:
+        return None
+    if table == "Sources":
+        counters = " OR ".join(f"{SOURCE_REFERENCES[child]} > 0" for child, _ in restricted)
+        return f"SELECT source_id FROM SourceUsage WHERE {counters}"
+    return " UNION ".join(f"SELECT {column} FROM {child}" for child, column in restricted)
+
+def apply_references(conn, table, ids_sql, params, modes):
+    """Выполняет cascade и set-null для строк table с id из ids_sql ("?" или подзапрос) до их удаления.
+
+    Возвращает {(таблица, столбец): (режим, число затронутых строк)} для связей, где что-то изменилось.
+    """
+    done = {}
+    for child, column in references_to(table):
+        mode = modes[(child, column)]
+        if mode == "cascade":
+            count = conn.execute(f"DELETE FROM {child} WHERE {column} IN ({ids_sql})", params).rowcount
+        elif mode == "set-null":
+            count = conn.execute(f"UPDATE {child} SET {column} = NULL WHERE {column} IN ({ids_sql})", params).rowcount
+        else:
+            continue
+        if count:
+            done[(child, column)] = (mode, count)
+            invalidate_reference(conn, child)
+    return done
+
+def format_references(done):
+    """Словарь apply_references -> строка вида "места: удалено 3, взаимодействия: ссылка очищена у 2"."""
+    return ", ".join(f"{USAGE_LABELS[SOURCE_REFERENCES[child]]}: "
+                     f"{'удалено' if mode == 'cascade' else 'ссылка очищена у'} {count}"
+                     for (child, _), (mode, count) in done.items())
+
+# --- Выбор строки поиском ---
+
+PICK_LIMIT = 20  # Сколько совпадений показывать за раз
+
+# Таблица -> (столбец поиска, выражение для показа, что вводить)
+PICKERS = {
+    "Sources": ("title", "title || COALESCE(' (' || name || ')', '')", "название источника"),
+    "Coordinates": ("name", "name", "название координат"),
+    "Persons": ("surname", "surname || COALESCE(' ' || name, '') || COALESCE(' ' || patronymic, '')", "фамилию"),
+    "Events": ("name", "name", "название события"),
+    "Tex": ("name", "name", "название текста"),
+    "Places": ("name", "name", "название места"),
+    "PeopleInteractions": ("description", "description", "описание взаимодействия"),
+}
+
+def find_matches(conn, table, text, limit=PICK_LIMIT):
+    """Возвращает до limit строк (id, показ, значение): сначала совпадения по началу, затем по подстроке.
+
+    Для справочников (REFERENCE_TABLES) результат берётся из кэша, если такой поиск уже был.
+    """
+    if table in REFERENCE_TABLES:
+        return list(reference_cache.get(conn, (table, "match", text, limit),
+                                        lambda: tuple(load_matches(conn, table, text, limit))))
+    return load_matches(conn, table, text, limit)
+
+def load_matches(conn, table, text, limit):
+    """find_matches без кэша.
+
+    Совпадения по началу ищутся диапазоном по индексу столбца, по подстроке - обходом индекса
+    по порядку до limit находок, так что всю таблицу в Python не читаем. Если есть свежий снимок,
+    поиск идёт по нему.
+    """
+    snap = open_snapshot(conn)
+    rows = snap.matches(table, text, limit) if snap is not None else None
+    if rows is not None:
+        return rows
+    column, display, _ = PICKERS[table]
+    rows = conn.execute(f"SELECT id, {display}, {column} FROM {table} WHERE {column} >= ? AND {column} < ? "
+                        f"ORDER BY {column}, id LIMIT ?", (text, text + "\U0010ffff", limit)).fetchall()
+    if text and len(rows) < limit:
+        rows += conn.execute(f"SELECT id, {display}, {column} FROM {table} WHERE instr({column}, ?) > 1 "
+                             f"ORDER BY {column}, id LIMIT ?", (text, limit - len(rows))).fetchall()
+    return rows
+
+def pick(conn, table, text=None):
+    """Предлагает найти строку по началу или части значения и выбрать её; возвращает id или None."""
+    _, _, label = PICKERS[table]
+    if text is None:
+        text = input(f"Введите начало или часть: {label} (Enter - первые {PICK_LIMIT}): ")
+    while True:
+        matches = find_matches(conn, table, text)
+        if not matches:
+            print("Ничего не найдено.")
+            return None
+        exact = [row for row in matches if row[2] == text]
+        if len(matches) == 1 or len(exact) == 1:
+            row = matches[0] if len(matches) == 1 else exact[0]
+            print(f"Выбрано: {row[1]}")
+            return row[0]
+        for i, row in enumerate(matches, 1):
+            print(f"{i}. {row[1]}")
+        if len(matches) == PICK_LIMIT:
+            print("... показаны не все совпадения, уточните запрос.")
+        choice = input("Введите номер или уточните запрос (Enter - отмена): ")
+        if not choice:
+            return None
+        if choice.isdigit() and 1 <= int(choice) <= len(matches):
+            return matches[int(choice) - 1][0]
+        text = choice
+
+# --- Полнотекстовый поиск ---
+
+FTS_LIMIT = 20  # Сколько результатов показывать
+
+# Окончания, которые отбрасываются при поиске (длинные раньше коротких); основа затем ищется как префикс
+RU_ENDINGS = sorted((
+    "иями", "ями", "ами", "иях", "ях", "ах", "ией", "ого", "его", "ому", "ему", "ыми", "ими",
+    "ться", "тся", "ать", "ять", "ить", "еть", "ала", "ила", "али", "или", "ует",
+    "ее", "ие", "ые", "ое", "ая", "яя", "ую", "юю", "ой", "ей", "ий", "ый", "ом", "ем", "ам", "ям",
+    "ов", "ев", "ию", "ья", "ье", "ьи", "ия", "ии", "а", "я", "о", "е", "и", "ы", "у", "ю", "ь", "й",
+), key=len, reverse=True)
+
+def ru_stem(word):
+    """Отбрасывает русское окончание, оставляя основу не короче трёх букв."""
+    word = word.lower()
+    if not re.search("[а-яё]", word):
+        return word
+    for ending in RU_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+def fts_query(text):
+    """Строит запрос MATCH: каждое слово превращается в поиск по основе ("основа"*), слова объединяются через И.
+
+    Предлоги и другие слова короче трёх букв пропускаются, если в запросе есть слова длиннее.
+    """
+    words = re.findall(r"\w+", text)
+    words = [word for word in words if len(word) >= 3] or words
+    return " ".join(f'"{ru_stem(word)}"*' for word in words)
+
+def search_text(conn, text, limit=FTS_LIMIT):
+    """Ищет текст во всех FTS-индексах; возвращает (таблица, id, заголовок, фрагмент) по убыванию релевантности (bm25)."""
+    query = fts_query(text)
+    if not query:
+        return []
+    parts = []
+    for table, columns in FTS_TABLES.items():
+        fts = f"{table}_fts"
+        # Совпадение в заголовке весит вдвое больше, чем в тексте
+        parts.append(f"SELECT '{table}', rowid, {columns[0]}, snippet({fts}, -1, '[', ']', '...', 12), "
+                     f"bm25({fts}, 2.0, 1.0) FROM {fts} WHERE {fts} MATCH ?")
+    sql = " UNION ALL ".join(parts) + " ORDER BY 5 LIMIT ?"
+    rows = conn.execute(sql, (query,) * len(parts) + (limit,)).fetchall()
+    return [row[:4] for row in rows]
+
+def full_text_search(conn):
+    """Полнотекстовый поиск по источникам, персонам, событиям и текстам."""
+    text = input("> Что искать: ")
+    labels = {"Sources": "Источник", "Persons": "Персона", "Events": "Событие", "Tex": "Текст"}
+    try:
+        rows = search_text(conn, text)
+        if not rows:
+            print("Ничего не найдено.")
+        for table, _, title, fragment in rows:
+            print(f"{labels[table]}: {title}\n    {fragment}")
+    except Exception as e:
+        print(f"Ошибка: {e}")
+
+# --- Пространственный поиск ---
+
+EARTH_RADIUS_KM = 6371.0088  # Средний радиус Земли
+NEAREST_START_KM = 10.0  # С какого радиуса начинать поиск ближайших мест
+NEAREST_LIMIT = 10  # Сколько ближайших мест показывать
+
+# Места, координаты которых попали в прямоугольник. R*Tree хранит 32-битные числа и округляет границы
+# наружу, поэтому кандидаты из индекса ещё раз сверяются с точными значениями в Coordinates.
+# CROSS JOIN фиксирует порядок: сначала R*Tree, иначе планировщик может взять индекс по широте.
+PLACES_IN_BOX = (
+    "SELECT Places.id, Places.name, Coordinates.latitude, Coordinates.longitude "
+    "FROM Coordinates_rtree CROSS JOIN Coordinates ON Coordinates.id = Coordinates_rtree.id "
+    "CROSS JOIN Places ON Places.coordinate_id = Coordinates.id "
+    "WHERE Coordinates_rtree.max_lat >= ? AND Coordinates_rtree.min_lat <= ? "
+    "AND Coordinates_rtree.max_lon >= ? AND Coordinates_rtree.min_lon <= ? "
+    "AND Coordinates.latitude BETWEEN ? AND ? AND Coordinates.longitude BETWEEN ? AND ?"
+)
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Расстояние по дуге большого круга между двумя точками, км."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def radius_boxes(lat, lon, radius_km):
+    """Прямоугольники (min_lat, max_lat, min_lon, max_lon), покрывающие круг радиуса radius_km.
+
+    Круг через полюс занимает все долготы; круг через линию перемены дат делится на два прямоугольника.
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    min_lat = lat - math.degrees(angle)
+    max_lat = lat + math.degrees(angle)
+    if min_lat <= -90 or max_lat >= 90 or angle >= math.pi / 2:
+        return [(max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0)]
+    delta = math.degrees(math.asin(min(1.0, math.sin(angle) / math.cos(math.radians(lat)))))
+    min_lon, max_lon = lon - delta, lon + delta
+    if min_lon < -180:
+        return [(min_lat, max_lat, min_lon + 360, 180.0), (min_lat, max_lat, -180.0, max_lon)]
+    if max_lon > 180:
+        return [(min_lat, max_lat, min_lon, 180.0), (min_lat, max_lat, -180.0, max_lon - 360)]
+    return [(min_lat, max_lat, min_lon, max_lon)]
+
+def places_in_box(conn, min_lat, max_lat, min_lon, max_lon):
+    """Места внутри прямоугольника координат: строки (id, название, широта, долгота)."""
+    return conn.execute(PLACES_IN_BOX, (min_lat, max_lat, min_lon, max_lon,
+                                        min_lat, max_lat, min_lon, max_lon)).fetchall()
+
+def places_within(conn, lat, lon, radius_km):
+    """Места не дальше radius_km от точки: строки (расстояние км, id, название, широта, долгота) по возрастанию расстояния.
+
+    Кандидаты берутся из R*Tree по описанному прямоугольнику, точное расстояние считается только для них.
+    """
+    rows = []
+    for box in radius_boxes(lat, lon, radius_km):
+        for place_id, name, place_lat, place_lon in places_in_box(conn, *box):
+            distance = haversine_km(lat, lon, place_lat, place_lon)
+            if distance <= radius_km:
+                rows.append((distance, place_id, name, place_lat, place_lon))
+    rows.sort()
+    return rows
+
+def nearest_places(conn, lat, lon, k=NEAREST_LIMIT):
+    """k ближайших к точке мест (строки как у places_within).
+
+    Радиус поиска растёт вчетверо, пока в круге не наберётся k мест: всё, что вне круга, дальше
+    любого места внутри, поэтому первые k найденных - ответ.
+    """
+    radius = NEAREST_START_KM
+    while True:
+        rows = places_within(conn, lat, lon, radius)
+        if len(rows) >= k or radius >= math.pi * EARTH_RADIUS_KM:
+            return rows[:k]
+        radius *= 4
+
+# --- Граф персон ---
+
+GRAPH_COMPACT_SHARE = 0.1  # Доля рёбер вне CSR-массивов, после которой массивы перестраиваются
+NEIGHBOURS_LIMIT = 20  # Сколько связанных персон показывать
+
+class Adjacency:
+    """Списки смежности одной доли графа в форме CSR: соседи узла i - targets[offsets[i]:offsets[i + 1]].
+
+    weights - число взаимодействий для каждой пары; удалённая пара остаётся в массиве с весом 0.
+    Пары, которых не было при построении, лежат в словаре extra до следующего compact.
+    """
+
+    def __init__(self, offsets=None, targets=None, weights=None):
+        self.offsets = offsets or array("q", [0])
+        self.targets = targets or array("q")
+        self.weights = weights or array("q")
+        self.extra = {}  # узел -> {сосед: вес}
+        self.extra_edges = 0
+
+    def neighbours(self, node):
+        """Номера соседей узла (с ненулевым весом)."""
+        result = []
+        if node < len(self.offsets) - 1:
+            start, end = self.offsets[node], self.offsets[node + 1]
+            result = list(itertools.compress(self.targets[start:end], self.weights[start:end]))
+        if node in self.extra:
+            result.extend(self.extra[node])
+        return result
+
+    def change(self, node, target, delta):
+        """Меняет вес пары на delta (вес не опускается ниже нуля); возвращает True, если пара ещё есть."""
+        if node < len(self.offsets) - 1:
+            start, end = self.offsets[node], self.offsets[node + 1]
+            i = bisect.bisect_left(self.targets, target, start, end)
+            if i < end and self.targets[i] == target:
+                self.weights[i] = max(0, self.weights[i] + delta)
+                return self.weights[i] > 0
+        pairs = self.extra.setdefault(node, {})
+        weight = max(0, pairs.get(target, 0) + delta)
+        if weight:
+            self.extra_edges += target not in pairs
+            pairs[target] = weight
+        elif target in pairs:
+            self.extra_edges -= 1
+            del pairs[target]
+        if not pairs:
+            del self.extra[node]
+        return weight > 0
+
+    def compact(self, node_count):
+        """Переносит пары из extra в массивы и выбрасывает пары с нулевым весом."""
+        offsets, targets, weights = array("q", [0]), array("q"), array("q")
+        for node in range(node_count):
+            pairs = {}
+            if node < len(self.offsets) - 1:
+                start, end = self.offsets[node], self.offsets[node + 1]
+                pairs = {target: weight for target, weight in zip(self.targets[start:end], self.weights[start:end])
+                         if weight}
+            pairs.update(self.extra.get(node, {}))
+            for target in sorted(pairs):
+                targets.append(target)
+                weights.append(pairs[target])
+            offsets.append(len(targets))
+        self.offsets, self.targets, self.weights = offsets, targets, weights
+        self.extra = {}
+        self.extra_edges = 0
+
+def build_adjacency(nodes, targets, weights, node_count):
+    """Adjacency из пар, отсортированных по (узел, сосед): nodes и targets - номера, weights - веса."""
+    offsets = array("q", (bisect.bisect_left(nodes, node) for node in range(node_count + 1)))
+    return Adjacency(offsets, array("q", targets), array("q", weights))
+
+class PersonGraph:
+    """Граф персон из PeopleInteractions: персоны связаны, если у их взаимодействий есть общий источник.
+
+    Пары персон не хранятся (источник с тысячей персон дал бы полмиллиона пар): граф двудольный,
+    персона - источник, и для каждой доли свои CSR-массивы (Adjacency). Узлы пронумерованы подряд,
+    id из базы переводятся в номера словарями. Запросы идут только по массивам, без SQL.
+    """
+
+    def __init__(self):
+        self.person_ids = array("q")
+        self.source_ids = array("q")
+        self.person_index = {}
+        self.source_index = {}
+        self.persons = Adjacency()  # персона -> источники
+        self.sources = Adjacency()  # источник -> персоны
+        self.version = None  # PRAGMA data_version подключения, на котором граф построен
+
+    @classmethod
+    def load(cls, conn):
+        """Строит граф по PeopleInteractions (пары без персоны или без источника не учитываются)."""
+        graph = cls()
+        rows = conn.execute(
+            "SELECT person_id, resource_id, COUNT(*) FROM PeopleInteractions "
+            "WHERE person_id IS NOT NULL AND resource_id IS NOT NULL GROUP BY person_id, resource_id "
+            "ORDER BY person_id, resource_id").fetchall()  # CSR и bisect в соседях опираются на этот порядок
+        if not rows:
+            return graph
+        person_col, source_col, weights = zip(*rows)
+        graph.person_ids = array("q", dict.fromkeys(person_col))
+        graph.source_ids = array("q", sorted(set(source_col)))
+        graph.person_index = {person_id: i for i, person_id in enumerate(graph.person_ids)}
+        graph.source_index = {source_id: i for i, source_id in enumerate(graph.source_ids)}
+        persons = list(map(graph.person_index.__getitem__, person_col))
+        sources = list(map(graph.source_index.__getitem__, source_col))
+        graph.persons = build_adjacency(persons, sources, weights, len(graph.person_ids))
+        # Строки уже упорядочены по персоне, поэтому устойчивая сортировка по одному источнику даёт порядок (источник, персона)
+        order = sorted(range(len(rows)), key=sources.__getitem__)
+        graph.sources = build_adjacency(list(map(sources.__getitem__, order)), map(persons.__getitem__, order),
+                                        map(weights.__getitem__, order), len(graph.source_ids))
+        return graph
+
+    def edges(self):
+        """Число пар персона - источник."""
+        return len(self.persons.targets) + self.persons.extra_edges
+
+    @staticmethod
+    def node(ids, index, node_id):
+        if node_id not in index:
+            index[node_id] = len(ids)
+            ids.append(node_id)
+        return index[node_id]
+
+    def add_interaction(self, person_id, source_id, count=1):
+        """Учитывает новое взаимодействие (отрицательный count - удалённое) без перестройки графа."""
+        if person_id is None or source_id is None:
+            return
+        person = self.node(self.person_ids, self.person_index, person_id)
+        source = self.node(self.source_ids, self.source_index, source_id)
+        self.persons.change(person, source, count)
+        self.sources.change(source, person, count)
+        if self.persons.extra_edges > GRAPH_COMPACT_SHARE * max(len(self.persons.targets), 1000):
+            self.compact()
+
+    def remove_interaction(self, person_id, source_id):
+        """Учитывает удалённое взаимодействие."""
+        if person_id in self.person_index and source_id in self.source_index:
+            self.add_interaction(person_id, source_id, -1)
+
+    def compact(self):
+        """Переносит накопленные изменения в CSR-массивы."""
+        self.persons.compact(len(self.person_ids))
+        self.sources.compact(len(self.source_ids))
+
+    def sources_of(self, person_id):
+        """id источников, общих у взаимодействий персоны."""
+        if person_id not in self.person_index:
+            return []
+        return [self.source_ids[source] for source in self.persons.neighbours(self.person_index[person_id])]
+
+    def neighbours(self, person_id, limit=None):
+        """Связанные персоны: список (id персоны, число общих источников), сначала самые близкие."""
+        if person_id not in self.person_index:
+            return []
+        person = self.person_index[person_id]
+        counts = Counter()
+        for source in self.persons.neighbours(person):
+            counts.update(self.sources.neighbours(source))
+        counts.pop(person, None)
+        rows = sorted(((self.person_ids[other], count) for other, count in counts.items()),
+                      key=lambda row: (-row[1], row[0]))
+        return rows[:limit] if limit else rows
+
+    def shortest_path(self, from_id, to_id):
+        """Кратчайшая цепочка [персона, источник, персона, ..., персона] или None, если связи нет.
+
+        Поиск в ширину по уровням сразу с обеих сторон: каждый раз расширяется меньший фронт.
+        """
+        start, goal = self.person_index.get(from_id), self.person_index.get(to_id)
+        if start is None or goal is None or not self.persons.neighbours(start) or not self.persons.neighbours(goal):
+            return None
+        if start == goal:
+            return [from_id]
+        # Для каждой стороны: персона -> (источник, предыдущая персона) на пути от начала этой стороны
+        parents = ({start: None}, {goal: None})
+        fronts = ([start], [goal])
+        while fronts[0] and fronts[1]:
+            side = 0 if len(fronts[0]) <= len(fronts[1]) else 1
+            seen, other = parents[side], parents[1 - side]
+            front = []
+            for person in fronts[side]:
+                for source in self.persons.neighbours(person):
+                    for next_person in self.sources.neighbours(source):
+                        if next_person in seen:
+                            continue
+                        seen[next_person] = (source, person)
+                        if next_person in other:
+                            return self.join_path(parents, next_person)
+                        front.append(next_person)
+            fronts = (front, fronts[1]) if side == 0 else (fronts[0], front)
+        return None
+
+    def join_path(self, parents, middle):
+        """Склеивает путь из двух деревьев поиска, встретившихся в персоне middle."""
+        halves = []
+        for tree in parents:
+            half = [self.person_ids[middle]]
+            person = middle
+            while tree[person] is not None:
+                source, person = tree[person]
+                half += [self.source_ids[source], self.person_ids[person]]
+            halves.append(half)
+        return halves[0][::-1] + halves[1][1:]
+
+    def components(self):
+        """Группы связанных персон: списки id, сначала самые большие."""
+        seen = bytearray(len(self.person_ids))
+        source_seen = bytearray(len(self.source_ids))
+        groups = []
+        for start in range(len(self.person_ids)):
+            if seen[start] or not self.persons.neighbours(start):
+                continue  # Уже в группе или все взаимодействия персоны удалены
+            seen[start] = 1
+            group = [start]
+            front = [start]
+            while front:
+                sources = [source for person in front for source in self.persons.neighbours(person)
+                           if not source_seen[source]]
+                front = []
+                for source in sources:
+                    if source_seen[source]:
+                        continue
+                    source_seen[source] = 1
+                    for person in self.sources.neighbours(source):
+                        if not seen[person]:
+                            seen[person] = 1
+                            front.append(person)
+                group.extend(front)
+            groups.append([self.person_ids[person] for person in group])
+        groups.sort(key=len, reverse=True)
+        return groups
+
+def person_graph(conn):
+    """Граф персон для подключения; перестраивается, если PeopleInteractions могло изменить другое подключение.
+
+    Граф хранится на подключении KKursConnection. Запись в PeopleInteractions через insert_row, update_row и
+    delete_row сбрасывает его (invalidate_reference), а чужой commit меняет PRAGMA data_version - в обоих
+    случаях граф строится заново. Так граф верен и после отката: его не надо исправлять обратно.
+    """
+    version = conn.execute("PRAGMA data_version").fetchone()[0]
+    graph = getattr(conn, "graph", None)
+    if graph is None or graph.version != version:
+        graph = PersonGraph.load(conn)
+        graph.version = version
+        if isinstance(conn, KKursConnection):
+            conn.graph = graph
+    return graph
+
 # --- Функции для таблицы Sources ---
 
 def sources_list_all(conn):
     """Показывает все источники, сортируя по названию."""
     print("\nИсточники:")
     try:
-        cursor = conn.execute("SELECT title, type, link, content, name FROM Sources ORDER BY title")
-        rows = cursor.fetchall()
-        if not rows:
-            print("Нет источников.")
-        for row in rows:
-            print(f"Название: {row[0]}, Тип: {row[1] or 'Не указано'}, Ссылка: {row[2] or 'Не указано'}, Содержание: {row[3] or 'Не указано'}, Имя: {row[4] or 'Не указано'}")
+        show_list(conn, "sources", "Нет источников.")
     except Exception as e:
         print(f"Ошибка: {e}")
 
 def sources_search_by_title(conn):
     """Ищет источник по названию."""
-    cursor = conn.execute("SELECT title FROM Sources ORDER BY title")
-    titles = [row[0] for row in cursor.fetchall()]
-    if not titles:
-        print("Нет источников.")
+    source_id = pick(conn, "Sources")
+    if source_id is None:
         return
-    print("\nНазвания источников:")
-    for i, title in enumerate(titles, 1):
-        print(f"{i}. {title}")
-    choice = input("Введите номер или название: ")
     try:
-        title = titles[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(titles) else choice
-        cursor = conn.execute("SELECT title, type, link, content, name FROM Sources WHERE title = ?", (title,))
-        row = cursor.fetchone()
+        row = get_row(conn, "sources", source_id)
         if row:
-            print(f"Название: {row[0]}, Тип: {row[1] or 'Не указано'}, Ссылка: {row[2] or 'Не указано'}, Содержание: {row[3] or 'Не указано'}, Имя: {row[4] or 'Не указано'}")
+            print(view_record("sources", row).describe())
         else:
             print("Источник не найден.")
     except Exception as e:
@@ -95,58 +1813,67 @@ def sources_add(conn):
     content = input("> Содержание (Enter, если нет): ") or None
     name = input("> Имя (Enter, если нет): ") or None
     try:
-        cursor = conn.execute("INSERT INTO Sources (title, type, link, content, name) VALUES (?, ?, ?, ?, ?)", 
-                             (title, type_, link, content, name))
+        source_id = insert_row(conn, "sources", {"title": title, "type": type_, "link": link, "content": content, "name": name})
         conn.commit()
         print("Источник добавлен.")
-        return cursor.lastrowid  # Возвращает ID нового источника
+        return source_id  # Возвращает ID нового источника
     except sqlite3.IntegrityError:
+        conn.rollback()  # Незавершённые изменения не должны попасть в следующий commit
         print("Ошибка: такой источник уже есть.")
         return None
     except Exception as e:
+        conn.rollback()
         print(f"Ошибка: {e}")
         return None
 
 def sources_update(conn):
     """Обновляет источник."""
-    cursor = conn.execute("SELECT title FROM Sources ORDER BY title")
-    titles = [row[0] for row in cursor.fetchall()]
-    if not titles:
-        print("Нет источников.")
+    source_id = pick(conn, "Sources")
+    if source_id is None:
         return
-    print("\nНазвания источников:")
-    for i, title in enumerate(titles, 1):
-        print(f"{i}. {title}")
-    choice = input("Введите номер или название: ")
     try:
-        title = titles[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(titles) else choice
         type_ = input("> Новый тип (Enter, если не менять): ") or None
         link = input("> Новая ссылка (Enter, если не менять): ") or None
         content = input("> Новое содержание (Enter, если не менять): ") or None
         name = input("> Новое имя (Enter, если не менять): ") or None
-        cursor = conn.execute("UPDATE Sources SET type = COALESCE(?, type), link = COALESCE(?, link), content = COALESCE(?, content), name = COALESCE(?, name) WHERE title = ?", 
-                             (type_, link, content, name, title))
+        count = update_row(conn, "sources", source_id, {"type": type_, "link": link, "content": content, "name": name})
         conn.commit()
-        print("Источник обновлён." if cursor.rowcount else "Источник не найден.")
+        print("Источник обновлён." if count else "Источник не найден.")
     except Exception as e:
+        conn.rollback()
         print(f"Ошибка: {e}")
 
 def sources_delete(conn):
     """Удаляет источник."""
-    cursor = conn.execute("SELECT title FROM Sources ORDER BY title")
-    titles = [row[0] for row in cursor.fetchall()]
-    if not titles:
-        print("Нет источников.")
+    source_id = pick(conn, "Sources")
+    if source_id is None:
         return
-    print("\nНазвания источников:")
-    for i, title in enumerate(titles, 1):
-        print(f"{i}. {title}")
-    choice = input("Введите номер или название: ")
     try:
-        title = titles[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(titles) else choice
-        cursor = conn.execute("DELETE FROM Sources WHERE title = ?", (title,))
+        report = {}
+        count = delete_row(conn, "sources", source_id, report)
         conn.commit()
-        print("Источник удалён." if cursor.rowcount else "Источник не найден.")
+        print("Источник удалён." if count else "Источник не найден.")
+        if report:
+            print(f"Ссылки на удалённую запись: {format_references(report)}.")
+    except sqlite3.IntegrityError as e:
+        conn.rollback()
+        print(f"Ошибка: {e}. Сначала удалите или измените эти записи.")
+    except Exception as e:
+        conn.rollback()
+        print(f"Ошибка: {e}")
+
+def sources_most_cited(conn):
+    """Показывает источники, на которые ссылается больше всего записей."""
+    try:
+        rows = most_cited_sources(conn)
+        if not rows:
+            print("Ни на один источник нет ссылок.")
+            return
+        print("\nСамые цитируемые источники:")
+        for _, title, name, total, *counts in rows:
+            usage = dict(zip(SOURCE_REFERENCES.values(), counts))
+            usage = {column: count for column, count in usage.items() if count}
+            print(f"{total:>6}  {title}{f' ({name})' if name else ''} - {format_usage(usage)}")
     except Exception as e:
         print(f"Ошибка: {e}")
 
@@ -156,32 +1883,19 @@ def coordinates_list_all(conn):
     """Показывает все координаты, сортируя по широте."""
     print("\nКоординаты:")
     try:
-        cursor = conn.execute("SELECT latitude, longitude, name FROM Coordinates ORDER BY latitude")
-        rows = cursor.fetchall()
-        if not rows:
-            print("Нет координат.")
-        for row in rows:
-            print(f"Широта: {row[0]}, Долгота: {row[1]}, Название: {row[2] or 'Не указано'}")
+        show_list(conn, "coordinates", "Нет координат.")
     except Exception as e:
         print(f"Ошибка: {e}")
 
 def coordinates_search_by_name(conn):
     """Ищет координаты по названию."""
-    cursor = conn.execute("SELECT name FROM Coordinates WHERE name IS NOT NULL ORDER BY name")
-    names = [row[0] for row in cursor.fetchall()]
-    if not names:
-        print("Нет координат с названиями.")
+    coordinate_id = pick(conn, "Coordinates")
+    if coordinate_id is None:
         return
-    print("\nНазвания координат:")
-    for i, name in enumerate(names, 1):
-        print(f"{i}. {name}")
-    choice = input("Введите номер или название: ")
     try:
-        name = titles[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(names) else choice
-        cursor = conn.execute("SELECT latitude, longitude, name FROM Coordinates WHERE name = ?", (name,))
-        row = cursor.fetchone()
+        row = get_row(conn, "coordinates", coordinate_id)
         if row:
-            print(f"Широта: {row[0]}, Долгота: {row[1]}, Название: {row[2] or 'Не указано'}")
+            print(view_record("coordinates", row).describe())
         else:
             print("Координаты не найдены.")
     except Exception as e:
@@ -200,56 +1914,51 @@ def coordinates_add(conn):
         return
     name = input("> Название (Enter, если нет): ") or None
     try:
-        conn.execute("INSERT INTO Coordinates (latitude, longitude, name) VALUES (?, ?, ?)", (lat, lon, name))
+        insert_row(conn, "coordinates", {"latitude": lat, "longitude": lon, "name": name})
         conn.commit()
         print("Координаты добавлены.")
     except sqlite3.IntegrityError:
+        conn.rollback()
         print("Ошибка: такие координаты уже есть.")
     except Exception as e:
+        conn.rollback()
         print(f"Ошибка: {e}")
 
 def coordinates_update(conn):
     """Обновляет координаты."""
-    cursor = conn.execute("SELECT name FROM Coordinates WHERE name IS NOT NULL ORDER BY name")
-    names = [row[0] for row in cursor.fetchall()]
-    if not names:
-        print("Нет координат с названиями.")
+    coordinate_id = pick(conn, "Coordinates")
+    if coordinate_id is None:
         return
-    print("\nНазвания координат:")
-    for i, name in enumerate(names, 1):
-        print(f"{i}. {name}")
-    choice = input("Введите номер или название: ")
     try:
-        name = names[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(names) else choice
         new_lat = input("> Новая широта (Enter, если не менять): ")
         new_lat = validate_float(new_lat, "Широта") if new_lat else None
         new_lon = input("> Новая долгота (Enter, если не менять): ")
         new_lon = validate_float(new_lon, "Долгота") if new_lon else None
         new_name = input("> Новое название (Enter, если не менять): ") or None
-        cursor = conn.execute("UPDATE Coordinates SET latitude = COALESCE(?, latitude), longitude = COALESCE(?, longitude), name = COALESCE(?, name) WHERE name = ?", 
-                             (new_lat, new_lon, new_name, name))
+        count = update_row(conn, "coordinates", coordinate_id, {"latitude": new_lat, "longitude": new_lon, "name": new_name})
         conn.commit()
-        print("Координаты обновлены." if cursor.rowcount else "Координаты не найдены.")
+        print("Координаты обновлены." if count else "Координаты не найдены.")
     except Exception as e:
+        conn.rollback()
         print(f"Ошибка: {e}")
 
 def coordinates_delete(conn):
     """Удаляет координаты."""
-    cursor = conn.execute("SELECT name FROM Coordinates WHERE name IS NOT NULL ORDER BY name")
-    names = [row[0] for row in cursor.fetchall()]
-    if not names:
-        print("Нет координат с названиями.")
+    coordinate_id = pick(conn, "Coordinates")
+    if coordinate_id is None:
         return
-    print("\nНазвания координат:")
-    for i, name in enumerate(names, 1):
-        print(f"{i}. {name}")
-    choice = input("Введите номер или название: ")
     try:
-        name = names[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(names) else choice
-        cursor = conn.execute("DELETE FROM Coordinates WHERE name = ?", (name,))
+        report = {}
+        count = delete_row(conn, "coordinates", coordinate_id, report)
         conn.commit()
-        print("Координаты удалены." if cursor.rowcount else "Координаты не найдены.")
+        print("Координаты удалены." if count else "Координаты не найдены.")
+        if report:
+            print(f"Ссылки на удалённую запись: {format_references(report)}.")
+    except sqlite3.IntegrityError as e:
+        conn.rollback()
+        print(f"Ошибка: {e}. Сначала удалите или измените эти записи.")
     except Exception as e:
+        conn.rollback()
         print(f"Ошибка: {e}")
 
 # --- Функции для таблицы Persons ---
@@ -258,32 +1967,19 @@ def persons_list_all(conn):
     """Показывает всех персон, сортируя по фамилии."""
     print("\nПерсоны:")
     try:
-        cursor = conn.execute("SELECT surname, name, patronymic, date_of_birth, biography FROM Persons ORDER BY surname")
-        rows = cursor.fetchall()
-        if not rows:
-            print("Нет персон.")
-        for row in rows:
-            print(f"Фамилия: {row[0]}, Имя: {row[1] or 'Не указано'}, Отчество: {row[2] or 'Не указано'}, Дата рождения: {row[3] or 'Не указано'}, Биография: {row[4] or 'Не указано'}")
+        show_list(conn, "persons", "Нет персон.")
     except Exception as e:
         print(f"Ошибка: {e}")
 
 def persons_search_by_surname(conn):
     """Ищет персону по фамилии."""
-    cursor = conn.execute("SELECT surname FROM Persons ORDER BY surname")
-    surnames = [row[0] for row in cursor.fetchall()]
-    if not surnames:
-        print("Нет персон.")
+    person_id = pick(conn, "Persons")
+    if person_id is None:
         return
-    print("\nФамилии:")
-    for i, surname in enumerate(surnames, 1):
-        print(f"{i}. {surname}")
-    choice = input("Введите номер или фамилию: ")
     try:
-        surname = surnames[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(surnames) else choice
-        cursor = conn.execute("SELECT surname, name, patronymic, date_of_birth, biography FROM Persons WHERE surname = ?", (surname,))
-        row = cursor.fetchone()
+        row = get_row(conn, "persons", person_id)
         if row:
-            print(f"Фамилия: {row[0]}, Имя: {row[1] or 'Не указано'}, Отчество: {row[2] or 'Не указано'}, Дата рождения: {row[3] or 'Не указано'}, Биография: {row[4] or 'Не указано'}")
+            print(view_record("persons", row).describe())
         else:
             print("Персона не найдена.")
     except Exception as e:
@@ -295,63 +1991,57 @@ def persons_add(conn):
     surname = input("> Фамилия: ")
     name = input("> Имя: ") or None
     patronymic = input("> Отчество (Enter, если нет): ") or None
-    dob = input("> Дата рождения (ГГГГ-ММ-ДД, Enter, если нет): ")
-    dob = validate_date(dob)
-    if dob is None and dob != '':
+    dob_input = input("> Дата рождения (ГГГГ-ММ-ДД, Enter, если нет): ")
+    dob = validate_date(dob_input)
+    if dob is None and dob_input != '':
         return
     bio = input("> Биография (Enter, если нет): ") or None
     try:
-        conn.execute("INSERT INTO Persons (surname, name, patronymic, date_of_birth, biography) VALUES (?, ?, ?, ?, ?)", 
-                     (surname, name, patronymic, dob, bio))
+        insert_row(conn, "persons", {"surname": surname, "name": name, "patronymic": patronymic, "date_of_birth": dob, "biography": bio})
         conn.commit()
         print("Персона добавлена.")
     except sqlite3.IntegrityError:
+        conn.rollback()
         print("Ошибка: такая персона уже есть.")
     except Exception as e:
+        conn.rollback()
         print(f"Ошибка: {e}")
 
 def persons_update(conn):
     """Обновляет персону."""
-    cursor = conn.execute("SELECT surname FROM Persons ORDER BY surname")
-    surnames = [row[0] for row in cursor.fetchall()]
-    if not surnames:
-        print("Нет персон.")
+    person_id = pick(conn, "Persons")
+    if person_id is None:
         return
-    print("\nФамилии:")
-    for i, surname in enumerate(surnames, 1):
-        print(f"{i}. {surname}")
-    choice = input("Введите номер или фамилию: ")
     try:
-        surname = surnames[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(surnames) else choice
         name = input("> Новое имя (Enter, если не менять): ") or None
         patronymic = input("> Новое отчество (Enter, если не менять): ") or None
         dob = input("> Новая дата рождения (ГГГГ-ММ-ДД, Enter, если не менять): ")
         dob = validate_date(dob) if dob else None
         bio = input("> Новая биография (Enter, если не менять): ") or None
-        cursor = conn.execute("UPDATE Persons SET name = COALESCE(?, name), patronymic = COALESCE(?, patronymic), date_of_birth = COALESCE(?, date_of_birth), biography = COALESCE(?, biography) WHERE surname = ?", 
-                             (name, patronymic, dob, bio, surname))
+        count = update_row(conn, "persons", person_id, {"name": name, "patronymic": patronymic, "date_of_birth": dob, "biography": bio})
         conn.commit()
-        print("Персона обновлена." if cursor.rowcount else "Персона не найдена.")
+        print("Персона обновлена." if count else "Персона не найдена.")
     except Exception as e:
+        conn.rollback()
         print(f"Ошибка: {e}")
 
 def persons_delete(conn):
     """Удаляет персону."""
-    cursor = conn.execute("SELECT surname FROM Persons ORDER BY surname")
-    surnames = [row[0] for row in cursor.fetchall()]
-    if not surnames:
-        print("Нет персон.")
+    person_id = pick(conn, "Persons")
+    if person_id is None:
         return
-    print("\nФамилии:")
-    for i, surname in enumerate(surnames, 1):
-        print(f"{i}. {surname}")
-    choice = input("Введите номер или фамилию: ")
     try:
-        surname = surnames[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(surnames) else choice
-        cursor = conn.execute("DELETE FROM Persons WHERE surname = ?", (surname,))
+        report = {}
+        count = delete_row(conn, "persons", person_id, report)
         conn.commit()
-        print("Персона удалена." if cursor.rowcount else "Персона не найдена.")
+        print("Персона удалена." if count else "Персона не найдена.")
+        if report:
+            print(f"Ссылки на удалённую запись: {format_references(report)}.")
+    except sqlite3.IntegrityError as e:
+        conn.rollback()
+        print(f"Ошибка: {e}. Сначала удалите или измените эти записи.")
     except Exception as e:
+        conn.rollback()
         print(f"Ошибка: {e}")
 
 # --- Функции для таблицы Events ---
@@ -360,34 +2050,19 @@ def events_list_all(conn):
     """Показывает все события, сортируя по дате."""
     print("\nСобытия:")
     try:
-        cursor = conn.execute("SELECT Events.name, Events.data, Events.description, Sources.title FROM Events LEFT JOIN Sources ON Events.resource_id = Sources.id ORDER BY Events.data")
-        rows = cursor.fetchall()
-        if not rows:
-            print("Нет событий.")
-        for row in rows:
-            source = row[3] if row[3] else "Источник не найден"
-            print(f"Название: {row[0]}, Дата: {row[1] or 'Не указано'}, Описание: {row[2] or 'Не указано'}, Источник: {source}")
+        show_list(conn, "events", "Нет событий.")
     except Exception as e:
         print(f"Ошибка: {e}")
 
 def events_search_by_name(conn):
     """Ищет событие по названию."""
-    cursor = conn.execute("SELECT name FROM Events ORDER BY name")
-    names = [row[0] for row in cursor.fetchall()]
-    if not names:
-        print("Нет событий.")
+    event_id = pick(conn, "Events")
+    if event_id is None:
         return
-    print("\nНазвания событий:")
-    for i, name in enumerate(names, 1):
-        print(f"{i}. {name}")
-    choice = input("Введите номер или название: ")
     try:
-        name = names[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(names) else choice
-        cursor = conn.execute("SELECT Events.name, Events.data, Events.description, Sources.title FROM Events LEFT JOIN Sources ON Events.resource_id = Sources.id WHERE Events.name = ?", (name,))
-        row = cursor.fetchone()
+        row = get_row(conn, "events", event_id)
         if row:
-            source = row[3] if row[3] else "Источник не найден"
-            print(f"Название: {row[0]}, Дата: {row[1] or 'Не указано'}, Описание: {row[2] or 'Не указано'}, Источник: {source}")
+            print(view_record("events", row).describe())
         else:
             print("Событие не найдено.")
     except Exception as e:
@@ -402,90 +2077,54 @@ def events_add(conn):
     if data is None:
         return
     description = input("> Описание (Enter, если нет): ") or None
-    cursor = conn.execute("SELECT title FROM Sources ORDER BY title")
-    titles = [row[0] for row in cursor.fetchall()]
-    if not titles:
-        print("Нет источников.")
+    print("\nИсточник")
+    resource_id = pick(conn, "Sources")
+    if resource_id is None:
         return
-    print("\nИсточники:")
-    for i, title in enumerate(titles, 1):
-        print(f"{i}. {title}")
-    choice = input("Введите номер или название источника: ")
     try:
-        title = titles[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(titles) else choice
-        cursor = conn.execute("SELECT id FROM Sources WHERE title = ?", (title,))
-        src = cursor.fetchone()
-        if not src:
-            print("Источник не найден.")
-            return
-        conn.execute("INSERT INTO Events (name, data, description, resource_id) VALUES (?, ?, ?, ?)", 
-                     (name, data, description, src[0]))
+        insert_row(conn, "events", {"name": name, "data": data, "description": description, "resource_id": resource_id})
         conn.commit()
         print("Событие добавлено.")
     except sqlite3.IntegrityError:
+        conn.rollback()
         print("Ошибка: такое событие уже есть.")
     except Exception as e:
+        conn.rollback()
         print(f"Ошибка: {e}")
 
 def events_update(conn):
     """Обновляет событие."""
-    cursor = conn.execute("SELECT name FROM Events ORDER BY name")
-    names = [row[0] for row in cursor.fetchall()]
-    if not names:
-        print("Нет событий.")
+    event_id = pick(conn, "Events")
+    if event_id is None:
         return
-    print("\nНазвания событий:")
-    for i, name in enumerate(names, 1):
-        print(f"{i}. {name}")
-    choice = input("Введите номер или название: ")
     try:
-        name = names[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(names) else choice
         data = input("> Новая дата (ГГГГ-ММ-ДД, Enter, если не менять): ")
         data = validate_date(data) if data else None
         description = input("> Новое описание (Enter, если не менять): ") or None
-        cursor = conn.execute("SELECT title FROM Sources ORDER BY title")
-        titles = [row[0] for row in cursor.fetchall()]
-        if titles:
-            print("\nИсточники:")
-            for i, title in enumerate(titles, 1):
-                print(f"{i}. {title}")
-            choice = input("Введите номер или название источника (Enter, если не менять): ")
-            resource_id = None
-            if choice:
-                title = titles[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(titles) else choice
-                cursor = conn.execute("SELECT id FROM Sources WHERE title = ?", (title,))
-                src = cursor.fetchone()
-                if not src:
-                    print("Источник не найден.")
-                    return
-                resource_id = src[0]
-            cursor = conn.execute("UPDATE Events SET data = COALESCE(?, data), description = COALESCE(?, description), resource_id = COALESCE(?, resource_id) WHERE name = ?", 
-                                 (data, description, resource_id, name))
-        else:
-            cursor = conn.execute("UPDATE Events SET data = COALESCE(?, data), description = COALESCE(?, description) WHERE name = ?", 
-                                 (data, description, name))
+        choice = input("> Новый источник: начало или часть названия (Enter, если не менять): ")
+        resource_id = None
+        if choice:
+            resource_id = pick(conn, "Sources", choice)
+            if resource_id is None:
+                return
+        count = update_row(conn, "events", event_id, {"data": data, "description": description, "resource_id": resource_id})
         conn.commit()
-        print("Событие обновлено." if cursor.rowcount else "Событие не найдено.")
+        print("Событие обновлено." if count else "Событие не найдено.")
     except Exception as e:
+        conn.rollback()
         print(f"Ошибка: {e}")
 
 def events_delete(conn):
     """Удаляет событие."""
-    cursor = conn.execute("SELECT name FROM Events ORDER BY name")
-    names = [row[0] for row in cursor.fetchall()]
-    if not names:
-        print("Нет событий.")
+    event_id = pick(conn, "Events")
+    if event_id is None:
         return
-    print("\nНазвания событий:")
-    for i, name in enumerate(names, 1):
-        print(f"{i}. {name}")
-    choice = input("Введите номер или название: ")
     try:
-        name = names[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(names) else choice
-        cursor = conn.execute("DELETE FROM Events WHERE name = ?", (name,))
+        count = delete_row(conn, "events", event_id)
         conn.commit()
-        print("Событие удалено." if cursor.rowcount else "Событие не найдено.")
+        print("Событие удалено." if count else "Событие не найдено.")
     except Exception as e:
+        conn.rollback()
         print(f"Ошибка: {e}")
 
 # --- Функции для таблицы Texts ---
@@ -494,34 +2133,19 @@ def texts_list_all(conn):
     """Показывает все тексты, сортируя по дате."""
     print("\nТексты:")
     try:
-        cursor = conn.execute("SELECT Tex.name, Tex.data, Tex.content, Sources.title FROM Tex LEFT JOIN Sources ON Tex.resource_id = Sources.id ORDER BY Tex.data")
-        rows = cursor.fetchall()
-        if not rows:
-            print("Нет текстов.")
-        for row in rows:
-            source = row[3] if row[3] else "Источник не найден"
-            print(f"Название: {row[0]}, Дата: {row[1] or 'Не указано'}, Содержание: {row[2] or 'Не указано'}, Источник: {source}")
+        show_list(conn, "texts", "Нет текстов.")
     except Exception as e:
         print(f"Ошибка: {e}")
 
 def texts_search_by_name(conn):
     """Ищет текст по названию."""
-    cursor = conn.execute("SELECT name FROM Tex ORDER BY name")
-    names = [row[0] for row in cursor.fetchall()]
-    if not names:
-        print("Нет текстов.")
+    text_id = pick(conn, "Tex")
+    if text_id is None:
         return
-    print("\nНазвания текстов:")
-    for i, name in enumerate(names, 1):
-        print(f"{i}. {name}")
-    choice = input("Введите номер или название: ")
     try:
-        name = names[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(names) else choice
-        cursor = conn.execute("SELECT Tex.name, Tex.data, Tex.content, Sources.title FROM Tex LEFT JOIN Sources ON Tex.resource_id = Sources.id WHERE Tex.name = ?", (name,))
-        row = cursor.fetchone()
+        row = get_row(conn, "texts", text_id)
         if row:
-            source = row[3] if row[3] else "Источник не найден"
-            print(f"Название: {row[0]}, Дата: {row[1] or 'Не указано'}, Содержание: {row[2] or 'Не указано'}, Источник: {source}")
+            print(view_record("texts", row).describe())
         else:
             print("Текст не найден.")
     except Exception as e:
@@ -536,15 +2160,7 @@ def texts_add(conn):
     data = validate_date(data)
     if data is None:
         return
-    cursor = conn.execute("SELECT title FROM Sources ORDER BY title")
-    titles = [row[0] for row in cursor.fetchall()]
-    print("\nИсточники:")
-    print("0. Не указывать источник")
-    if titles:
-        for i, title in enumerate(titles, 1):
-            print(f"{i}. {title}")
-    print("-1. Создать новый источник")
-    choice = input("Введите номер, название источника, 0 или -1: ")
+    choice = input("> Источник: начало или часть названия, 0 - не указывать, -1 - создать новый: ")
     try:
         resource_id = None
         if choice == "0":
@@ -554,86 +2170,56 @@ def texts_add(conn):
             if resource_id is None:
                 return
         else:
-            title = titles[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(titles) else choice
-            cursor = conn.execute("SELECT id FROM Sources WHERE title = ?", (title,))
-            src = cursor.fetchone()
-            if not src:
-                print("Источник не найден.")
+            resource_id = pick(conn, "Sources", choice)
+            if resource_id is None:
                 return
-            resource_id = src[0]
-        conn.execute("INSERT INTO Tex (name, content, data, resource_id) VALUES (?, ?, ?, ?)", 
-                     (name, content, data, resource_id))
+        insert_row(conn, "texts", {"name": name, "content": content, "data": data, "resource_id": resource_id})
         conn.commit()
         print("Текст добавлен.")
     except sqlite3.IntegrityError:
+        conn.rollback()
         print("Ошибка: такой текст уже есть.")
     except Exception as e:
+        conn.rollback()
         print(f"Ошибка: {e}")
 
 def texts_update(conn):
     """Обновляет текст."""
-    cursor = conn.execute("SELECT name FROM Tex ORDER BY name")
-    names = [row[0] for row in cursor.fetchall()]
-    if not names:
-        print("Нет текстов.")
+    text_id = pick(conn, "Tex")
+    if text_id is None:
         return
-    print("\nНазвания текстов:")
-    for i, name in enumerate(names, 1):
-        print(f"{i}. {name}")
-    choice = input("Введите номер или название: ")
     try:
-        name = names[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(names) else choice
         content = input("> Новое содержание (Enter, если не менять): ") or None
         data = input("> Новая дата (ГГГГ-ММ-ДД, Enter, если не менять): ")
         data = validate_date(data) if data else None
-        cursor = conn.execute("SELECT title FROM Sources ORDER BY title")
-        titles = [row[0] for row in cursor.fetchall()]
-        print("\nИсточники:")
-        print("0. Не указывать источник")
-        if titles:
-            for i, title in enumerate(titles, 1):
-                print(f"{i}. {title}")
-        print("-1. Создать новый источник")
-        choice = input("Введите номер, название источника, 0 или -1 (Enter, если не менять): ")
+        choice = input("> Новый источник: начало или часть названия, -1 - создать новый (Enter, если не менять): ")
         resource_id = None
-        if choice == "0":
-            resource_id = None
-        elif choice == "-1":
+        if choice == "-1":
             resource_id = sources_add(conn)
             if resource_id is None:
                 return
         elif choice:
-            title = titles[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(titles) else choice
-            cursor = conn.execute("SELECT id FROM Sources WHERE title = ?", (title,))
-            src = cursor.fetchone()
-            if not src:
-                print("Источник не найден.")
+            resource_id = pick(conn, "Sources", choice)
+            if resource_id is None:
                 return
-            resource_id = src[0]
-        cursor = conn.execute("UPDATE Tex SET content = COALESCE(?, content), data = COALESCE(?, data), resource_id = COALESCE(?, resource_id) WHERE name = ?", 
-                             (content, data, resource_id, name))
+        count = update_row(conn, "texts", text_id, {"content": content, "data": data, "resource_id": resource_id})
         conn.commit()
-        print("Текст обновлён." if cursor.rowcount else "Текст не найден.")
+        print("Текст обновлён." if count else "Текст не найден.")
     except Exception as e:
+        conn.rollback()
         print(f"Ошибка: {e}")
 
 def texts_delete(conn):
     """Удаляет текст."""
-    cursor = conn.execute("SELECT name FROM Tex ORDER BY name")
-    names = [row[0] for row in cursor.fetchall()]
-    if not names:
-        print("Нет текстов.")
+    text_id = pick(conn, "Tex")
+    if text_id is None:
         return
-    print("\nНазвания текстов:")
-    for i, name in enumerate(names, 1):
-        print(f"{i}. {name}")
-    choice = input("Введите номер или название: ")
     try:
-        name = names[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(names) else choice
-        cursor = conn.execute("DELETE FROM Tex WHERE name = ?", (name,))
+        count = delete_row(conn, "texts", text_id)
         conn.commit()
-        print("Текст удалён." if cursor.rowcount else "Текст не найден.")
+        print("Текст удалён." if count else "Текст не найден.")
     except Exception as e:
+        conn.rollback()
         print(f"Ошибка: {e}")
 
 # --- Функции для таблицы Places ---
@@ -642,34 +2228,19 @@ def places_list_all(conn):
     """Показывает все места, сортируя по названию."""
     print("\nМеста:")
     try:
-        cursor = conn.execute("SELECT Places.name, Coordinates.latitude, Coordinates.longitude, Sources.title FROM Places JOIN Coordinates ON Places.coordinate_id = Coordinates.id LEFT JOIN Sources ON Places.resource_id = Sources.id ORDER BY Places.name")
-        rows = cursor.fetchall()
-        if not rows:
-            print("Нет мест.")
-        for row in rows:
-            source = row[3] if row[3] else "Источник не найден"
-            print(f"Название: {row[0]}, Широта: {row[1]}, Долгота: {row[2]}, Источник: {source}")
+        show_list(conn, "places", "Нет мест.")
     except Exception as e:
         print(f"Ошибка: {e}")
 
 def places_search_by_name(conn):
     """Ищет место по названию."""
-    cursor = conn.execute("SELECT name FROM Places ORDER BY name")
-    names = [row[0] for row in cursor.fetchall()]
-    if not names:
-        print("Нет мест.")
+    place_id = pick(conn, "Places")
+    if place_id is None:
         return
-    print("\nНазвания мест:")
-    for i, name in enumerate(names, 1):
-        print(f"{i}. {name}")
-    choice = input("Введите номер или название: ")
     try:
-        name = names[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(names) else choice
-        cursor = conn.execute("SELECT Places.name, Coordinates.latitude, Coordinates.longitude, Sources.title FROM Places JOIN Coordinates ON Places.coordinate_id = Coordinates.id LEFT JOIN Sources ON Places.resource_id = Sources.id WHERE Places.name = ?", (name,))
-        row = cursor.fetchone()
+        row = get_row(conn, "places", place_id)
         if row:
-            source = row[3] if row[3] else "Источник не найден"
-            print(f"Название: {row[0]}, Широта: {row[1]}, Долгота: {row[2]}, Источник: {source}")
+            print(view_record("places", row).describe())
         else:
             print("Место не найдено.")
     except Exception as e:
@@ -679,102 +2250,79 @@ def places_add(conn):
     """Добавляет место."""
     print("\nНовое место")
     name = input("> Название: ")
-    cursor = conn.execute("SELECT name FROM Coordinates WHERE name IS NOT NULL ORDER BY name")
-    coord_names = [row[0] for row in cursor.fetchall()]
-    if not coord_names:
-        print("Нет координат.")
+    print("\nКоординаты")
+    coordinate_id = pick(conn, "Coordinates")
+    if coordinate_id is None:
         return
-    print("\nКоординаты:")
-    for i, coord_name in enumerate(coord_names, 1):
-        print(f"{i}. {coord_name}")
-    coord_choice = input("Введите номер или название координат: ")
-    cursor = conn.execute("SELECT title FROM Sources ORDER BY title")
-    titles = [row[0] for row in cursor.fetchall()]
-    if not titles:
-        print("Нет источников.")
+    print("\nИсточник")
+    resource_id = pick(conn, "Sources")
+    if resource_id is None:
         return
-    print("\nИсточники:")
-    for i, title in enumerate(titles, 1):
-        print(f"{i}. {title}")
-    source_choice = input("Введите номер или название источника: ")
     try:
-        coord_name = coord_names[int(coord_choice) - 1] if coord_choice.isdigit() and 1 <= int(coord_choice) <= len(coord_names) else coord_choice
-        cursor = conn.execute("SELECT id FROM Coordinates WHERE name = ?", (coord_name,))
-        coord = cursor.fetchone()
-        if not coord:
-            print("Координаты не найдены.")
-            return
-        title = titles[int(source_choice) - 1] if source_choice.isdigit() and 1 <= int(source_choice) <= len(titles) else source_choice
-        cursor = conn.execute("SELECT id FROM Sources WHERE title = ?", (title,))
-        src = cursor.fetchone()
-        if not src:
-            print("Источник не найден.")
-            return
-        conn.execute("INSERT INTO Places (name, resource_id, coordinate_id) VALUES (?, ?, ?)", 
-                     (name, src[0], coord[0]))
+        insert_row(conn, "places", {"name": name, "resource_id": resource_id, "coordinate_id": coordinate_id})
         conn.commit()
         print("Место добавлено.")
     except sqlite3.IntegrityError:
+        conn.rollback()
         print("Ошибка: такое место уже есть.")
     except Exception as e:
+        conn.rollback()
         print(f"Ошибка: {e}")
 
 def places_update(conn):
     """Обновляет место."""
-    cursor = conn.execute("SELECT name FROM Places ORDER BY name")
-    names = [row[0] for row in cursor.fetchall()]
-    if not names:
-        print("Нет мест.")
+    place_id = pick(conn, "Places")
+    if place_id is None:
         return
-    print("\nНазвания мест:")
-    for i, name in enumerate(names, 1):
-        print(f"{i}. {name}")
-    choice = input("Введите номер или название: ")
     try:
-        name = names[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(names) else choice
         new_name = input("> Новое название (Enter, если не менять): ") or None
-        cursor = conn.execute("SELECT title FROM Sources ORDER BY title")
-        titles = [row[0] for row in cursor.fetchall()]
-        if titles:
-            print("\nИсточники:")
-            for i, title in enumerate(titles, 1):
-                print(f"{i}. {title}")
-            source_choice = input("Введите номер или название источника (Enter, если не менять): ")
-            resource_id = None
-            if source_choice:
-                title = titles[int(source_choice) - 1] if source_choice.isdigit() and 1 <= int(source_choice) <= len(titles) else source_choice
-                cursor = conn.execute("SELECT id FROM Sources WHERE title = ?", (title,))
-                src = cursor.fetchone()
-                if not src:
-                    print("Источник не найден.")
-                    return
-                resource_id = src[0]
-            cursor = conn.execute("UPDATE Places SET name = COALESCE(?, name), resource_id = COALESCE(?, resource_id) WHERE name = ?", 
-                                 (new_name, resource_id, name))
-        else:
-            cursor = conn.execute("UPDATE Places SET name = COALESCE(?, name) WHERE name = ?", 
-                                 (new_name, name))
+        choice = input("> Новый источник: начало или часть названия (Enter, если не менять): ")
+        resource_id = None
+        if choice:
+            resource_id = pick(conn, "Sources", choice)
+            if resource_id is None:
+                return
+        count = update_row(conn, "places", place_id, {"name": new_name, "resource_id": resource_id})
         conn.commit()
-        print("Место обновлено." if cursor.rowcount else "Место не найдено.")
+        print("Место обновлено." if count else "Место не найдено.")
     except Exception as e:
+        conn.rollback()
         print(f"Ошибка: {e}")
 
 def places_delete(conn):
     """Удаляет место."""
-    cursor = conn.execute("SELECT name FROM Places ORDER BY name")
-    names = [row[0] for row in cursor.fetchall()]
-    if not names:
-        print("Нет мест.")
+    place_id = pick(conn, "Places")
+    if place_id is None:
         return
-    print("\nНазвания мест:")
-    for i, name in enumerate(names, 1):
-        print(f"{i}. {name}")
-    choice = input("Введите номер или название: ")
     try:
-        name = names[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(names) else choice
-        cursor = conn.execute("DELETE FROM Places WHERE name = ?", (name,))
+        count = delete_row(conn, "places", place_id)
         conn.commit()
-        print("Место удалено." if cursor.rowcount else "Место не найдено.")
+        print("Место удалено." if count else "Место не найдено.")
+    except Exception as e:
+        conn.rollback()
+        print(f"Ошибка: {e}")
+
+def places_nearby(conn):
+    """Ищет места рядом с точкой: в заданном радиусе или ближайшие."""
+    lat = validate_float(input("> Широта: "), "Широта")
+    if lat is None:
+        return
+    lon = validate_float(input("> Долгота: "), "Долгота")
+    if lon is None:
+        return
+    radius = input(f"> Радиус, км (Enter - {NEAREST_LIMIT} ближайших): ")
+    try:
+        if radius:
+            radius = validate_float(radius, "Радиус")
+            if radius is None:
+                return
+            rows = places_within(conn, lat, lon, radius)
+        else:
+            rows = nearest_places(conn, lat, lon)
+        if not rows:
+            print("Мест не найдено.")
+        for distance, _, name, place_lat, place_lon in rows:
+            print(f"{distance:.1f} км: {name} ({place_lat}, {place_lon})")
     except Exception as e:
         print(f"Ошибка: {e}")
 
@@ -784,13 +2332,7 @@ def interactions_list_all(conn):
     """Показывает все взаимодействия, сортируя по описанию."""
     print("\nВзаимодействия:")
     try:
-        cursor = conn.execute("SELECT PeopleInteractions.description, Persons.surname, Sources.title FROM PeopleInteractions JOIN Persons ON PeopleInteractions.person_id = Persons.id LEFT JOIN Sources ON PeopleInteractions.resource_id = Sources.id ORDER BY PeopleInteractions.description")
-        rows = cursor.fetchall()
-        if not rows:
-            print("Нет взаимодействий.")
-        for row in rows:
-            source = row[2] if row[2] else "Источник не найден"
-            print(f"Описание: {row[0] or 'Не указано'}, Персона: {row[1]}, Источник: {source}")
+        show_list(conn, "interactions", "Нет взаимодействий.")
     except Exception as e:
         print(f"Ошибка: {e}")
 
@@ -798,60 +2340,116 @@ def interactions_add(conn):
     """Добавляет взаимодействие."""
     print("\nНовое взаимодействие")
     description = input("> Описание (Enter, если нет): ") or None
-    cursor = conn.execute("SELECT surname FROM Persons ORDER BY surname")
-    surnames = [row[0] for row in cursor.fetchall()]
-    if not surnames:
-        print("Нет персон.")
+    print("\nПерсона")
+    person_id = pick(conn, "Persons")
+    if person_id is None:
         return
-    print("\nПерсоны:")
-    for i, surname in enumerate(surnames, 1):
-        print(f"{i}. {surname}")
-    person_choice = input("Введите номер или фамилию: ")
-    cursor = conn.execute("SELECT title FROM Sources ORDER BY title")
-    titles = [row[0] for row in cursor.fetchall()]
-    if not titles:
-        print("Нет источников.")
+    print("\nИсточник")
+    resource_id = pick(conn, "Sources")
+    if resource_id is None:
         return
-    print("\nИсточники:")
-    for i, title in enumerate(titles, 1):
-        print(f"{i}. {title}")
-    source_choice = input("Введите номер или название источника: ")
     try:
-        surname = surnames[int(person_choice) - 1] if person_choice.isdigit() and 1 <= int(person_choice) <= len(surnames) else person_choice
-        cursor = conn.execute("SELECT id FROM Persons WHERE surname = ?", (surname,))
-        person = cursor.fetchone()
-        if not person:
-            print("Персона не найдена.")
-            return
-        title = titles[int(source_choice) - 1] if source_choice.isdigit() and 1 <= int(source_choice) <= len(titles) else source_choice
-        cursor = conn.execute("SELECT id FROM Sources WHERE title = ?", (title,))
-        src = cursor.fetchone()
-        if not src:
-            print("Источник не найден.")
-            return
-        conn.execute("INSERT INTO PeopleInteractions (description, resource_id, person_id) VALUES (?, ?, ?)", 
-                     (description, src[0], person[0]))
+        insert_row(conn, "interactions", {"description": description, "resource_id": resource_id, "person_id": person_id})
         conn.commit()
         print("Взаимодействие добавлено.")
     except Exception as e:
+        conn.rollback()
         print(f"Ошибка: {e}")
 
 def interactions_delete(conn):
     """Удаляет взаимодействие."""
-    cursor = conn.execute("SELECT description FROM PeopleInteractions WHERE description IS NOT NULL ORDER BY description")
-    descriptions = [row[0] for row in cursor.fetchall()]
-    if not descriptions:
-        print("Нет взаимодействий с описаниями.")
+    interaction_id = pick(conn, "PeopleInteractions")
+    if interaction_id is None:
         return
-    print("\nОписания взаимодействий:")
-    for i, desc in enumerate(descriptions, 1):
-        print(f"{i}. {desc}")
-    choice = input("Введите номер или описание: ")
     try:
-        desc = descriptions[int(choice) - 1] if choice.isdigit() and 1 <= int(choice) <= len(descriptions) else choice
-        cursor = conn.execute("DELETE FROM PeopleInteractions WHERE description = ?", (desc,))
+        count = delete_row(conn, "interactions", interaction_id)
         conn.commit()
-        print("Взаимодействие удалено." if cursor.rowcount else "Взаимодействие не найдено.")
+        print("Взаимодействие удалено." if count else "Взаимодействие не найдено.")
+    except Exception as e:
+        conn.rollback()
+        print(f"Ошибка: {e}")
+
+def person_title(conn, person_id):
+    """Фамилия и имя персоны для вывода."""
+    row = get_row(conn, "persons", person_id)
+    return view_record("persons", row).title() if row else f"Персона не найдена (id {person_id})"
+
+def source_title(conn, source_id):
+    row = get_row(conn, "sources", source_id)
+    return view_record("sources", row).title if row else "Источник не найден"
+
+def interactions_neighbours(conn):
+    """Показывает персон, связанных с выбранной общими источниками."""
+    print("\nПерсона")
+    person_id = pick(conn, "Persons")
+    if person_id is None:
+        return
+    try:
+        graph = person_graph(conn)
+        rows = graph.neighbours(person_id, NEIGHBOURS_LIMIT)
+        if not rows:
+            print("Связанных персон нет.")
+            return
+        print(f"\nСвязи: {person_title(conn, person_id)}")
+        for other_id, count in rows:
+            print(f"{person_title(conn, other_id)}, общих источников: {count}")
+    except Exception as e:
+        print(f"Ошибка: {e}")
+
+def interactions_path(conn):
+    """Показывает кратчайшую цепочку связей между двумя персонами."""
+    print("\nОт персоны")
+    from_id = pick(conn, "Persons")
+    if from_id is None:
+        return
+    print("\nК персоне")
+    to_id = pick(conn, "Persons")
+    if to_id is None:
+        return
+    try:
+        path = person_graph(conn).shortest_path(from_id, to_id)
+        if path is None:
+            print("Персоны не связаны.")
+            return
+        print(f"\nЦепочка ({len(path) // 2} шаг.):")
+        for i, node_id in enumerate(path):
+            print(person_title(conn, node_id) if i % 2 == 0 else f"  через «{source_title(conn, node_id)}»")
+    except Exception as e:
+        print(f"Ошибка: {e}")
+
+def interactions_groups(conn):
+    """Показывает группы персон, связанных друг с другом через общие источники."""
+    try:
+        groups = person_graph(conn).components()
+        if not groups:
+            print("Нет взаимодействий.")
+            return
+        print(f"\nГрупп: {len(groups)}, персон во взаимодействиях: {sum(map(len, groups))}")
+        for number, group in enumerate(groups[:10], 1):
+            names = ", ".join(person_title(conn, person_id) for person_id in group[:5])
+            print(f"{number}. {len(group)} чел.: {names}{', ...' if len(group) > 5 else ''}")
+    except Exception as e:
+        print(f"Ошибка: {e}")
+
+# --- Резервная копия ---
+
+def backup_now(conn):
+    """Снимает резервную копию в фоне (backup.py): меню не ждёт её. Повторный выбор показывает ход или итог."""
+    import backup  # Здесь, а не в начале файла: backup сам импортирует этот модуль
+    try:
+        job = backup.current_job
+        if job is not None and job.is_alive():
+            print(job.describe())
+            return
+        if job is not None:
+            print(f"Предыдущая: {job.describe()}")
+        path = database_path(conn)
+        if path is None:
+            print("База в памяти: копировать нечего.")
+            return
+        directory = input(f"Каталог для копий [{backup.BACKUP_DIR}]: ").strip() or backup.BACKUP_DIR
+        backup.start_backup(path, directory)
+        print("Копия снимается в фоне; выберите пункт ещё раз, чтобы узнать, как идёт.")
     except Exception as e:
         print(f"Ошибка: {e}")
 
@@ -866,6 +2464,7 @@ def sources_menu(conn):
         print("3. Добавить")
         print("4. Обновить")
         print("5. Удалить")
+        print("6. Самые цитируемые")
         print("0. Назад")
         choice = input("> ")
         if choice == "0":
@@ -880,8 +2479,10 @@ def sources_menu(conn):
             sources_update(conn)
         elif choice == "5":
             sources_delete(conn)
+        elif choice == "6":
+            sources_most_cited(conn)
         else:
-            print("Выберите 0-5.")
+            print("Выберите 0-6.")
 
 def coordinates_menu(conn):
     """Меню для Coordinates."""
@@ -996,6 +2597,7 @@ def places_menu(conn):
         print("3. Добавить")
         print("4. Обновить")
         print("5. Удалить")
+        print("6. Места рядом с точкой")
         print("0. Назад")
         choice = input("> ")
         if choice == "0":
@@ -1010,8 +2612,10 @@ def places_menu(conn):
             places_update(conn)
         elif choice == "5":
             places_delete(conn)
+        elif choice == "6":
+            places_nearby(conn)
         else:
-            print("Выберите 0-5.")
+            print("Выберите 0-6.")
 
 def interactions_menu(conn):
     """Меню для PeopleInteractions."""
@@ -1020,6 +2624,9 @@ def interactions_menu(conn):
         print("1. Показать все")
         print("2. Добавить")
         print("3. Удалить")
+        print("4. Связи персоны")
+        print("5. Цепочка между персонами")
+        print("6. Группы связанных персон")
         print("0. Назад")
         choice = input("> ")
         if choice == "0":
@@ -1030,12 +2637,18 @@ def interactions_menu(conn):
             interactions_add(conn)
         elif choice == "3":
             interactions_delete(conn)
+        elif choice == "4":
+            interactions_neighbours(conn)
+        elif choice == "5":
+            interactions_path(conn)
+        elif choice == "6":
+            interactions_groups(conn)
         else:
-            print("Выберите 0-3.")
+            print("Выберите 0-6.")
 
-def main_menu():
+def main_menu(db_name=None, profile=None):
     """Главное меню."""
-    with get_connection() as conn:
+    with get_connection(db_name, profile) as conn:
         while True:
             print("\nМеню")
             print("1. Источники")
@@ -1045,6 +2658,8 @@ def main_menu():
             print("5. Тексты")
             print("6. Места")
             print("7. Взаимодействия")
+            print("8. Полнотекстовый поиск")
+            print("9. Резервная копия")
             print("0. Выход")
             choice = input("> ")
             if choice == "0":
@@ -1064,8 +2679,31 @@ def main_menu():
                 places_menu(conn)
             elif choice == "7":
                 interactions_menu(conn)
+            elif choice == "8":
+                full_text_search(conn)
+            elif choice == "9":
+                backup_now(conn)
             else:
-                print("Выберите 0-7.")
+                print("Выберите 0-9.")
+
+def main():
+    """Разбирает параметры командной строки и запускает меню."""
+    parser = argparse.ArgumentParser(description="Курсовая база KKurs.")
+    parser.add_argument("--db", default=DB_NAME, help="путь к базе данных (или переменная окружения KKURS_DB)")
+    parser.add_argument("--profile", choices=sorted(PRAGMA_PROFILES), default=PRAGMA_PROFILE,
+                        help="набор PRAGMA при подключении (или KKURS_PRAGMA_PROFILE)")
+    parser.add_argument("--query-report", action="store_true",
+                        help="замерять запросы и после выхода показать самые долгие (см. KKURS_SLOW_QUERY_MS)")
+    args = parser.parse_args()
+    if args.query_report:
+        global QUERY_STATS
+        QUERY_STATS = True
+    main_menu(args.db, args.profile)
+    if args.query_report:
+        print(query_stats.report())
+        if query_stats.slow:
+            print(f"\nМедленные запросы (дольше {query_stats.slow_ms:g} мс):")
+            print("\n".join(query_stats.slow))
 
 if __name__ == "__main__":
-    main_menu()
\ No newline at end of file
+    main()
\ No newline at end of file
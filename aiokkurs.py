@@ -0,0 +1,234 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import Soshina_1 as kkurs
+
+# Асинхронный доступ к KKurs в духе aiosqlite: у базы один поток-исполнитель со своим подключением, все
+# запросы идут в нём по очереди, а корутины только ждут результат, не блокируя цикл событий. Одинаковые
+# чтения, запрошенные одновременно, объединяются: запрос выполняется один раз, результат получают все.
+# Отмена корутины снимает её запрос с очереди, а если он уже выполняется - прерывает его (interrupt).
+
+class Job:
+    """Запрос в потоке базы и корутины, которые ждут его результат."""
+
+    def __init__(self, future, token):
+        self.future = future  # asyncio.Future результата
+        self.token = token  # По нему поток базы отмечает, какое задание выполняет
+        self.waiters = 0
+
+class Database:
+    """Асинхронная база KKurs: репозитории таблиц в атрибутах (db.sources, db.events, ...), см. REPOSITORIES.
+
+    Использовать из одного цикла событий: async with Database(путь) as db: ... . Записи выполняются в том
+    же потоке, что и чтения, и фиксируются каждая сразу (commit), как в меню.
+    """
+
+    def __init__(self, db_name=None, profile=None, coalesce=True):
+        self.db_name = db_name or kkurs.DB_NAME
+        self.profile = profile
+        self.coalesce = coalesce
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kkurs-async")
+        self.conn = None  # Создаётся и используется только в потоке исполнителя
+        self.lock = threading.Lock()
+        self.current = None  # Задание, которое сейчас выполняется в потоке
+        self.pending = {}  # Ключ чтения -> Job, который ещё выполняется
+        self.stats = {"queries": 0, "coalesced": 0, "cancelled": 0, "interrupted": 0}
+        for name, repository in REPOSITORIES.items():
+            setattr(self, name, repository(self))
+
+    async def __aenter__(self):
+        await self.read(None, lambda conn: None)  # Подключение и миграции - сразу, чтобы ошибки были здесь
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        """Закрывает подключение в его потоке и останавливает поток."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self._close)
+        self.executor.shutdown(wait=True)
+
+    def _close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def _run(self, token, func, args, write):
+        """Выполняется в потоке базы."""
+        with self.lock:
+            self.current = token
+        try:
+            if self.conn is None:
+                self.conn = kkurs.get_connection(self.db_name, self.profile)
+            try:
+                result = func(self.conn, *args)
+                if write:
+                    self.conn.commit()
+                return result
+            except BaseException:
+                if self.conn.in_transaction:
+                    self.conn.rollback()
+                raise
+        finally:
+            with self.lock:
+                self.current = None
+
+    def _start(self, func, args, write):
+        token = object()
+        future = asyncio.wrap_future(self.executor.submit(self._run, token, func, args, write))
+        job = Job(future, token)
+        self.stats["queries"] += 1
+        return job
+
+    def _cancel(self, job):
+        """Последняя ждавшая корутина отменена: снимает запрос с очереди или прерывает выполняющийся."""
+        self.stats["cancelled"] += 1
+        job.future.cancel()  # Отменяет и concurrent.futures.Future, если запрос ещё не начался
+        with self.lock:
+            if self.current is job.token:
+                self.conn.interrupt()
+                self.stats["interrupted"] += 1
+
+    async def _wait(self, job):
+        job.waiters += 1
+        try:
+            return await asyncio.shield(job.future)
+        except asyncio.CancelledError:
+            job.waiters -= 1
+            if job.waiters == 0 and not job.future.done():
+                self._cancel(job)
+            raise
+
+    async def read(self, key, func, *args):
+        """Выполняет чтение func(conn, *args) в потоке базы.
+
+        key - ключ объединения: пока выполняется чтение с тем же ключом, новое не запускается, а ждёт его
+        результат (None - не объединять). Результат общий, поэтому менять его нельзя.
+        """
+        job = self.pending.get(key) if self.coalesce and key is not None else None
+        if job is not None:
+            self.stats["coalesced"] += 1
+        else:
+            job = self._start(func, args, write=False)
+            if self.coalesce and key is not None:
+                self.pending[key] = job
+                job.future.add_done_callback(lambda _: self.pending.pop(key, None) if self.pending.get(key) is job else None)
+        return await self._wait(job)
+
+    async def write(self, func, *args):
+        """Выполняет запись func(conn, *args) в потоке базы и фиксирует её (при ошибке - откат).
+
+        Чтения, начатые до записи, больше ни к чему не присоединяются: запрошенное после записи чтение
+        должно её видеть. Отменённая запись, которая уже успела зафиксироваться, не откатывается.
+        """
+        self.pending.clear()
+        return await self._wait(self._start(func, args, write=True))
+
+    async def search(self, text, limit=kkurs.FTS_LIMIT):
+        """Полнотекстовый поиск по всем таблицам (kkurs.search_text)."""
+        return await self.read(("search", text, limit), kkurs.search_text, text, limit)
+
+# --- Репозитории ---
+
+class Repository:
+    """Операции меню над одной таблицей как корутины. Строки - как у kkurs.list_page и kkurs.get_row."""
+    view = None
+
+    def __init__(self, db):
+        self.db = db
+        self.table = kkurs.TABLES[self.view][0]
+
+    async def page(self, limit=None, after=None):
+        """Страница списка: (строки, позиция следующей страницы или None)."""
+        return await self.db.read((self.view, "page", limit, after), kkurs.list_page, self.view, limit, after)
+
+    async def pages(self, batch=kkurs.FETCH_BATCH):
+        """Список страницами по batch строк: async for rows in repo.pages(). Следующая страница читается,
+        пока обрабатывается текущая; если перебор прервать, её чтение отменяется."""
+        request = asyncio.ensure_future(self.page(batch))
+        try:
+            while request is not None:
+                rows, after = await request
+                request = asyncio.ensure_future(self.page(batch, after)) if after is not None else None
+                yield rows
+        finally:
+            if request is not None:
+                request.cancel()
+
+    async def rows(self, batch=kkurs.FETCH_BATCH):
+        """Все строки списка по порядку: async for row in repo.rows() (по строке дороже, чем pages)."""
+        async for rows in self.pages(batch):
+            for row in rows:
+                yield row
+
+    async def get(self, row_id):
+        """Одна строка по id или None."""
+        return await self.db.read((self.view, "get", row_id), kkurs.get_row, self.view, row_id)
+
+    async def search(self, text, limit=kkurs.PICK_LIMIT):
+        """Поиск по началу или части названия: строки (id, показ, значение), как у kkurs.find_matches."""
+        return await self.db.read((self.view, "search", text, limit), kkurs.find_matches, self.table, text, limit)
+
+    async def add(self, **values):
+        """Добавляет строку; возвращает её id."""
+        return await self.db.write(kkurs.insert_row, self.view, values)
+
+    async def update(self, row_id, **values):
+        """Меняет переданные поля; возвращает число найденных строк."""
+        return await self.db.write(kkurs.update_row, self.view, row_id, values)
+
+    async def delete(self, row_id):
+        """Удаляет строку (ссылки на неё - по kkurs.integrity_modes); возвращает число удалённых строк."""
+        return await self.db.write(kkurs.delete_row, self.view, row_id)
+
+class Sources(Repository):
+    view = "sources"
+
+    async def most_cited(self, limit=kkurs.CITED_LIMIT):
+        return await self.db.read(("sources", "cited", limit), kkurs.most_cited_sources, limit)
+
+    async def usage(self, source_id):
+        return await self.db.read(("sources", "usage", source_id), kkurs.source_usage, source_id)
+
+class Coordinates(Repository):
+    view = "coordinates"
+
+class Persons(Repository):
+    view = "persons"
+
+class Events(Repository):
+    view = "events"
+
+class Tex(Repository):
+    view = "texts"
+
+class Places(Repository):
+    view = "places"
+
+    async def within(self, lat, lon, radius_km):
+        return await self.db.read(("places", "within", lat, lon, radius_km), kkurs.places_within, lat, lon, radius_km)
+
+    async def nearest(self, lat, lon, k=kkurs.NEAREST_LIMIT):
+        return await self.db.read(("places", "nearest", lat, lon, k), kkurs.nearest_places, lat, lon, k)
+
+class PeopleInteractions(Repository):
+    """Взаимодействия; граф персон подключения сбрасывают сами insert_row, update_row и delete_row."""
+    view = "interactions"
+
+    async def path(self, from_id, to_id):
+        """Кратчайшая цепочка персона - источник - персона ... или None (см. PersonGraph.shortest_path)."""
+        return await self.db.read(("interactions", "path", from_id, to_id),
+                                  lambda conn: kkurs.person_graph(conn).shortest_path(from_id, to_id))
+
+# Атрибут Database -> класс репозитория
+REPOSITORIES = {
+    "sources": Sources,
+    "coordinates": Coordinates,
+    "persons": Persons,
+    "events": Events,
+    "texts": Tex,
+    "places": Places,
+    "interactions": PeopleInteractions,
+}
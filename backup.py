@@ -0,0 +1,296 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import Soshina_1 as kkurs
+
+BACKUP_DIR = os.environ.get("KKURS_BACKUP_DIR", "backups")  # Каталог для копий по умолчанию
+BACKUP_PAGES = 1024  # Страниц за шаг sqlite3 backup: между шагами писатели не ждут копию
+BACKUP_PAUSE = 0.0  # Пауза между шагами, с: замедляет копию, но оставляет больше времени писателям
+BACKUP_KEEP = 7  # Сколько последних копий хранить при ротации (0 - не удалять)
+COMPRESS_LEVEL = 1  # Уровень gzip для --compress: 6 жмёт на ~15% плотнее, но в 4-5 раз медленнее
+CHUNK = 1024 * 1024  # Кусок файла при сжатии и подсчёте контрольной суммы
+
+# Имя копии: <имя базы>-ГГГГММДД-ЧЧММСС.db[.gz]; рядом <копия>.sha256 в формате sha256sum
+BACKUP_NAME = re.compile(r"(?P<stem>.+)-(?P<stamp>\d{8}-\d{6})\.db(\.gz)?")
+
+# Копия снимается через sqlite3 backup по BACKUP_PAGES страниц за шаг. Если база в режиме WAL, на всё
+# время копии держится транзакция чтения: копия соответствует одному моменту, а писатели из других
+# подключений её не перезапускают (без этого каждая их запись начинает копию заново) и не ждут её -
+# в WAL читатель писателя не блокирует. В обычном журнале каждый шаг ненадолго берёт блокировку
+# на чтение, а изменение базы между шагами перезапускает копию (restarts в итогах).
+
+def sha256_file(path):
+    """Контрольная сумма файла (шестнадцатеричная строка)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def write_checksum(path, checksum):
+    """Пишет <path>.sha256 строкой "сумма  имя" - её понимает и sha256sum -c."""
+    with open(path + ".sha256", "w", encoding="utf-8") as f:
+        f.write(f"{checksum}  {os.path.basename(path)}\n")
+
+def read_checksum(path):
+    """Сумма из <path>.sha256 или None, если файла нет."""
+    try:
+        with open(path + ".sha256", encoding="utf-8") as f:
+            return f.read().split()[0]
+    except FileNotFoundError:
+        return None
+
+def compress_file(path, target, level=COMPRESS_LEVEL):
+    """Сжимает path в target (gzip) и удаляет path."""
+    with open(path, "rb") as src, gzip.open(target, "wb", compresslevel=level) as dst:
+        shutil.copyfileobj(src, dst, CHUNK)
+    os.remove(path)
+
+def copy_database(db_name, target, pages=BACKUP_PAGES, pause=BACKUP_PAUSE, progress=None):
+    """Копирует базу db_name в файл target через sqlite3 backup; возвращает словарь с итогами копирования.
+
+    progress(скопировано страниц, всего страниц, секунд) вызывается после каждого шага. В итогах:
+    pages, page_size, steps, restarts (сколько раз копия начиналась заново), snapshot (копия одного момента).
+    """
+    src = sqlite3.connect(db_name, isolation_level=None)
+    dst = sqlite3.connect(target)
+    result = {"pages": 0, "page_size": 0, "steps": 0, "restarts": 0, "snapshot": False}
+    start = time.perf_counter()
+    remaining_before = None
+
+    def step(status, remaining, total):
+        nonlocal remaining_before
+        result["steps"] += 1
+        if remaining_before is not None and remaining >= remaining_before:
+            result["restarts"] += 1
+        remaining_before = remaining
+        result["pages"] = total
+        if progress:
+            progress(total - remaining, total, time.perf_counter() - start)
+        if pause and remaining:
+            time.sleep(pause)
+
+    try:
+        if src.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+            src.execute("BEGIN")
+            src.execute("SELECT count(*) FROM sqlite_master").fetchone()  # Здесь транзакция чтения и начинается
+            result["snapshot"] = True
+        src.backup(dst, pages=pages, progress=step)
+        result["page_size"] = dst.execute("PRAGMA page_size").fetchone()[0]
+        # Копия - один файл, без -wal и -shm рядом
+        dst.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        dst.close()
+        src.close()
+    result["copy_seconds"] = time.perf_counter() - start
+    return result
+
+def check_database(path):
+    """PRAGMA quick_check копии: None, если всё в порядке, иначе текст ошибки."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        problems = [row[0] for row in conn.execute("PRAGMA quick_check")]
+    finally:
+        conn.close()
+    return None if problems == ["ok"] else "; ".join(problems[:5])
+
+def backup_files(directory, stem=None):
+    """Копии в каталоге (только с именами по BACKUP_NAME), от старых к новым."""
+    if not os.path.isdir(directory):
+        return []
+    found = []
+    for name in os.listdir(directory):
+        match = BACKUP_NAME.fullmatch(name)
+        if match and (stem is None or match.group("stem") == stem):
+            found.append((match.group("stamp"), name))
+    return [os.path.join(directory, name) for _, name in sorted(found)]
+
+def rotate(directory, stem, keep=BACKUP_KEEP):
+    """Удаляет старые копии базы stem, оставляя keep последних; возвращает удалённые файлы."""
+    if keep <= 0:
+        return []
+    removed = backup_files(directory, stem)[:-keep]
+    for path in removed:
+        os.remove(path)
+        if os.path.exists(path + ".sha256"):
+            os.remove(path + ".sha256")
+    return removed
+
+def backup_database(db_name, directory=BACKUP_DIR, pages=BACKUP_PAGES, pause=BACKUP_PAUSE, compress=False,
+                    verify=True, keep=BACKUP_KEEP, progress=None, level=COMPRESS_LEVEL):
+    """Снимает копию базы db_name в каталог directory; возвращает словарь с итогами.
+
+    Копия пишется во временный файл и получает своё имя, только когда готова (и проверена, если verify):
+    недописанная копия никогда не выглядит настоящей. Затем - сжатие, контрольная сумма и ротация.
+    """
+    start = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(db_name))[0]
+    name = f"{stem}-{time.strftime('%Y%m%d-%H%M%S')}.db"
+    path = os.path.join(directory, name + (".gz" if compress else ""))
+    if os.path.exists(path):
+        raise ValueError(f"копия {path} уже есть: не чаще одной в секунду")
+    fd, part = tempfile.mkstemp(prefix=name + ".", suffix=".part", dir=directory)
+    os.close(fd)
+    try:
+        result = copy_database(db_name, part, pages, pause, progress)
+        result["bytes"] = os.path.getsize(part)
+        if verify:
+            error = check_database(part)
+            if error:
+                raise ValueError(f"копия не прошла проверку: {error}")
+        if compress:
+            compress_file(part, part + ".gz", level)
+            part += ".gz"
+        checksum = sha256_file(part)
+        os.replace(part, path)
+    except BaseException:
+        for leftover in (part, part + ".gz"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+    write_checksum(path, checksum)
+    result.update(file=path, stored_bytes=os.path.getsize(path), sha256=checksum, verified=verify,
+                  removed=rotate(directory, stem, keep), seconds=time.perf_counter() - start)
+    result["mb_per_s"] = result["bytes"] / 2**20 / result["copy_seconds"] if result["copy_seconds"] else 0.0
+    return result
+
+def verify_backup(path):
+    """Проверяет копию: контрольную сумму по <path>.sha256 и целостность базы (сжатая распаковывается во
+    временный файл). Возвращает None, если всё в порядке, иначе текст ошибки."""
+    expected = read_checksum(path)
+    if expected is None:
+        return f"нет файла {path}.sha256"
+    if sha256_file(path) != expected:
+        return "контрольная сумма не совпадает"
+    if not path.endswith(".gz"):
+        return check_database(path)
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = os.path.join(tmp, "check.db")
+        with gzip.open(path, "rb") as src, open(plain, "wb") as dst:
+            shutil.copyfileobj(src, dst, CHUNK)
+        return check_database(plain)
+
+# --- Копия в фоне ---
+
+class BackupJob(threading.Thread):
+    """backup_database в отдельном потоке: меню продолжает работать, пока копия снимается.
+
+    У потока своё подключение к базе, ход копии - в progress (скопировано, всего страниц, секунд),
+    итог - в result или error (любая ошибка копии, не только ожидаемые). Поток не фоновый (daemon): при выходе из программы копия дописывается.
+    """
+
+    def __init__(self, db_name, directory=BACKUP_DIR, **options):
+        super().__init__(name="kkurs-backup")
+        self.db_name = db_name
+        self.directory = directory
+        self.options = options
+        self.progress = (0, 0, 0.0)
+        self.result = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.result = backup_database(self.db_name, self.directory, progress=self.set_progress, **self.options)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            self.error = e
+        except Exception as e:
+            # Поток - последнее место, где можно поймать ошибку: иначе describe навсегда покажет "снимается"
+            self.error = RuntimeError(f"непредвиденная ошибка {type(e).__name__}: {e}")
+            self.error.__cause__ = e
+
+    def set_progress(self, copied, total, seconds):
+        self.progress = (copied, total, seconds)
+
+    def describe(self):
+        """Строка о ходе или итоге копии для меню."""
+        if self.error is not None:
+            return f"Копия не снята: {self.error}"
+        if self.result is not None:
+            return describe_result(self.result)
+        copied, total, seconds = self.progress
+        return f"Копия снимается: {copied:,} из {total:,} страниц ({copied / total:.0%}), {seconds:.1f} с" if total \
+            else "Копия снимается: подготовка."
+
+current_job = None  # Последняя копия, запущенная из меню
+
+def start_backup(db_name, directory=BACKUP_DIR, **options):
+    """Запускает BackupJob, если предыдущая копия уже закончилась; возвращает текущую копию."""
+    global current_job
+    if current_job is None or not current_job.is_alive():
+        current_job = BackupJob(db_name, directory, **options)
+        current_job.start()
+    return current_job
+
+def describe_result(result):
+    """Итоги backup_database одной строкой."""
+    text = (f"Копия {result['file']}: {result['pages']:,} страниц, {result['bytes'] / 2**20:.1f} МБ "
+            f"за {result['copy_seconds']:.2f} с ({result['mb_per_s']:.0f} МБ/с)")
+    if result["stored_bytes"] != result["bytes"]:
+        text += f", сжато до {result['stored_bytes'] / 2**20:.1f} МБ"
+    if result["restarts"]:
+        text += f", перезапусков: {result['restarts']}"
+    if result["removed"]:
+        text += f", удалено старых копий: {len(result['removed'])}"
+    return text
+
+def main():
+    parser = argparse.ArgumentParser(description="Резервные копии KKurs без остановки работы с базой.")
+    parser.add_argument("--db", default=kkurs.DB_NAME, help="путь к базе данных")
+    parser.add_argument("--dir", default=BACKUP_DIR, help="каталог копий (или KKURS_BACKUP_DIR)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("create", help="снять копию")
+    command.add_argument("--pages", type=int, default=BACKUP_PAGES, help="страниц за шаг (-1 - всё за один шаг)")
+    command.add_argument("--pause", type=float, default=BACKUP_PAUSE, help="пауза между шагами, с")
+    command.add_argument("--compress", action="store_true", help="сжать копию gzip")
+    command.add_argument("--level", type=int, choices=range(1, 10), default=COMPRESS_LEVEL, metavar="1-9",
+                         help="уровень сжатия gzip")
+    command.add_argument("--no-verify", action="store_true", help="не проверять копию (PRAGMA quick_check)")
+    command.add_argument("--keep", type=int, default=BACKUP_KEEP, help="сколько последних копий хранить (0 - все)")
+    command.add_argument("--json", action="store_true", help="итоги одним JSON-объектом")
+    command = commands.add_parser("verify", help="проверить контрольную сумму и целостность копий")
+    command.add_argument("files", nargs="*", help="файлы копий (по умолчанию - все в каталоге)")
+    commands.add_parser("list", help="копии в каталоге")
+    args = parser.parse_args()
+    try:
+        if args.command == "create":
+            if not os.path.exists(args.db):
+                sys.exit(f"Ошибка: база {args.db} не найдена.")
+
+            def show(copied, total, seconds):
+                if not args.json and sys.stderr.isatty():
+                    print(f"\r{copied:,} из {total:,} страниц ({copied / total:.0%}), {seconds:.1f} с",
+                          end="", file=sys.stderr)
+
+            result = backup_database(args.db, args.dir, args.pages, args.pause, args.compress, not args.no_verify,
+                                     args.keep, show, args.level)
+            if not args.json and sys.stderr.isatty():
+                print(file=sys.stderr)
+            print(json.dumps(result, ensure_ascii=False) if args.json else describe_result(result))
+        elif args.command == "verify":
+            files = args.files or backup_files(args.dir)
+            failed = 0
+            for path in files:
+                error = verify_backup(path)
+                failed += error is not None
+                print(f"{path}: {error or 'ok'}")
+            if failed:
+                sys.exit(f"Ошибка: не прошли проверку {failed} из {len(files)}.")
+        else:
+            for path in backup_files(args.dir):
+                print(f"{path}\t{os.path.getsize(path) / 2**20:.1f} МБ\t{'sha256' if read_checksum(path) else 'без суммы'}")
+    except (OSError, ValueError, sqlite3.Error) as e:
+        sys.exit(f"Ошибка: {str(e).rstrip('.')}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,935 @@
+import argparse
+import asyncio
+import csv
+import io
+import itertools
+import os
+import random
+import shlex
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import Soshina_1 as kkurs
+import aiokkurs
+import backup
+import bulk
+import cli
+import datagen
+import exporter
+import importer
+import integrity
+import loadtest
+import pool
+import snapshot
+import sync
+import timeline
+
+def timed(func, repeat):
+    """Возвращает среднее время одного вызова func в секундах."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+# --- Бенчмарки ---
+
+def bench_indexes(rows, repeat):
+    """Поиск источника по названию до и после миграций с индексами."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        datagen.create_schema(conn)
+        datagen.fill_sources(conn, rows)
+        titles = [f"Источник {random.randrange(rows):08d}" for _ in range(repeat)]
+        query = "SELECT title, type, link, content, name FROM Sources WHERE title = ?"
+
+        def lookup_all():
+            for title in titles:
+                conn.execute(query, (title,)).fetchone()
+
+        before = timed(lookup_all, 1) / repeat
+        start = time.perf_counter()
+        kkurs.migrate(conn)
+        migrate_time = time.perf_counter() - start
+        after = timed(lookup_all, 1) / repeat
+        conn.close()
+    print(f"Строк в Sources: {rows}")
+    print(f"Без индекса: {before * 1000:.3f} мс на поиск")
+    print(f"Миграции: {migrate_time:.2f} с")
+    print(f"С индексом: {after * 1000:.3f} мс на поиск (ускорение в {before / after:.0f} раз)")
+
+def bench_paging(rows, repeat):
+    """Время до первой строки и стоимость глубокой страницы для events_list_all на rows событиях."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        datagen.create_schema(conn)
+        datagen.fill_sources(conn, max(rows // 100, 1))
+        datagen.fill_events(conn, rows, max(rows // 100, 1))
+        kkurs.migrate(conn)
+        columns = "Events.name, Events.data, Events.description, Sources.title"
+        source = "Events LEFT JOIN Sources ON Events.resource_id = Sources.id"
+        page = kkurs.PAGE_SIZE or 50
+
+        def fetchall_first():
+            conn.execute(f"SELECT {columns} FROM {source} ORDER BY Events.data").fetchall()[0]
+
+        def stream_first():
+            cursor = conn.execute(f"SELECT {columns} FROM {source} ORDER BY Events.data, Events.id")
+            next(kkurs.iter_rows(cursor))
+
+        def keyset_first():
+            next(kkurs.iter_keyset(conn, columns, source, "Events.data", "Events.id", page))
+
+        deep = conn.execute("SELECT data, id FROM Events ORDER BY data, id LIMIT 1 OFFSET ?", (rows * 9 // 10,)).fetchone()
+
+        def keyset_deep():
+            conn.execute(f"SELECT {columns}, Events.data, Events.id FROM {source} WHERE (Events.data, Events.id) > (?, ?) "
+                         "ORDER BY Events.data, Events.id LIMIT ?", deep + (page,)).fetchall()
+
+        def offset_deep():
+            conn.execute(f"SELECT {columns} FROM {source} ORDER BY Events.data, Events.id LIMIT ? OFFSET ?",
+                         (page, rows * 9 // 10)).fetchall()
+
+        results = [
+            ("fetchall, первая строка", timed(fetchall_first, 1)),
+            ("fetchmany, первая строка", timed(stream_first, repeat)),
+            ("keyset, первая страница", timed(keyset_first, repeat)),
+            ("keyset, страница на 90% глубины", timed(keyset_deep, repeat)),
+            ("OFFSET, страница на 90% глубины", timed(offset_deep, 3)),
+        ]
+        conn.close()
+    print(f"Строк в Events: {rows}, размер страницы: {page}")
+    for label, seconds in results:
+        print(f"{label}: {seconds * 1000:.3f} мс")
+
+def bench_fts(rows, repeat):
+    """Полнотекстовый поиск по Events.description через FTS5 против LIKE '%...%'."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        datagen.create_schema(conn)
+        datagen.fill_sources(conn, 1000)
+        datagen.fill_events(conn, rows, 1000, descriptions=True)
+        start = time.perf_counter()
+        kkurs.migrate(conn)
+        index_time = time.perf_counter() - start
+        # Уникальная пара слов в одной строке: LIKE обходит всю таблицу, FTS находит её по индексу
+        conn.execute("UPDATE Events SET description = description || ' кракозябра Тютчеву' WHERE id = ?", (rows // 2,))
+        conn.commit()
+
+        def like():
+            conn.execute("SELECT id FROM Events WHERE description LIKE ? LIMIT 20", ("%кракозябр%",)).fetchall()
+
+        def fts():
+            kkurs.search_text(conn, "кракозябры Тютчева")
+
+        def fts_common():
+            kkurs.search_text(conn, "Шеллинга Мюнхен")
+
+        results = [
+            ("LIKE '%...%'", timed(like, 3)),
+            ("FTS5, редкие слова", timed(fts, repeat)),
+            ("FTS5, частые слова, топ-20 по bm25", timed(fts_common, 3)),
+        ]
+        conn.close()
+    print(f"Строк в Events: {rows}, построение индексов: {index_time:.1f} с")
+    for label, seconds in results:
+        print(f"{label}: {seconds * 1000:.3f} мс")
+
+def bench_import(rows, repeat):
+    """Скорость пакетной загрузки CSV в Coordinates и в Events (со ссылками на источники и FTS-триггерами)."""
+    rnd = random.Random(rows)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        datagen.create_schema(conn)
+        datagen.fill_sources(conn, 1000)
+        kkurs.migrate(conn)
+        coordinates_csv = os.path.join(tmp, "coordinates.csv")
+        with open(coordinates_csv, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("latitude", "longitude", "name"))
+            writer.writerows((f"{rnd.uniform(-90, 90):.6f}", f"{rnd.uniform(-180, 180):.6f}", f"Точка {i}")
+                             for i in range(rows))
+        events_csv = os.path.join(tmp, "events.csv")
+        with open(events_csv, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(("name", "data", "description", "source"))
+            writer.writerows((f"Событие {i}", f"{rnd.randint(1700, 2025)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+                              datagen.make_description(rnd), f"Источник {rnd.randrange(1000):08d}")
+                             for i in range(rows))
+        results = [
+            ("Coordinates", importer.import_file(conn, "Coordinates", coordinates_csv)),
+            ("Events", importer.import_file(conn, "Events", events_csv)),
+        ]
+        conn.close()
+    for table, stats in results:
+        print(f"{table}: {stats['inserted']} строк за {stats['seconds']:.1f} с "
+              f"({stats['inserted'] / stats['seconds']:,.0f} строк/с), отбраковано {stats['rejected']}")
+
+def bench_export(rows, repeat):
+    """Скорость потоковой выгрузки Events и events_list в JSONL и CSV."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        datagen.create_schema(conn)
+        datagen.fill_sources(conn, 1000)
+        datagen.fill_events(conn, rows, 1000, descriptions=True)
+        conn.close()
+        for fmt in ("jsonl", "csv"):
+            out_dir = os.path.join(tmp, fmt)
+            for name, count, seconds in exporter.export_all(path, out_dir, fmt, ["Events", "events_list"]):
+                size = os.path.getsize(os.path.join(out_dir, f"{name}.{fmt}")) / 2**20
+                print(f"{name}.{fmt}: {count} строк за {seconds:.1f} с ({count / seconds:,.0f} строк/с, {size / seconds:.0f} МБ/с)")
+
+def bench_pragmas(rows, repeat):
+    """Запись по строке с commit (как в меню) и чтение по названию для каждого профиля PRAGMA."""
+    for profile in kkurs.PRAGMA_PROFILES:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            conn = sqlite3.connect(path)
+            datagen.create_schema(conn)
+            datagen.fill_sources(conn, rows)
+            conn.close()
+            conn = kkurs.get_connection(path, profile)
+            writes = min(rows, 2000)
+            start = time.perf_counter()
+            for i in range(writes):
+                conn.execute("INSERT INTO Events (name, data, description, resource_id) VALUES (?, ?, ?, ?)",
+                             (f"Событие {i}", "1850-01-01", "Описание", i % rows + 1))
+                conn.commit()
+            write_rate = writes / (time.perf_counter() - start)
+            titles = [f"Источник {random.randrange(rows):08d}" for _ in range(repeat * 10)]
+            start = time.perf_counter()
+            for title in titles:
+                conn.execute("SELECT title, type, link, content, name FROM Sources WHERE title = ?", (title,)).fetchone()
+            read_latency = (time.perf_counter() - start) / len(titles)
+            conn.close()
+        print(f"{profile}: запись {write_rate:,.0f} транзакций/с, чтение {read_latency * 1e6:.1f} мкс на запрос")
+
+def bench_pool(rows, repeat):
+    """Пропускная способность чтений в стиле events_list_all из нескольких потоков через ConnectionPool."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        datagen.create_schema(conn)
+        datagen.fill_sources(conn, 1000)
+        datagen.fill_events(conn, rows, 1000)
+        conn.close()
+        columns, source, key, _ = kkurs.LIST_VIEWS["events"]
+        # Запрос почти целиком выполняется внутри SQLite, где sqlite3 отпускает GIL
+        sql = f"SELECT COUNT(*), MAX(source) FROM (SELECT {columns} FROM {source} WHERE {key} BETWEEN ? AND ?)"
+
+        def query(conn):
+            year = random.randint(1700, 2000)
+            return conn.execute(sql, (f"{year}", f"{year + 25}")).fetchone()
+
+        with pool.ConnectionPool(path, max_readers=8) as readers:
+            base = None
+            print(f"Ядер: {os.cpu_count()}")
+            for threads in (1, 2, 4, 8):
+                def worker():
+                    for _ in range(repeat):
+                        readers.read(query)
+                workers = [threading.Thread(target=worker) for _ in range(threads)]
+                start = time.perf_counter()
+                for thread in workers:
+                    thread.start()
+                for thread in workers:
+                    thread.join()
+                rate = threads * repeat / (time.perf_counter() - start)
+                base = base or rate
+                print(f"{threads} потоков: {rate:,.0f} запросов/с (x{rate / base:.1f})")
+            print(readers.metrics())
+
+def bench_service(rows, repeat):
+    """Задержки p50/p99 и запросы в секунду HTTP-сервиса при 100 и 200 одновременных клиентах (repeat - секунд на замер)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        datagen.create_schema(conn)
+        datagen.fill_sources(conn, 1000)
+        datagen.fill_events(conn, rows, 1000, descriptions=True)
+        conn.close()
+        for clients in (100, 200):
+            loadtest.report(asyncio.run(loadtest.self_hosted(path, clients, repeat, True, None)))
+
+def bench_cache(rows, repeat):
+    """Поиск источника, как в pick при добавлении событий: без кэша и с кэшем справочников (repeat * 10 поисков)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        datagen.create_schema(conn)
+        datagen.fill_sources(conn, rows)
+        conn.close()
+        conn = kkurs.get_connection(path)
+        rnd = random.Random(1)
+        # Пользователи чаще выбирают одни и те же источники: 80% запросов - к 50 популярным, остальные - к любым
+        popular = [f"Источник {rnd.randrange(rows):08d}" for _ in range(50)]
+        texts = [rnd.choice(popular) if rnd.random() < 0.8 else f"Источник {rnd.randrange(rows):08d}"
+                 for _ in range(repeat * 10)]
+        cache = kkurs.reference_cache
+        for size in (0, kkurs.CACHE_SIZE):
+            cache.max_size = size
+            cache.invalidate()
+            cache.hits = cache.misses = cache.evictions = 0
+            start = time.perf_counter()
+            for text in texts:
+                kkurs.find_matches(conn, "Sources", text)
+            per_call = (time.perf_counter() - start) / len(texts)
+            print(f"кэш {size:>5}: {per_call * 1e6:7.1f} мкс на поиск, {cache.stats()}")
+        cache.max_size = kkurs.CACHE_SIZE
+        conn.close()
+
+def bench_spatial(rows, repeat):
+    """Места в прямоугольнике, в радиусе и ближайшие: R*Tree против перебора всех точек в Python."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        datagen.create_schema(conn)
+        datagen.fill_places(conn, rows)
+        conn.close()
+        start = time.perf_counter()
+        conn = kkurs.get_connection(path)
+        print(f"Миграции (с построением R*Tree): {time.perf_counter() - start:.1f} с")
+        rnd = random.Random(2)
+        points = [(rnd.uniform(-60, 60), rnd.uniform(-170, 170)) for _ in range(repeat)]
+        found = []
+
+        def bbox():
+            lat, lon = rnd.choice(points)
+            found.append(len(kkurs.places_in_box(conn, lat, lat + 1, lon, lon + 1)))
+
+        def radius():
+            lat, lon = rnd.choice(points)
+            found.append(len(kkurs.places_within(conn, lat, lon, 100)))
+
+        def nearest():
+            lat, lon = rnd.choice(points)
+            found.append(len(kkurs.nearest_places(conn, lat, lon, 10)))
+
+        for label, func in (("прямоугольник 1x1 градус", bbox), ("радиус 100 км", radius), ("10 ближайших", nearest)):
+            found.clear()
+            seconds = timed(func, repeat)
+            print(f"{label}: {seconds * 1000:.3f} мс, в среднем найдено {sum(found) / len(found):.1f}")
+        # Для сравнения - то, что было возможно раньше: прочитать все точки и отобрать в Python
+        lat, lon = points[0]
+        start = time.perf_counter()
+        rows_all = conn.execute("SELECT Places.id, Places.name, latitude, longitude FROM Places "
+                                "JOIN Coordinates ON Places.coordinate_id = Coordinates.id").fetchall()
+        inside = [row for row in rows_all if lat <= row[2] <= lat + 1 and lon <= row[3] <= lon + 1]
+        print(f"перебор в Python (прямоугольник): {(time.perf_counter() - start) * 1000:.1f} мс, найдено {len(inside)}")
+        conn.close()
+
+def bench_validators(rows, repeat):
+    """Проверка столбцов дат и координат: по одному значению (как при вводе) и пакетно."""
+    rnd = random.Random(3)
+    dates = datagen.make_dates(rnd, rows)
+    floats = [f"{rnd.uniform(-90, 90):.6f}" for _ in range(rows)]
+    dirty_floats = [value if rnd.random() > 0.001 else "55,7" for value in floats]
+
+    def scalar_floats(values):
+        mask = []
+        for value in values:
+            try:
+                float(value)
+                mask.append(True)
+            except ValueError:
+                mask.append(False)
+        return mask
+
+    cases = (
+        ("даты", dates, lambda values: [kkurs.date_error(value) is None for value in values],
+         lambda values: kkurs.validate_dates(values)[0]),
+        ("числа", floats, scalar_floats, lambda values: kkurs.validate_floats(values)[0]),
+        ("числа с ошибками", dirty_floats, scalar_floats, lambda values: kkurs.validate_floats(values)[0]),
+    )
+    for label, values, scalar, batch in cases:
+        start = time.perf_counter()
+        expected = scalar(values)
+        scalar_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        mask = batch(values)
+        batch_seconds = time.perf_counter() - start
+        assert mask == expected
+        print(f"{label}, {rows:,} значений: по одному {scalar_seconds:.2f} с, пакетно {batch_seconds:.2f} с "
+              f"(x{scalar_seconds / batch_seconds:.1f}), неправильных {rows - sum(mask):,}")
+
+def bench_timeline(rows, repeat):
+    """Период, гистограмма и общая хронология через индекс data против чтения и сортировки в Python."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        datagen.create_schema(conn)
+        datagen.fill_sources(conn, 1000)
+        datagen.fill_events(conn, rows, 1000)
+        datagen.fill_texts(conn, rows, 1000)
+        conn.close()
+        conn = kkurs.get_connection(path)
+        rnd = random.Random(4)
+
+        def period():
+            year = rnd.randint(1700, 2015)
+            return str(year), str(year + 9)
+
+        found = []
+        print(f"период 10 лет: {timed(lambda: found.append(len(timeline.date_range(conn, 'Events', *period()).fetchall())), repeat) * 1000:.1f} мс, "
+              f"в среднем {sum(found) / len(found):,.0f} строк")
+        print(f"первые 50 строк периода: {timed(lambda: timeline.date_range(conn, 'Events', *period(), limit=50).fetchall(), repeat) * 1000:.3f} мс")
+        print(f"гистограмма по десятилетиям: {timed(lambda: timeline.histogram(conn, 'Events'), max(1, repeat // 10)) * 1000:.0f} мс")
+        print(f"хронология, первые 1000 строк периода: "
+              f"{timed(lambda: list(itertools.islice(timeline.stream(conn, *period()), 1000)), repeat) * 1000:.2f} мс")
+        start = time.perf_counter()
+        merged = list(timeline.stream(conn))
+        print(f"хронология целиком ({len(merged):,} строк): {time.perf_counter() - start:.1f} с")
+        # Как пришлось бы без индекса и слияния: прочитать обе таблицы и отсортировать в Python
+        start = time.perf_counter()
+        everything = [row + ("Events",) for row in conn.execute("SELECT data, id, name FROM Events")]
+        everything += [row + ("Tex",) for row in conn.execute("SELECT data, id, name FROM Tex")]
+        everything.sort()
+        print(f"чтение и сортировка в Python ({len(everything):,} строк): {time.perf_counter() - start:.1f} с")
+        conn.close()
+
+def bench_usage(rows, repeat):
+    """Число ссылок на источник и отчёт о самых цитируемых: счётчики SourceUsage против COUNT по четырём таблицам."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        datagen.create_schema(conn)
+        sources = max(1, rows // 100)
+        datagen.fill_sources(conn, sources)
+        datagen.fill_events(conn, rows, sources)
+        datagen.fill_texts(conn, rows, sources)
+        conn.close()
+        start = time.perf_counter()
+        conn = kkurs.get_connection(path)
+        print(f"Миграции (с подсчётом ссылок): {time.perf_counter() - start:.1f} с")
+        rnd = random.Random(5)
+        counts = " + ".join(f"(SELECT COUNT(*) FROM {table} WHERE resource_id = :id)" for table in kkurs.SOURCE_REFERENCES)
+        print(f"ссылки на источник, COUNT по таблицам: "
+              f"{timed(lambda: conn.execute(f'SELECT {counts}', {'id': rnd.randint(1, sources)}).fetchone(), repeat) * 1000:.3f} мс")
+        print(f"ссылки на источник, SourceUsage: "
+              f"{timed(lambda: kkurs.source_usage(conn, rnd.randint(1, sources)), repeat) * 1000:.3f} мс")
+        joins = " ".join(f"LEFT JOIN (SELECT resource_id, COUNT(*) AS n FROM {table} GROUP BY resource_id) AS t{i} "
+                         f"ON t{i}.resource_id = Sources.id" for i, table in enumerate(kkurs.SOURCE_REFERENCES))
+        total = " + ".join(f"IFNULL(t{i}.n, 0)" for i in range(len(kkurs.SOURCE_REFERENCES)))
+        report = f"SELECT Sources.id, Sources.title, {total} AS total FROM Sources {joins} ORDER BY total DESC LIMIT 20"
+        print(f"20 самых цитируемых, LEFT JOIN + GROUP BY: "
+              f"{timed(lambda: conn.execute(report).fetchall(), max(1, repeat // 10)) * 1000:.0f} мс")
+        print(f"20 самых цитируемых, SourceUsage: {timed(lambda: kkurs.most_cited_sources(conn), repeat) * 1000:.3f} мс")
+        # Цена триггера: добавление событий с ним и без него (триггер FTS снят, чтобы не заслонял разницу)
+        conn.execute("DROP TRIGGER Events_fts_ai")
+        batch = [(f"Новое событие {i}", "1850-01-01", None, rnd.randint(1, sources)) for i in range(100_000)]
+        for label in ("со счётчиками", "без счётчиков"):
+            start = time.perf_counter()
+            conn.executemany("INSERT INTO Events (name, data, description, resource_id) VALUES (?, ?, ?, ?)", batch)
+            seconds = time.perf_counter() - start
+            conn.rollback()
+            print(f"добавление {len(batch):,} событий {label}: {seconds:.2f} с")
+            conn.execute("DROP TRIGGER IF EXISTS Events_usage_ai")
+        conn.close()
+
+def bench_graph(rows, repeat):
+    """Граф персон: построение, соседи, кратчайшая цепочка, группы и добавление рёбер против SQL-соединений."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        datagen.create_schema(conn)
+        persons, sources = max(2, rows // 10), max(2, rows // 5)
+        datagen.fill_interactions(conn, rows, persons, sources)
+        conn.close()
+        conn = kkurs.get_connection(path)
+        start = time.perf_counter()
+        graph = kkurs.PersonGraph.load(conn)
+        print(f"построение графа ({graph.edges():,} пар персона - источник): {time.perf_counter() - start:.1f} с")
+        rnd = random.Random(6)
+        sql = ("SELECT b.person_id, COUNT(DISTINCT a.resource_id) FROM PeopleInteractions AS a "
+               "JOIN PeopleInteractions AS b ON a.resource_id = b.resource_id "
+               "WHERE a.person_id = ? AND b.person_id <> a.person_id GROUP BY b.person_id")
+        print(f"соседи персоны, SQL: {timed(lambda: conn.execute(sql, (rnd.randint(1, persons),)).fetchall(), repeat) * 1000:.2f} мс")
+        found = []
+        print(f"соседи персоны, граф: {timed(lambda: found.append(len(graph.neighbours(rnd.randint(1, persons)))), repeat) * 1000:.2f} мс, "
+              f"в среднем {sum(found) / len(found):,.0f} персон")
+        lengths = []
+        print(f"кратчайшая цепочка: {timed(lambda: lengths.append(len(graph.shortest_path(rnd.randint(1, persons), rnd.randint(1, persons)) or ())), repeat) * 1000:.2f} мс, "
+              f"в среднем {sum(lengths) / len(lengths) // 2:.0f} шаг.")
+        start = time.perf_counter()
+        groups = graph.components()
+        print(f"группы связанных персон: {time.perf_counter() - start:.1f} с, групп {len(groups):,}, в самой большой {len(groups[0]):,}")
+        start = time.perf_counter()
+        for _ in range(repeat * 100):
+            graph.add_interaction(rnd.randint(1, persons), rnd.randint(1, sources))
+        print(f"добавление ребра без перестройки: {(time.perf_counter() - start) / (repeat * 100) * 1e6:.1f} мкс")
+        start = time.perf_counter()
+        graph.compact()
+        print(f"перенос {repeat * 100:,} рёбер в CSR-массивы: {time.perf_counter() - start:.1f} с")
+        conn.close()
+
+def bench_snapshot(rows, repeat):
+    """Снимок для чтения: запуск до первой страницы, страницы и поиск источника - снимок против SQLite."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        datagen.create_schema(conn)
+        datagen.fill_sources(conn, rows)
+        datagen.fill_events(conn, rows, rows)
+        conn.close()
+        kkurs.get_connection(path).close()
+        start = time.perf_counter()
+        snapshot.build(path)
+        print(f"построение снимка: {time.perf_counter() - start:.1f} с, "
+              f"{os.path.getsize(snapshot.snapshot_path(path)) / 1024 / 1024:.0f} МБ (база {os.path.getsize(path) / 1024 / 1024:.0f} МБ)")
+
+        def sqlite_start():
+            conn = kkurs.get_connection(path)
+            kkurs.keyset_page(conn, *kkurs.LIST_VIEWS["events"], 50)
+            conn.close()
+
+        def snapshot_start():
+            snapshot.Snapshot(snapshot.snapshot_path(path)).view_page("events", 50)
+
+        print(f"запуск до первой страницы событий: SQLite {timed(sqlite_start, repeat) * 1000:.2f} мс, "
+              f"снимок {timed(snapshot_start, repeat) * 1000:.2f} мс")
+        conn = kkurs.get_connection(path)
+        snap = kkurs.open_snapshot(conn)
+        assert snap is not None, "снимок устарел сразу после построения"
+        rnd = random.Random(7)
+        afters = [tuple(row[-2:]) for row in conn.execute(
+            "SELECT data, id FROM Events ORDER BY random() LIMIT ?", (repeat,))]
+        prefixes = [f"Источник {rnd.randrange(rows):08d}"[:rnd.randint(12, 18)] for _ in range(repeat)]
+        cases = (
+            ("страница событий в глубине", lambda: kkurs.keyset_page(conn, *kkurs.LIST_VIEWS["events"], 50, rnd.choice(afters)),
+             lambda: snap.view_page("events", 50, rnd.choice(afters))),
+            ("поиск источника по началу", lambda: kkurs.load_matches(conn, "Sources", rnd.choice(prefixes), 20),
+             lambda: snap.matches("Sources", rnd.choice(prefixes), 20)),
+            ("поиск события по подстроке", lambda: kkurs.load_matches(conn, "Events", f"{rnd.randrange(rows):08d}"[2:], 20),
+             lambda: snap.matches("Events", f"{rnd.randrange(rows):08d}"[2:], 20)),
+        )
+        for label, from_sqlite, from_snapshot in cases:  # load_matches читает из SQLite, пока USE_SNAPSHOT выключен
+            kkurs.USE_SNAPSHOT = False
+            sqlite_seconds = timed(from_sqlite, repeat)
+            kkurs.USE_SNAPSHOT = True
+            print(f"{label}: SQLite {sqlite_seconds * 1000:.3f} мс, снимок {timed(from_snapshot, repeat) * 1000:.3f} мс")
+        for label, rows_of in (("SQLite", lambda: kkurs.iter_keyset(conn, *kkurs.LIST_VIEWS["events"], 1000)),
+                               ("снимок", lambda: snap.view_rows("events"))):
+            start = time.perf_counter()
+            count = sum(1 for _ in rows_of())
+            print(f"весь список событий ({count:,} строк), {label}: {time.perf_counter() - start:.1f} с")
+        conn.close()
+
+def bench_bulk(rows, repeat):
+    """Удаление и изменение 10% событий: по одной строке с commit (как из меню) и одной транзакцией bulk."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        datagen.create_schema(conn)
+        datagen.fill_sources(conn, 1000)
+        datagen.fill_events(conn, rows, 1000)
+        conn.close()
+        conn = kkurs.get_connection(path)
+        rnd = random.Random(8)
+        ids = rnd.sample(range(1, rows + 1), rows // 10)
+        # По одной строке: замер на repeat строках, дальше - оценка на все
+        start = time.perf_counter()
+        for row_id in ids[:repeat]:
+            kkurs.update_row(conn, "events", row_id, {"description": "Изменено"})
+            conn.commit()
+        per_row = (time.perf_counter() - start) / repeat
+        print(f"изменение по одной строке с commit: {per_row * 1000:.2f} мс на строку, "
+              f"{len(ids):,} строк - около {per_row * len(ids) / 60:.0f} мин")
+        for label, run in (
+                ("bulk update по списку id", lambda: bulk.bulk_update(conn, "events", {"description": "Изменено"}, ids=ids)),
+                ("bulk update по условию", lambda: bulk.bulk_update(conn, "events", {"description": "Ранние"},
+                                                                     [("data", "<", "1733")])),
+                ("bulk delete, пробный запуск", lambda: bulk.bulk_delete(conn, "events", ids=ids, dry_run=True)),
+                ("bulk delete по списку id", lambda: bulk.bulk_delete(conn, "events", ids=ids))):
+            start = time.perf_counter()
+            conn.execute("BEGIN")
+            result = run()
+            conn.commit()
+            print(f"{label}: {len(result['affected']):,} строк за {time.perf_counter() - start:.1f} с")
+        conn.close()
+
+def bench_queries(rows, repeat):
+    """Цена замеров запросов (KKursCursor): поиск по id, поиск по названию и чтение всей таблицы с замерами и без."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        datagen.create_schema(conn)
+        datagen.fill_sources(conn, 1000)
+        datagen.fill_events(conn, rows, 1000)
+        conn.close()
+        conn = kkurs.get_connection(path)
+        rnd = random.Random(9)
+        ids = [rnd.randint(1, rows) for _ in range(repeat * 100)]
+        titles = [f"Источник {rnd.randrange(1000):08d}" for _ in range(repeat * 100)]
+        for enabled in (False, True):
+            kkurs.QUERY_STATS = enabled
+            kkurs.query_stats.reset()
+            label = "с замерами" if enabled else "без замеров"
+            start = time.perf_counter()
+            for row_id in ids:
+                conn.execute("SELECT * FROM Events WHERE id = ?", (row_id,)).fetchone()
+            by_id = (time.perf_counter() - start) / len(ids)
+            start = time.perf_counter()
+            for title in titles:
+                conn.execute("SELECT id FROM Sources WHERE title = ?", (title,)).fetchall()
+            by_title = (time.perf_counter() - start) / len(titles)
+            scan = timed(lambda: sum(1 for _ in conn.execute("SELECT id, name, data FROM Events")), 3)
+            print(f"{label}: по id {by_id * 1e6:.1f} мкс, по названию {by_title * 1e6:.1f} мкс, "
+                  f"вся таблица {scan:.2f} с")
+        print(kkurs.query_stats.report(5))
+        kkurs.QUERY_STATS = False
+        conn.close()
+
+def bench_cli(rows, repeat):
+    """Добавление событий командами cli.py: процесс на команду, команда с commit на одном подключении и --batch."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        conn = sqlite3.connect(path)
+        datagen.create_schema(conn)
+        datagen.fill_sources(conn, 1000)
+        datagen.fill_events(conn, rows, 1000)
+        conn.close()
+        kkurs.get_connection(path).close()
+        def commands(label, count):
+            return [f"events add --name '{label} {i}' --date 1850-01-01 --source {i % 1000 + 1}" for i in range(count)]
+
+        processes = repeat // 10 or 1
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cli.py")
+        start = time.perf_counter()
+        for command in commands("Процесс", processes):
+            subprocess.run([sys.executable, script, "--db", path] + shlex.split(command), check=True,
+                           stdout=subprocess.DEVNULL)
+        per_process = (time.perf_counter() - start) / processes
+        print(f"процесс на команду: {per_process * 1000:.1f} мс на команду")
+        conn = kkurs.get_connection(path)
+        parser = cli.BatchParser(prog="", add_help=False)
+        cli.add_commands(parser)
+        out = io.StringIO()
+        start = time.perf_counter()
+        for command in commands("Одна", repeat * 10):
+            cli.run_command(conn, parser.parse_args(shlex.split(command)), out)
+            conn.commit()
+        per_commit = (time.perf_counter() - start) / (repeat * 10)
+        print(f"одно подключение, commit на команду: {per_commit * 1000:.2f} мс на команду")
+        start = time.perf_counter()
+        count = cli.run_batch(conn, commands("Пакет", repeat * 100), out)
+        per_batch = (time.perf_counter() - start) / count
+        print(f"--batch, одна транзакция: {per_batch * 1000:.3f} мс на команду ({count:,} команд), "
+              f"в {per_process / per_batch:,.0f} раз быстрее процесса на команду")
+        conn.close()
+
+def bench_sync(rows, repeat):
+    """Журнал изменений: цена триггеров при вставке, полная копия реплики против догона журнала (repeat * 10 изменений)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        replica_path = os.path.join(tmp, "replica.db")
+        datagen.generate(path, datagen.table_sizes(rows))
+        conn = kkurs.get_connection(path)
+        # Без FTS и счётчиков ссылок, чтобы цена триггера журнала не терялась на их фоне
+        for trigger in ("Events_fts_ai", "Events_usage_ai"):
+            conn.execute(f"DROP TRIGGER {trigger}")
+        for label in ("без журнала", "с журналом", "без журнала", "с журналом"):
+            if label == "без журнала":
+                conn.execute("DROP TRIGGER IF EXISTS Events_changelog_ai")
+            else:
+                conn.execute(kkurs.changelog_migration("Events")[0])
+            conn.commit()
+            start = time.perf_counter()
+            conn.executemany("INSERT INTO Events (name, data, resource_id) VALUES (?, '1850-01-01', 1)",
+                             ((f"{label} {i} {start}",) for i in range(100_000)))
+            conn.commit()
+            print(f"добавление 100,000 событий {label}: {time.perf_counter() - start:.2f} с")
+        conn.execute(kkurs.MIGRATIONS[2][1 + list(kkurs.FTS_TABLES).index("Events") * 5])
+        conn.execute(kkurs.usage_migration("Events", "events")[0])
+        conn.commit()
+        result = sync.sync_replica(path, replica_path, full=True)
+        print(f"полная копия реплики ({os.path.getsize(path) / 2**20:.0f} МБ): {result['seconds']:.2f} с")
+        rnd = random.Random(10)
+        events = conn.execute("SELECT max(id) FROM Events").fetchone()[0]
+        for changes in (repeat, repeat * 10, repeat * 100):
+            for _ in range(changes):
+                conn.execute("UPDATE Events SET description = ? WHERE id = ?",
+                             (f"Правка {rnd.random()}", rnd.randint(1, events)))
+            conn.commit()
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            result = sync.sync_replica(path, replica_path)
+            print(f"догон реплики на {changes:,} изменений: {result['seconds'] * 1000:.0f} мс "
+                  f"(применено {result['changes']:,}, полная копия: {'да' if result['full_copy'] else 'нет'})")
+        conn.close()
+
+def bench_backup(rows, repeat):
+    """Резервная копия под нагрузкой: как она замедляет писателя (по одной записи на транзакцию) при разном
+    числе страниц за шаг; отдельно - сжатие и проверка копии."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        directory = os.path.join(tmp, "backups")
+        datagen.generate(path, datagen.table_sizes(rows))
+        print(f"база: {os.path.getsize(path) / 2**20:.0f} МБ")
+
+        def under_load(label, action):
+            """Писатель добавляет события, пока выполняется action; печатает задержки его транзакций."""
+            stop = threading.Event()
+            latencies = []
+
+            def writer():
+                conn = kkurs.get_connection(path)
+                number = 0
+                while not stop.is_set():
+                    number += 1
+                    start = time.perf_counter()
+                    conn.execute("INSERT INTO Events (name, data, resource_id) VALUES (?, '1850-01-01', 1)",
+                                 (f"{label} {number} {start}",))
+                    conn.commit()
+                    latencies.append(time.perf_counter() - start)
+                conn.close()
+
+            thread = threading.Thread(target=writer)
+            thread.start()
+            start = time.perf_counter()
+            result = action()
+            seconds = time.perf_counter() - start
+            stop.set()
+            thread.join()
+            latencies.sort()
+            print(f"{label}: {seconds:.2f} с, писатель {len(latencies) / seconds:,.0f} транзакций/с, задержка "
+                  f"p50 {loadtest.percentile(latencies, 0.5) * 1000:.2f} мс, "
+                  f"p99 {loadtest.percentile(latencies, 0.99) * 1000:.2f} мс, "
+                  f"макс. {latencies[-1] * 1000 if latencies else 0:.1f} мс")
+            return result
+
+        under_load("без копии", lambda: time.sleep(repeat / 50))
+        for pages in (100, backup.BACKUP_PAGES, -1):
+            result = under_load(f"копия по {pages} стр. за шаг" if pages > 0 else "копия за один шаг",
+                                lambda: backup.backup_database(path, directory, pages, verify=False, keep=1))
+            print(f"  {result['mb_per_s']:.0f} МБ/с, шагов {result['steps']}, перезапусков {result['restarts']}, "
+                  f"снимок одного момента: {'да' if result['snapshot'] else 'нет'}")
+            time.sleep(1)  # Имена копий - с точностью до секунды
+        start = time.perf_counter()
+        result = backup.backup_database(path, directory, compress=True, keep=1)
+        print(f"копия со сжатием и проверкой: {time.perf_counter() - start:.2f} с, {result['bytes'] / 2**20:.0f} -> "
+              f"{result['stored_bytes'] / 2**20:.0f} МБ")
+        start = time.perf_counter()
+        error = backup.verify_backup(result["file"])
+        print(f"проверка сжатой копии: {time.perf_counter() - start:.2f} с, {error or 'ok'}")
+
+def bench_integrity(rows, repeat):
+    """Поиск повисших ссылок: по строке из Python, PRAGMA foreign_key_check, NOT EXISTS по строкам и
+    integrity.scan (проверка различных значений); исправление одним запросом на связь против построчного."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        datagen.generate(path, datagen.table_sizes(rows))
+        conn = kkurs.get_connection(path)
+        conn.execute("PRAGMA foreign_keys = OFF")  # Иначе сирот не создать
+        for table in ("Sources", "Coordinates", "Persons"):
+            conn.execute(f"DELETE FROM {table} WHERE id % 100 = 0")
+        conn.commit()
+        references = kkurs.REFERENCES
+
+        def per_row():
+            found = 0
+            for child, column, parent in references:
+                for (value,) in conn.execute(f"SELECT {column} FROM {child} WHERE {column} IS NOT NULL").fetchall():
+                    found += conn.execute(f"SELECT 1 FROM {parent} WHERE id = ?", (value,)).fetchone() is None
+            return found
+
+        def not_exists():
+            return sum(conn.execute(f"SELECT count(*) FROM {child} WHERE {column} IS NOT NULL AND NOT EXISTS "
+                                    f"(SELECT 1 FROM {parent} WHERE id = {child}.{column})").fetchone()[0]
+                       for child, column, parent in references)
+
+        for label, func in (("запрос на строку из Python", per_row),
+                            ("PRAGMA foreign_key_check", lambda: len(conn.execute("PRAGMA foreign_key_check").fetchall())),
+                            ("NOT EXISTS по строкам", not_exists),
+                            ("integrity.scan", lambda: sum(item["rows"] for item in integrity.scan(conn)))):
+            start = time.perf_counter()
+            found = func()
+            print(f"{label}: {time.perf_counter() - start:.3f} с, сирот {found:,}")
+        actions = {(child, column): "null" for child, column, _ in references}
+        conn.execute("BEGIN")
+        start = time.perf_counter()
+        done = integrity.repair(conn, actions)
+        print(f"исправление одним запросом на связь: {time.perf_counter() - start:.2f} с, "
+              f"строк {sum(count for _, count in done.values()):,}")
+        conn.rollback()
+        conn.execute("BEGIN")
+        start = time.perf_counter()
+        fixed = 0
+        for child, column, parent in references:
+            orphans = conn.execute(f"SELECT id FROM {child} WHERE {column} IS NOT NULL AND NOT EXISTS "
+                                   f"(SELECT 1 FROM {parent} WHERE id = {child}.{column})").fetchall()
+            for (row_id,) in orphans:
+                fixed += conn.execute(f"UPDATE {child} SET {column} = NULL WHERE id = ?", (row_id,)).rowcount
+        print(f"исправление по строке: {time.perf_counter() - start:.2f} с, строк {fixed:,}")
+        conn.rollback()
+        conn.close()
+
+def bench_async(rows, repeat):
+    """aiokkurs: цена await на запрос, объединение одинаковых чтений, перебор с упреждающим чтением страниц,
+    отмена долгого запроса и задержка цикла событий, пока запрос выполняется."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        datagen.generate(path, datagen.table_sizes(rows))
+        conn = kkurs.get_connection(path)
+        calls = repeat * 100
+        sources = conn.execute("SELECT max(id) FROM Sources").fetchone()[0]
+        name = conn.execute("SELECT name FROM Events WHERE id = 1").fetchone()[0]
+        rnd = random.Random(11)
+        ids = [rnd.randint(1, sources) for _ in range(calls)]
+        start = time.perf_counter()
+        for source_id in ids:
+            kkurs.get_row(conn, "sources", source_id)
+        sync_call = (time.perf_counter() - start) / calls
+        start = time.perf_counter()
+        count = 0
+        after = None
+        while True:
+            page, after = kkurs.list_page(conn, "events", kkurs.FETCH_BATCH, after)
+            count += len(page)
+            if after is None:
+                break
+        sync_rows = time.perf_counter() - start
+        slow_sql = "SELECT count(*) FROM Events WHERE instr(description, 'нет такого текста') > 0"
+        start = time.perf_counter()
+        conn.execute(slow_sql).fetchone()
+        slow = time.perf_counter() - start
+        conn.close()
+
+        async def lag_during(awaitable):
+            """Выполняет awaitable и возвращает (результат, наибольшая задержка тиков цикла в мс)."""
+            lags = []
+            done = False
+
+            async def ticker():
+                while not done:
+                    tick = time.perf_counter()
+                    await asyncio.sleep(0.001)
+                    lags.append(time.perf_counter() - tick - 0.001)
+
+            task = asyncio.ensure_future(ticker())
+            try:
+                result = await awaitable
+            finally:
+                done = True
+                await task
+            return result, max(lags, default=0.0) * 1000
+
+        async def run():
+            async with aiokkurs.Database(path) as db:
+                start = time.perf_counter()
+                for source_id in ids:
+                    await db.sources.get(source_id)
+                async_call = (time.perf_counter() - start) / calls
+                print(f"запрос по id: синхронно {sync_call * 1e6:.1f} мкс, через await {async_call * 1e6:.1f} мкс")
+                for coalesce in (False, True):
+                    db.coalesce = coalesce
+                    before = db.stats["queries"]
+                    start = time.perf_counter()
+                    await asyncio.gather(*(db.events.search(name) for _ in range(repeat)))
+                    print(f"{repeat:,} одновременных одинаковых поисков {'с объединением' if coalesce else 'без объединения'}: "
+                          f"{time.perf_counter() - start:.3f} с, запросов к базе {db.stats['queries'] - before:,}")
+                start = time.perf_counter()
+                async for _ in db.events.rows():
+                    pass
+                by_row = time.perf_counter() - start
+                start = time.perf_counter()
+                async for _ in db.events.pages():
+                    pass
+                print(f"перебор {count:,} событий: синхронно {sync_rows:.2f} с, async for по строкам {by_row:.2f} с, "
+                      f"по страницам {time.perf_counter() - start:.2f} с")
+                query = lambda conn: conn.execute(slow_sql).fetchone()
+                _, lag = await lag_during(db.read(None, query))
+                print(f"долгий запрос ({slow * 1000:.0f} мс): задержка цикла событий {lag:.1f} мс "
+                      f"(синхронный вызов остановил бы цикл на всё время запроса)")
+                task = asyncio.ensure_future(db.read(None, query))
+                await asyncio.sleep(slow / 10)
+                start = time.perf_counter()
+                task.cancel()
+                await db.sources.get(1)
+                print(f"отмена долгого запроса: следующий запрос выполнен через {(time.perf_counter() - start) * 1000:.1f} мс, "
+                      f"прервано запросов: {db.stats['interrupted']}")
+
+        asyncio.run(run())
+
+def bench_records(rows, repeat):
+    """Память и время чтения rows событий (со столбцом source из Sources) кортежами, sqlite3.Row,
+    записями kkurs.Event и столбцами kkurs.RecordBatch; память - tracemalloc, пересчёт на 1M строк."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        datagen.generate(path, datagen.table_sizes(rows, {"texts": 1000, "places": 1000, "interactions": 1000}),
+                         migrate=False)
+        conn = kkurs.get_connection(path)
+        sql = ("SELECT Events.id, Events.name, Events.data, Events.description, Events.resource_id, "
+               "Sources.title AS source FROM Events LEFT JOIN Sources ON Events.resource_id = Sources.id")
+
+        def with_factory(factory):
+            cursor = conn.cursor()
+            cursor.row_factory = factory
+            return cursor.execute(sql).fetchall()
+
+        formats = (
+            ("кортежи", lambda: conn.execute(sql).fetchall()),
+            ("sqlite3.Row", lambda: with_factory(sqlite3.Row)),
+            ("kkurs.Event (__slots__)", lambda: kkurs.fetch_records(conn, kkurs.Event, sql).fetchall()),
+            ("kkurs.RecordBatch", lambda: kkurs.RecordBatch.from_cursor(kkurs.Event, conn.execute(sql))),
+        )
+        for label, fetch in formats:
+            start = time.perf_counter()
+            result = fetch()
+            seconds = time.perf_counter() - start
+            count = len(result)
+            one = sys.getsizeof(result[0]) if not isinstance(result, kkurs.RecordBatch) else 0
+            del result
+            tracemalloc.start()
+            result = fetch()
+            used = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del result
+            print(f"{label}: {seconds:.2f} с, {used / count:.0f} байт на строку со значениями "
+                  f"({used / count * 1_000_000 / 2**20:,.0f} МБ на 1M строк)"
+                  + (f", сам объект строки {one} байт" if one else ""))
+        conn.close()
+
+BENCHMARKS = {
+    "indexes": bench_indexes,
+    "paging": bench_paging,
+    "fts": bench_fts,
+    "import": bench_import,
+    "export": bench_export,
+    "pragmas": bench_pragmas,
+    "pool": bench_pool,
+    "service": bench_service,
+    "cache": bench_cache,
+    "spatial": bench_spatial,
+    "validators": bench_validators,
+    "timeline": bench_timeline,
+    "usage": bench_usage,
+    "graph": bench_graph,
+    "snapshot": bench_snapshot,
+    "bulk": bench_bulk,
+    "queries": bench_queries,
+    "cli": bench_cli,
+    "sync": bench_sync,
+    "backup": bench_backup,
+    "integrity": bench_integrity,
+    "async": bench_async,
+    "records": bench_records,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарки KKurs на синтетических данных.")
+    parser.add_argument("name", choices=sorted(BENCHMARKS), help="какой бенчмарк запустить")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="число строк в таблицах")
+    parser.add_argument("--repeat", type=int, default=100, help="число повторов измерения")
+    args = parser.parse_args()
+    BENCHMARKS[args.name](args.rows, args.repeat)
+
+if __name__ == "__main__":
+    main()
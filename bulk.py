@@ -0,0 +1,204 @@
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import time
+
+import Soshina_1 as kkurs
+
+# Условие --where: столбец, оператор, значение. "~" - содержит подстроку; "=" и "!=" с null - IS NULL / IS NOT NULL
+CONDITION = re.compile(r"\s*(\w+)\s*(<=|>=|!=|=|<|>|~)(.*)")
+OPERATORS = {"=": "{} = ?", "!=": "{} <> ?", "<": "{} < ?", "<=": "{} <= ?", ">": "{} > ?", ">=": "{} >= ?",
+             "~": "instr({}, ?) > 0"}
+REPORT_SHOWN = 20  # Сколько id показывать на экране, если отчёт не пишется в файл
+
+def parse_condition(view, text):
+    """Строка вида "data<1850" -> (столбец, оператор, значение); столбец - id или поле из kkurs.TABLES."""
+    match = CONDITION.fullmatch(text)
+    if not match:
+        raise ValueError(f"не понимаю условие {text!r}: нужно столбец, оператор (= != < <= > >= ~) и значение")
+    column, operator, value = match.group(1), match.group(2), match.group(3).strip()
+    if column != "id" and column not in kkurs.TABLES[view][1]:
+        raise ValueError(f"неизвестное поле {column}")
+    if value.lower() == "null":
+        if operator not in ("=", "!="):
+            raise ValueError(f"с null можно сравнивать только через = и !=: {text!r}")
+        value = None
+    return column, operator, value
+
+def where_clause(conditions):
+    """Условия из parse_condition -> (SQL для WHERE, параметры); все условия должны выполняться одновременно."""
+    parts = []
+    params = []
+    for column, operator, value in conditions:
+        if value is None:
+            parts.append(f"{column} IS {'NOT ' if operator == '!=' else ''}NULL")
+        else:
+            parts.append(OPERATORS[operator].format(column))
+            params.append(value)
+    return " AND ".join(parts) or "1", params
+
+def read_ids(path):
+    """id из файла: по одному в строке (первое поле, если строка - CSV); пустые строки и # комментарии пропускаются."""
+    ids = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            field = line.split("#")[0].replace(",", " ").split()
+            if not field:
+                continue
+            if not field[0].isdigit():
+                if line_no == 1 and field[0].lower() == "id":
+                    continue  # Заголовок CSV
+                raise ValueError(f"{path}, строка {line_no}: ожидался id, а не {field[0]!r}")
+            ids.append(int(field[0]))
+    return ids
+
+# Функции ниже не вызывают commit: всё, что они сделали, фиксирует или откатывает вызывающий код одной транзакцией.
+
+def select_rows(conn, view, conditions=(), ids=None):
+    """Кладёт во временную таблицу bulk_ids id строк, подходящих под условия и (если задан) входящих в ids.
+
+    Список ids загружается через executemany, дальше всё делается запросами над множеством, без
+    цикла по строкам в Python. Возвращает, сколько id из списка не нашлось в таблице (0 без списка).
+    """
+    table, _ = kkurs.TABLES[view]
+    where, params = where_clause(conditions)
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS bulk_ids (id INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM temp.bulk_ids")
+    if ids is None:
+        conn.execute(f"INSERT INTO temp.bulk_ids SELECT id FROM {table} WHERE {where}", params)
+        return 0
+    conn.executemany("INSERT OR IGNORE INTO temp.bulk_ids (id) VALUES (?)", ((row_id,) for row_id in ids))
+    missing = conn.execute(f"DELETE FROM temp.bulk_ids WHERE id NOT IN (SELECT id FROM {table})").rowcount
+    if conditions:
+        conn.execute(f"DELETE FROM temp.bulk_ids WHERE id NOT IN (SELECT id FROM {table} WHERE {where})", params)
+    return missing
+
+def selected_ids(conn):
+    return [row[0] for row in conn.execute("SELECT id FROM temp.bulk_ids ORDER BY id")]
+
+def after_write(conn, table):
+    """Сбрасывает то, что помнит о таблице подключение: кэш справочников и граф персон."""
+    kkurs.invalidate_reference(conn, table)
+    if table == "PeopleInteractions" and isinstance(conn, kkurs.KKursConnection):
+        conn.graph = None  # Граф перестроится при следующем запросе
+
+def bulk_delete(conn, view, conditions=(), ids=None, dry_run=False, modes=None):
+    """Удаляет строки по условиям и/или списку id одним DELETE.
+
+    Ссылки на удаляемые строки обрабатываются по режимам kkurs.integrity_modes (или modes): строки, на
+    которые ссылаются связи restrict, не удаляются и попадают в skipped, для cascade и set-null ссылающиеся
+    строки удаляются или очищаются тоже одним запросом на связь. Возвращает словарь: affected - id
+    затронутых (при dry_run - тех, что были бы затронуты), skipped, missing, references (см. kkurs.apply_references).
+    """
+    table, _ = kkurs.TABLES[view]
+    modes = modes or kkurs.integrity_modes()
+    missing = select_rows(conn, view, conditions, ids)
+    skipped = []
+    used = kkurs.restricting_ids(table, modes)
+    if used:
+        skipped = [row[0] for row in conn.execute(f"SELECT id FROM temp.bulk_ids WHERE id IN ({used}) ORDER BY id")]
+        conn.execute(f"DELETE FROM temp.bulk_ids WHERE id IN ({used})")
+    affected = selected_ids(conn)
+    references = {}
+    if not dry_run and affected:
+        references = kkurs.apply_references(conn, table, "SELECT id FROM temp.bulk_ids", (), modes)
+        conn.execute(f"DELETE FROM {table} WHERE id IN (SELECT id FROM temp.bulk_ids)")
+        after_write(conn, table)
+    return {"affected": affected, "skipped": skipped, "missing": missing, "references": references}
+
+def bulk_update(conn, view, values, conditions=(), ids=None, dry_run=False):
+    """Присваивает столбцам values ({столбец: значение}, None - NULL) у всех выбранных строк одним UPDATE.
+
+    Значения проверяются, как при вводе (даты, координаты). Если новое значение нарушает уникальность
+    хотя бы в одной строке, IntegrityError - и вызывающий код откатывает всё.
+    """
+    if not values:
+        raise ValueError("не указано, что менять")
+    error = kkurs.check_values(view, values)
+    if error:
+        raise ValueError(error)
+    table, _ = kkurs.TABLES[view]
+    missing = select_rows(conn, view, conditions, ids)
+    affected = selected_ids(conn)
+    if not dry_run and affected:
+        assignments = ", ".join(f"{column} = ?" for column in values)
+        conn.execute(f"UPDATE {table} SET {assignments} WHERE id IN (SELECT id FROM temp.bulk_ids)", list(values.values()))
+        after_write(conn, table)
+    return {"affected": affected, "skipped": [], "missing": missing, "references": {}}
+
+def parse_assignments(items):
+    """["resource_id=5", "description="] -> {"resource_id": "5", "description": None} (пустое значение - NULL)."""
+    values = {}
+    for item in items:
+        column, sep, value = item.partition("=")
+        if not sep:
+            raise ValueError(f"--set ожидает столбец=значение, а не {item!r}")
+        values[column.strip()] = value if value != "" else None
+    return values
+
+def main():
+    parser = argparse.ArgumentParser(description="Массовое изменение и удаление строк KKurs одной транзакцией.")
+    parser.add_argument("command", choices=("update", "delete"))
+    parser.add_argument("view", choices=sorted(kkurs.TABLES), help="представление (таблица)")
+    parser.add_argument("--db", default=kkurs.DB_NAME, help="путь к базе данных")
+    parser.add_argument("--where", action="append", default=[], metavar="УСЛОВИЕ",
+                        help='условие отбора, например "data<1850", "resource_id=3", "name~Москва", "link=null"; '
+                             "несколько --where - все сразу")
+    parser.add_argument("--ids", metavar="ФАЙЛ", help="файл с id строк, по одному в строке")
+    parser.add_argument("--all", action="store_true", help="все строки таблицы (без --where и --ids нужно явно)")
+    parser.add_argument("--set", action="append", default=[], metavar="СТОЛБЕЦ=ЗНАЧЕНИЕ",
+                        help="для update: новое значение (пустое - NULL)")
+    parser.add_argument("--dry-run", action="store_true", help="только посчитать, ничего не менять")
+    parser.add_argument("--report", metavar="ФАЙЛ", help="записать id затронутых строк в файл")
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        sys.exit(f"Ошибка: база {args.db} не найдена.")
+    if not (args.where or args.ids or args.all):
+        sys.exit("Ошибка: укажите --where, --ids или --all.")
+    try:
+        conditions = [parse_condition(args.view, text) for text in args.where]
+        ids = read_ids(args.ids) if args.ids else None
+        values = parse_assignments(args.set) if args.command == "update" else None
+    except (OSError, ValueError) as e:
+        sys.exit(f"Ошибка: {e}")
+    conn = kkurs.get_connection(args.db)
+    start = time.perf_counter()
+    try:
+        conn.execute("BEGIN")
+        if args.command == "update":
+            result = bulk_update(conn, args.view, values, conditions, ids, args.dry_run)
+        else:
+            result = bulk_delete(conn, args.view, conditions, ids, args.dry_run)
+        if args.dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    except (ValueError, sqlite3.Error) as e:
+        conn.rollback()
+        sys.exit(f"Ошибка: {str(e).rstrip('.')}. Ничего не изменено.")
+    finally:
+        conn.close()
+    seconds = time.perf_counter() - start
+    affected = result["affected"]
+    verb = "будет изменено" if args.command == "update" else "будет удалено"
+    if not args.dry_run:
+        verb = "изменено" if args.command == "update" else "удалено"
+    print(f"{'Пробный запуск: ' if args.dry_run else ''}{verb} строк: {len(affected)}, {seconds:.2f} с")
+    if result["missing"]:
+        print(f"Не найдено id из файла: {result['missing']}")
+    if result["skipped"]:
+        print(f"Пропущено строк, на которые есть ссылки: {len(result['skipped'])} "
+              f"(id {', '.join(map(str, result['skipped'][:REPORT_SHOWN]))}{' ...' if len(result['skipped']) > REPORT_SHOWN else ''})")
+    if result["references"]:
+        print(f"Ссылки на удалённые строки: {kkurs.format_references(result['references'])}")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.writelines(f"{row_id}\n" for row_id in affected)
+        print(f"id затронутых строк: {args.report}")
+    elif affected:
+        print(f"id: {', '.join(map(str, affected[:REPORT_SHOWN]))}{' ...' if len(affected) > REPORT_SHOWN else ''}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+import shlex
+import sqlite3
+import sys
+
+import Soshina_1 as kkurs
+
+# Дополнительные имена параметров для некоторых столбцов (основное имя - столбец через дефис: --resource-id)
+FIELD_ALIASES = {"data": ("--date",), "date_of_birth": ("--born",), "resource_id": ("--source",),
+                 "coordinate_id": ("--coordinate",), "person_id": ("--person",)}
+ID_COLUMNS = ("resource_id", "coordinate_id", "person_id")
+SHELL_SYNTAX = frozenset("'\"\\#")  # Символы, из-за которых строку пакета надо разбирать через shlex
+
+class BatchParser(argparse.ArgumentParser):
+    """Разбор строки пакета: ошибка - ValueError, а не выход из программы."""
+
+    def error(self, message):
+        raise ValueError(message)
+
+    def exit(self, status=0, message=None):
+        raise ValueError((message or "справка в пакетном режиме не выводится").strip())
+
+def add_field_options(parser, view):
+    """Параметры --столбец для всех полей представления из kkurs.TABLES."""
+    _, columns = kkurs.TABLES[view]
+    for column in columns:
+        parser.add_argument(f"--{column.replace('_', '-')}", *FIELD_ALIASES.get(column, ()), dest=column,
+                            type=int if column in ID_COLUMNS else str)
+
+def add_commands(parser, required=True):
+    """Подкоманды: "представление действие ..." для каждого ключа kkurs.TABLES и общий "search"."""
+    views = parser.add_subparsers(dest="view", required=required, metavar="представление")
+    for view, (table, _) in kkurs.TABLES.items():
+        commands = views.add_parser(view, help=f"таблица {table}").add_subparsers(dest="command", required=True)
+        command = commands.add_parser("list", help="все записи в порядке списка меню")
+        command.add_argument("--limit", type=int, default=0, help="не больше стольких записей (0 - все)")
+        commands.add_parser("get", help="одна запись").add_argument("id", type=int)
+        add_field_options(commands.add_parser("add", help="добавить запись; выводит её id"), view)
+        command = commands.add_parser("update", help="изменить переданные поля")
+        command.add_argument("id", type=int)
+        add_field_options(command, view)
+        commands.add_parser("delete", help="удалить запись").add_argument("id", type=int)
+        command = commands.add_parser("search", help="поиск по началу или части названия")
+        command.add_argument("text")
+        command.add_argument("--limit", type=int, default=kkurs.PICK_LIMIT)
+    command = views.add_parser("search", help="полнотекстовый поиск по всем таблицам")
+    command.add_argument("text")
+    command.add_argument("--limit", type=int, default=kkurs.FTS_LIMIT)
+
+def write_row(out, columns, row, as_json):
+    """Строка результата: JSON-объект или значения через табуляцию (NULL - пустое поле)."""
+    if as_json:
+        out.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n")
+    else:
+        out.write("\t".join("" if value is None else str(value).replace("\t", " ").replace("\n", " ")
+                            for value in row) + "\n")
+
+def run_command(conn, args, out, as_json=False):
+    """Выполняет одну разобранную команду; commit не вызывает - транзакцией управляет вызывающий код."""
+    if args.view == "search":
+        for row in kkurs.search_text(conn, args.text, args.limit):
+            write_row(out, ("table", "id", "title", "fragment"), row, as_json)
+        return
+    view, command = args.view, args.command
+    table, columns = kkurs.TABLES[view]
+    if command == "list":
+        after = None
+        shown = 0
+        while True:
+            limit = kkurs.FETCH_BATCH if not args.limit else min(kkurs.FETCH_BATCH, args.limit - shown)
+            rows, after = kkurs.list_page(conn, view, limit, after)
+            for row in rows:
+                write_row(out, kkurs.list_columns(view), row, as_json)
+            shown += len(rows)
+            if after is None or args.limit and shown >= args.limit:
+                return
+    elif command == "get":
+        row = kkurs.get_row(conn, view, args.id)
+        if row is None:
+            raise ValueError(f"запись {args.id} не найдена")
+        write_row(out, kkurs.list_columns(view), row, as_json)
+    elif command == "search":
+        for row_id, title, _ in kkurs.find_matches(conn, table, args.text, args.limit):
+            write_row(out, ("id", "title"), (row_id, title), as_json)
+    elif command == "delete":
+        if not kkurs.delete_row(conn, view, args.id):
+            raise ValueError(f"запись {args.id} не найдена")
+    else:
+        values = {column: getattr(args, column) for column in columns if getattr(args, column) is not None}
+        if not values:
+            raise ValueError("не указано ни одного поля")
+        if command == "add":
+            write_row(out, ("id",), (kkurs.insert_row(conn, view, values),), as_json)
+        elif not kkurs.update_row(conn, view, args.id, values):
+            raise ValueError(f"запись {args.id} не найдена")
+
+def run_batch(conn, lines, out, as_json=False):
+    """Выполняет команды из lines (по одной в строке, как в командной строке; # - комментарий) одной транзакцией.
+
+    При первой ошибке всё откатывается: ValueError с номером строки. Возвращает число выполненных команд.
+    """
+    parser = BatchParser(prog="", add_help=False)
+    add_commands(parser)
+    count = 0
+    conn.execute("BEGIN")
+    try:
+        for line_no, line in enumerate(lines, 1):
+            try:
+                # shlex нужен только для кавычек, \ и комментариев, а обычная строка делится в десятки раз быстрее
+                words = shlex.split(line, comments=True) if SHELL_SYNTAX.intersection(line) else line.split()
+                if not words:
+                    continue
+                run_command(conn, parser.parse_args(words), out, as_json)
+            except (ValueError, sqlite3.Error) as e:
+                raise ValueError(f"строка {line_no}: {str(e).rstrip('.')}") from e
+            count += 1
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return count
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Команды KKurs без меню.",
+        epilog="Примеры: sources list; events add --name Коронация --date 1856-08-26 --source 3; "
+               "places search Москва; --batch < команды.txt")
+    parser.add_argument("--db", default=kkurs.DB_NAME, help="путь к базе данных")
+    parser.add_argument("--profile", choices=sorted(kkurs.PRAGMA_PROFILES), default=kkurs.PRAGMA_PROFILE,
+                        help="набор PRAGMA при подключении")
+    parser.add_argument("--json", action="store_true", help="выводить строки как JSON-объекты")
+    parser.add_argument("--batch", action="store_true",
+                        help="читать команды из stdin (по одной в строке) и выполнить их одной транзакцией")
+    add_commands(parser, required=False)
+    args = parser.parse_args()
+    if args.batch == (args.view is not None):
+        parser.error("укажите одну команду или --batch (команды из stdin)")
+    if not os.path.exists(args.db):
+        sys.exit(f"Ошибка: база {args.db} не найдена.")
+    conn = kkurs.get_connection(args.db, args.profile)
+    try:
+        if args.batch:
+            count = run_batch(conn, sys.stdin, sys.stdout, args.json)
+            print(f"Выполнено команд: {count}", file=sys.stderr)
+        else:
+            run_command(conn, args, sys.stdout, args.json)
+            conn.commit()
+    except (ValueError, sqlite3.Error) as e:
+        conn.rollback()
+        sys.exit(f"Ошибка: {str(e).rstrip('.')}.{' Ничего не изменено.' if args.batch else ''}")
+    except BrokenPipeError:
+        sys.stderr.close()  # Вывод обрезан (например, через head) - это не ошибка
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import argparse
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+
+import Soshina_1 as kkurs
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "soshina_2.sql")
+
+# Размер каждой таблицы по умолчанию - доля от --rows (в KKurs.db таблицы примерно одного размера)
+TABLE_SHARES = {"sources": 0.1, "persons": 0.1, "coordinates": 0.2, "events": 1.0, "texts": 1.0, "places": 0.5,
+                "interactions": 1.0}
+MIN_ROWS = 10 ** 3
+MAX_ROWS = 10 ** 7
+# Популярность: ссылка на i-й источник (персону, точку) выбирается как n * random() ** SKEW, так что первые
+# строки встречаются во много раз чаще последних - как Тютчев и его биографы в KKurs.db. 1 - равномерно.
+SOURCE_SKEW = 2.0
+PERSON_SKEW = 3.0
+COORDINATE_SKEW = 1.5
+CITIES = 50  # Сколько "городов", вокруг которых собирается большая часть точек
+CITY_SHARE = 0.7  # Доля точек рядом с городами, остальные - по всему земному шару
+
+def create_schema(conn):
+    """Создаёт таблицы KKurs (только CREATE TABLE из soshina_2.sql, без данных и без миграций)."""
+    with open(SCHEMA_FILE, encoding="utf-8") as f:
+        script = f.read()
+    for statement in script.split(";"):
+        lines = [line for line in statement.splitlines() if not line.strip().startswith("--")]
+        sql = "\n".join(lines).strip()
+        if sql.upper().startswith("CREATE TABLE"):
+            conn.execute(sql)
+    conn.commit()
+
+def pick(rnd, n, skew=1.0):
+    """Случайный id 1..n; при skew > 1 маленькие id выпадают чаще."""
+    return rnd.randint(1, n) if skew == 1.0 else int(n * rnd.random() ** skew) + 1
+
+def fill_sources(conn, rows, batch=50_000):
+    """Заполняет Sources строками с уникальными названиями."""
+    for start in range(0, rows, batch):
+        conn.executemany(
+            "INSERT INTO Sources (title, type, link, content, name) VALUES (?, ?, ?, ?, ?)",
+            ((f"Источник {i:08d}", "Книга", None, f"Содержание {i}", f"Автор {i % 1000}")
+             for i in range(start, min(start + batch, rows))))
+    conn.commit()
+
+# Словарь для синтетических описаний; последние слова редкие, чтобы было что искать
+WORDS = ("поэт", "дипломат", "письмо", "стихотворение", "журнал", "лекция", "философия", "Мюнхен",
+         "Петербург", "Москва", "сборник", "перевод", "служба", "семья", "дочь", "издание", "архив",
+         "рукопись", "конференция", "музей", "памятник", "усадьба", "Шеллинг", "Гейне", "Овстуг")
+SURNAMES = ("Тютчев", "Пушкин", "Жуковский", "Вяземский", "Раич", "Аксаков", "Тургенев", "Гагарин", "Погодин",
+            "Блудов", "Денисьева", "Дельвиг", "Мещерский", "Языков", "Фет", "Некрасов", "Толстой", "Майков")
+NAMES = ("Фёдор", "Иван", "Николай", "Александр", "Пётр", "Дмитрий", "Сергей", "Михаил", "Елена", "Анна",
+         "Мария", "Екатерина", "Дарья", "Эрнестина")
+PATRONYMICS = ("Иванович", "Николаевич", "Александрович", "Петрович", "Фёдорович", "Ивановна", "Николаевна",
+               "Фёдоровна", None)
+
+def make_description(rnd, words=12):
+    """Случайная фраза из словаря WORDS."""
+    return " ".join(rnd.choice(WORDS) for _ in range(words))
+
+def make_dates(rnd, rows, bad_share=0.01):
+    """Даты ГГГГ-ММ-ДД за 1700-2025 годы; доля bad_share испорчена (формат, месяц, день, год)."""
+    bad = ("2023-02-29", "1850-13-01", "18500101", "2030-01-01", "1850-1-01", "18x0-01-01")
+    return [rnd.choice(bad) if rnd.random() < bad_share else
+            f"{rnd.randint(1700, 2025)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}" for _ in range(rows)]
+
+def fill_persons(conn, rows, batch=50_000):
+    """Заполняет Persons: фамилии и имена из словарей (много однофамильцев), даты рождения 1700-1990 годов.
+
+    Фамилия, имя и отчество вместе уникальны (индекс миграции 1), поэтому повтор получает номер в фамилии.
+    """
+    rnd = random.Random(rows + 3)
+    seen = set()
+
+    def person(i):
+        full_name = (rnd.choice(SURNAMES), rnd.choice(NAMES), rnd.choice(PATRONYMICS))
+        if full_name in seen:
+            full_name = (f"{full_name[0]}-{i}",) + full_name[1:]
+        seen.add(full_name)
+        return full_name + (f"{rnd.randint(1700, 1990)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+                            make_description(rnd, 8))
+
+    for start in range(0, rows, batch):
+        conn.executemany(
+            "INSERT INTO Persons (surname, name, patronymic, date_of_birth, biography) VALUES (?, ?, ?, ?, ?)",
+            (person(i) for i in range(start, min(start + batch, rows))))
+    conn.commit()
+
+def fill_events(conn, rows, sources, batch=50_000, descriptions=False, skew=1.0):
+    """Заполняет Events строками со случайными датами и ссылками на источники 1..sources."""
+    rnd = random.Random(rows)
+    for start in range(0, rows, batch):
+        conn.executemany(
+            "INSERT INTO Events (name, data, description, resource_id) VALUES (?, ?, ?, ?)",
+            ((f"Событие {i:08d}", f"{rnd.randint(1700, 2025)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}",
+              make_description(rnd) if descriptions else f"Описание события {i}", pick(rnd, sources, skew))
+             for i in range(start, min(start + batch, rows))))
+    conn.commit()
+
+def fill_texts(conn, rows, sources, batch=50_000, skew=1.0):
+    """Заполняет Tex строками, у которых, как в KKurs.db, часто указан только год."""
+    rnd = random.Random(rows + 1)
+    for start in range(0, rows, batch):
+        conn.executemany(
+            "INSERT INTO Tex (name, content, data, resource_id) VALUES (?, ?, ?, ?)",
+            ((f"Текст {i:08d}", f"Содержание текста {i}",
+              f"{rnd.randint(1700, 2025)}" if rnd.random() < 0.5 else
+              f"{rnd.randint(1700, 2025)}-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}", pick(rnd, sources, skew))
+             for i in range(start, min(start + batch, rows))))
+    conn.commit()
+
+def fill_interactions(conn, rows, persons, sources, batch=50_000, person_skew=1.0):
+    """Заполняет PeopleInteractions: персоны 1..persons, источники 1..sources, популярные источники чаще."""
+    rnd = random.Random(rows + 2)
+    for start in range(0, rows, batch):
+        conn.executemany(
+            "INSERT INTO PeopleInteractions (resource_id, person_id, description) VALUES (?, ?, ?)",
+            ((pick(rnd, sources, SOURCE_SKEW), pick(rnd, persons, person_skew), None)
+             for _ in range(start, min(start + batch, rows))))
+    conn.commit()
+
+def fill_coordinates(conn, rows, batch=50_000, cities=0):
+    """Заполняет Coordinates точками, равномерными по поверхности Земли; при cities > 0 большая часть
+    точек (CITY_SHARE) лежит в паре десятков километров от одного из cities случайных центров."""
+    rnd = random.Random(rows + 4)
+    centres = [(math.degrees(math.asin(rnd.uniform(-0.9, 0.9))), rnd.uniform(-180, 180)) for _ in range(cities)]
+
+    def point():
+        if centres and rnd.random() < CITY_SHARE:
+            lat, lon = rnd.choice(centres)
+            return max(-90.0, min(90.0, rnd.gauss(lat, 0.2))), (rnd.gauss(lon, 0.3) + 180) % 360 - 180
+        return math.degrees(math.asin(rnd.uniform(-1, 1))), rnd.uniform(-180, 180)
+
+    for start in range(0, rows, batch):
+        conn.executemany("INSERT INTO Coordinates (id, latitude, longitude, name) VALUES (?, ?, ?, ?)",
+                         ((i, *point(), f"Точка {i}") for i in range(start + 1, min(start + batch, rows) + 1)))
+    conn.commit()
+
+def fill_places(conn, rows, batch=50_000, coordinates=None, sources=0):
+    """Заполняет Places. Без coordinates - по новой точке Coordinates на каждое место (точки заполняются здесь же);
+    с coordinates - места ссылаются на уже заполненные точки 1..coordinates (на популярные по нескольку мест),
+    а при sources > 0 ещё и на источники."""
+    if coordinates is None:
+        fill_coordinates(conn, rows, batch)
+    rnd = random.Random(rows + 5)
+    for start in range(0, rows, batch):
+        ids = range(start + 1, min(start + batch, rows) + 1)
+        conn.executemany("INSERT INTO Places (id, name, resource_id, coordinate_id) VALUES (?, ?, ?, ?)",
+                         ((i, f"Место {i}", pick(rnd, sources, SOURCE_SKEW) if sources else None,
+                           pick(rnd, coordinates, COORDINATE_SKEW) if coordinates else i) for i in ids))
+    conn.commit()
+
+def table_sizes(rows, overrides=None):
+    """Число строк для каждой таблицы: доля TABLE_SHARES от rows (не меньше 1), затем явные размеры overrides."""
+    sizes = {view: max(1, int(rows * share)) for view, share in TABLE_SHARES.items()}
+    sizes.update(overrides or {})
+    return sizes
+
+def generate(path, sizes, migrate=True):
+    """Создаёт базу path со всеми таблицами KKurs; sizes - {представление: строк} (см. table_sizes).
+
+    Ссылки только на существующие строки и с перекосом популярности (SOURCE_SKEW, PERSON_SKEW,
+    COORDINATE_SKEW); данные зависят только от размеров, так что одинаковые sizes дают одинаковую базу.
+    С migrate после заполнения выполняются миграции Soshina_1 (индексы, FTS, R*Tree, счётчики ссылок):
+    так быстрее, чем поддерживать их триггерами при каждой вставке. Возвращает {таблица: секунды}.
+    """
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    create_schema(conn)
+    sources, persons, coordinates = sizes["sources"], sizes["persons"], sizes["coordinates"]
+    steps = (("sources", lambda: fill_sources(conn, sources)),
+             ("persons", lambda: fill_persons(conn, persons)),
+             ("coordinates", lambda: fill_coordinates(conn, coordinates, cities=CITIES)),
+             ("events", lambda: fill_events(conn, sizes["events"], sources, descriptions=True, skew=SOURCE_SKEW)),
+             ("texts", lambda: fill_texts(conn, sizes["texts"], sources, skew=SOURCE_SKEW)),
+             ("places", lambda: fill_places(conn, sizes["places"], coordinates=coordinates, sources=sources)),
+             ("interactions", lambda: fill_interactions(conn, sizes["interactions"], persons, sources,
+                                                        person_skew=PERSON_SKEW)))
+    seconds = {}
+    for view, step in steps:
+        start = time.perf_counter()
+        step()
+        seconds[view] = time.perf_counter() - start
+    conn.close()
+    if migrate:
+        start = time.perf_counter()
+        kkurs.get_connection(path).close()
+        seconds["migrations"] = time.perf_counter() - start
+    return seconds
+
+def parse_sizes(items):
+    """["events=1e6", "persons=5000"] -> {"events": 1000000, "persons": 5000}."""
+    sizes = {}
+    for item in items:
+        view, sep, value = item.partition("=")
+        if not sep or view not in TABLE_SHARES:
+            raise ValueError(f"--size ожидает представление=число строк ({', '.join(TABLE_SHARES)}), а не {item!r}")
+        try:
+            sizes[view] = int(float(value))
+        except ValueError:
+            raise ValueError(f"число строк должно быть числом: {item!r}") from None
+    return sizes
+
+def main():
+    parser = argparse.ArgumentParser(description="Синтетическая база KKurs заданного размера.")
+    parser.add_argument("path", help="куда записать базу")
+    parser.add_argument("--rows", type=float, default=100_000,
+                        help=f"строк в Events, Tex и PeopleInteractions (от {MIN_ROWS:g} до {MAX_ROWS:g}, можно 1e6); "
+                             "остальные таблицы - по TABLE_SHARES")
+    parser.add_argument("--size", action="append", default=[], metavar="ТАБЛИЦА=СТРОК",
+                        help="размер отдельной таблицы, например persons=1e4")
+    parser.add_argument("--force", action="store_true", help="перезаписать существующий файл")
+    parser.add_argument("--no-migrate", action="store_true", help="только таблицы из soshina_2.sql, без индексов и FTS")
+    args = parser.parse_args()
+    try:
+        sizes = table_sizes(int(args.rows), parse_sizes(args.size))
+    except ValueError as e:
+        sys.exit(f"Ошибка: {e}")
+    for view, rows in sizes.items():
+        if not 1 <= rows <= MAX_ROWS:
+            sys.exit(f"Ошибка: {view}: {rows} строк, можно от 1 до {MAX_ROWS:g}.")
+    if os.path.exists(args.path):
+        if not args.force:
+            sys.exit(f"Ошибка: {args.path} уже существует (--force - перезаписать).")
+        for suffix in ("", "-wal", "-shm", ".snap"):
+            if os.path.exists(args.path + suffix):
+                os.remove(args.path + suffix)
+    seconds = generate(args.path, sizes, not args.no_migrate)
+    for view, rows in sizes.items():
+        print(f"{kkurs.TABLES[view][0]:>20}: {rows:>10,} строк, {seconds[view]:6.1f} с")
+    if "migrations" in seconds:
+        print(f"{'миграции':>20}: {seconds['migrations']:6.1f} с")
+
+if __name__ == "__main__":
+    main()
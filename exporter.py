@@ -0,0 +1,179 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import Soshina_1 as kkurs
+
+CHUNK_SIZE = 10_000  # Строк, которые читаются из курсора и пишутся в файл за раз
+FORMATS = ("jsonl", "csv", "parquet")
+TABLES = ("Sources", "Coordinates", "Persons", "Events", "Tex", "Places", "PeopleInteractions")
+
+def dataset_query(name):
+    """SQL для набора: таблица целиком по id или представление *_list_all (имя представления + "_list")."""
+    if name in TABLES:
+        return f"SELECT * FROM {name} ORDER BY id"
+    columns, source, key, id_column = kkurs.LIST_VIEWS[name[:-len("_list")]]
+    return f"SELECT {columns} FROM {source} ORDER BY {key}, {id_column}"
+
+def all_datasets():
+    """Имена всех наборов: семь таблиц и представления *_list_all."""
+    return list(TABLES) + [f"{view}_list" for view in kkurs.LIST_VIEWS]
+
+def storage_classes(conn, query, columns):
+    """Классы хранения SQLite (typeof), встречающиеся в каждом столбце набора, - один проход по набору в SQLite."""
+    parts = ", ".join(f"group_concat(DISTINCT typeof(\"{column}\"))" for column in columns)
+    row = conn.execute(f"SELECT {parts} FROM ({query})").fetchone()
+    return [set(value.split(",")) - {"null"} if value else set() for value in row]
+
+def arrow_schema(columns, classes):
+    """Схема Parquet по классам хранения всего столбца: целые, дробные (целые и дробные вперемешку), байты, иначе строки.
+
+    Столбец, в котором встречаются значения разных видов (например, числа и текст), пишется строками,
+    поэтому любая пачка подходит к схеме.
+    """
+    import pyarrow as pa
+    fields = []
+    for column, kinds in zip(columns, classes):
+        if kinds == {"integer"}:
+            type_ = pa.int64()
+        elif kinds and kinds <= {"integer", "real"}:
+            type_ = pa.float64()
+        elif kinds == {"blob"}:
+            type_ = pa.binary()
+        else:
+            type_ = pa.string()
+        fields.append(pa.field(column, type_))
+    return pa.schema(fields)
+
+class JsonlWriter:
+    """Пишет строки как JSON-объекты, по одному на строку файла."""
+
+    def __init__(self, path, columns):
+        self.file = open(path, "w", encoding="utf-8")
+        self.columns = columns
+
+    def write(self, rows):
+        columns = self.columns
+        self.file.writelines(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n" for row in rows)
+
+    def close(self):
+        self.file.close()
+
+class CsvWriter:
+    """Пишет CSV с заголовком."""
+
+    def __init__(self, path, columns):
+        self.file = open(path, "w", encoding="utf-8", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+class ParquetWriter:
+    """Пишет Parquet по одной группе строк на пачку; схема - по классам хранения всего набора (storage_classes)."""
+
+    def __init__(self, path, columns, classes):
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("для экспорта в Parquet нужен пакет pyarrow (pip install pyarrow)") from None
+        self.path = path
+        self.columns = columns
+        self.schema = arrow_schema(columns, classes)
+        self.writer = None
+
+    def write(self, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = self.schema
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, schema)
+        arrays = []
+        for i, field in enumerate(schema):
+            values = [row[i] for row in rows]
+            if pa.types.is_string(field.type):
+                values = [None if value is None else str(value) for value in values]
+            arrays.append(pa.array(values, type=field.type))
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+    def close(self):
+        if self.writer is None:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            pq.write_table(self.schema.empty_table(), self.path)
+        else:
+            self.writer.close()
+
+WRITERS = {"jsonl": JsonlWriter, "csv": CsvWriter, "parquet": ParquetWriter}
+
+def export_dataset(db_path, name, out_dir, fmt="jsonl", chunk_size=CHUNK_SIZE):
+    """Выгружает один набор в out_dir/<name>.<fmt>, читая по chunk_size строк; возвращает (имя, строк, секунд).
+
+    Открывает своё подключение только для чтения, поэтому наборы можно выгружать в разных процессах.
+    """
+    start = time.perf_counter()
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        query = dataset_query(name)
+        cursor = conn.execute(query)
+        columns = [column[0] for column in cursor.description]
+        path = os.path.join(out_dir, f"{name}.{fmt}")
+        if fmt == "parquet":
+            writer = ParquetWriter(path, columns, storage_classes(conn, query, columns))
+        else:
+            writer = WRITERS[fmt](path, columns)
+        count = 0
+        try:
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                writer.write(rows)
+                count += len(rows)
+        finally:
+            writer.close()
+    finally:
+        conn.close()
+    return name, count, time.perf_counter() - start
+
+def export_all(db_path, out_dir, fmt="jsonl", datasets=None, workers=1, chunk_size=CHUNK_SIZE):
+    """Выгружает наборы (по умолчанию все) последовательно или в workers процессах; возвращает список итогов."""
+    # Схему доводим до последней версии до экспорта: подключения экспорта только читают
+    kkurs.get_connection(db_path).close()
+    os.makedirs(out_dir, exist_ok=True)
+    datasets = datasets or all_datasets()
+    if workers <= 1:
+        return [export_dataset(db_path, name, out_dir, fmt, chunk_size) for name in datasets]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(export_dataset, db_path, name, out_dir, fmt, chunk_size) for name in datasets]
+        return [future.result() for future in futures]
+
+def main():
+    parser = argparse.ArgumentParser(description="Потоковая выгрузка базы KKurs в JSONL/CSV/Parquet.")
+    parser.add_argument("out_dir", help="каталог для файлов")
+    parser.add_argument("--db", default=kkurs.DB_NAME, help="путь к базе данных")
+    parser.add_argument("--format", choices=FORMATS, default="jsonl", help="формат файлов")
+    parser.add_argument("--only", nargs="+", choices=all_datasets(), help="выгрузить только эти наборы")
+    parser.add_argument("--workers", type=int, default=1, help="сколько наборов выгружать параллельно")
+    parser.add_argument("--chunk", type=int, default=CHUNK_SIZE, help="строк в одной пачке")
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        sys.exit(f"Ошибка: база {args.db} не найдена.")
+    try:
+        results = export_all(args.db, args.out_dir, args.format, args.only, args.workers, args.chunk)
+    except RuntimeError as e:
+        sys.exit(f"Ошибка: {e}")
+    for name, count, seconds in results:
+        print(f"{name}: {count} строк, {seconds:.1f} с")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import Soshina_1 as kkurs
+
+BATCH_SIZE = 10_000  # Строк в одном executemany
+COMMIT_EVERY = 200_000  # Строк в одной транзакции
+IMPORT_CACHE_KB = 256 * 1024  # Кэш страниц на время загрузки, КБ: вставки в индексы реже идут на диск
+
+EMPTY = (None, "")  # Пустое поле в CSV приходит как "", в JSONL - как null
+SCALARS = (str, int, float, type(None))  # Значения полей, которые можно передать в SQLite
+
+# Ссылочное поле во входном файле -> (столбец внешнего ключа, таблица, столбец для поиска id)
+REFERENCES = {
+    "source": ("resource_id", "Sources", "title"),
+    "coordinate": ("coordinate_id", "Coordinates", "name"),
+    "person": ("person_id", "Persons", "surname"),
+}
+
+# Таблица -> столбцы для вставки, обязательные поля, даты, числа и ссылки (поле файла из REFERENCES)
+TABLES = {
+    "Sources": {"columns": ("title", "type", "link", "content", "name"), "required": ("title",)},
+    "Coordinates": {"columns": ("latitude", "longitude", "name"), "required": ("latitude", "longitude"),
+                    "floats": ("latitude", "longitude")},
+    "Persons": {"columns": ("surname", "name", "patronymic", "date_of_birth", "biography"), "required": ("surname",),
+                "dates": ("date_of_birth",)},
+    "Events": {"columns": ("name", "data", "description", "resource_id"), "required": ("name", "data", "source"),
+               "dates": ("data",), "refs": ("source",)},
+    "Tex": {"columns": ("name", "content", "data", "resource_id"), "required": ("name", "data"),
+            "dates": ("data",), "refs": ("source",)},
+    "Places": {"columns": ("name", "resource_id", "coordinate_id"), "required": ("name", "coordinate", "source"),
+               "refs": ("source", "coordinate")},
+    "PeopleInteractions": {"columns": ("description", "resource_id", "person_id"), "required": ("person", "source"),
+                           "refs": ("source", "person")},
+}
+
+# Начало текста sqlite3.IntegrityError -> причина отказа для файла отбракованных строк
+CONSTRAINT_ERRORS = {
+    "UNIQUE": "такая запись уже есть",
+    "FOREIGN KEY": "нет связанной записи",
+    "NOT NULL": "не заполнено обязательное поле",
+}
+
+class RowError(Exception):
+    """Строка входного файла не прошла проверку."""
+
+def constraint_error(e):
+    """Причина отказа по sqlite3.IntegrityError: какое ограничение нарушено и исходный текст ошибки."""
+    reason = next((text for prefix, text in CONSTRAINT_ERRORS.items() if str(e).startswith(prefix)),
+                  "нарушено ограничение")
+    return f"{reason} ({e})"
+
+AMBIGUOUS = object()  # Значение ссылочного поля подходит к нескольким строкам
+
+class LookupCache:
+    """Кэш "значение -> id" для ссылочных полей, чтобы не спрашивать базу об одном и том же источнике дважды."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, table, column, value):
+        """id строки table, у которой column = value, или None; RowError, если таких строк несколько."""
+        key = (table, value)
+        if key in self.cache:
+            self.hits += 1
+            ref_id = self.cache[key]
+        else:
+            self.misses += 1
+            # Если значения повторяются (например, две персоны с фамилией Тютчев), строку не угадываем
+            rows = self.conn.execute(f"SELECT id FROM {table} WHERE {column} = ? LIMIT 2", (value,)).fetchall()
+            ref_id = self.cache[key] = AMBIGUOUS if len(rows) > 1 else rows[0][0] if rows else None
+        if ref_id is AMBIGUOUS:
+            raise RowError(f"неоднозначная ссылка: {table}.{column} = {value} у нескольких строк")
+        return ref_id
+
+def read_records(path, fmt=None):
+    """Построчно читает CSV (с заголовком) или JSONL; возвращает пары (номер строки, словарь).
+
+    Нечитаемая строка JSONL возвращается как словарь с ключами __error__ и raw.
+    """
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".json")) else "csv")
+    with open(path, encoding="utf-8", newline="") as f:
+        if fmt == "csv":
+            for line_no, record in enumerate(csv.DictReader(f), 2):
+                yield line_no, record
+        else:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_no, json.loads(line)
+                except ValueError as e:
+                    yield line_no, {"__error__": f"некорректный JSON: {e}", "raw": line.rstrip("\n")}
+
+def make_converter(spec, lookups):
+    """Готовит функцию, которая проверяет строку теми же правилами, что и ручной ввод, и возвращает значения для INSERT.
+
+    Разбор спецификации делается один раз на файл, а не на каждую строку.
+    """
+    columns = spec["columns"]
+    required = [(field, REFERENCES[field][0] if field in REFERENCES else field) for field in spec["required"]]
+    dates = spec.get("dates", ())
+    floats = spec.get("floats", ())
+    refs = [(field, columns.index(REFERENCES[field][0])) + REFERENCES[field][1:] for field in spec.get("refs", ())]
+
+    def convert(record):
+        if not isinstance(record, dict):
+            raise RowError("строка должна быть JSON-объектом")
+        if "__error__" in record:
+            raise RowError(record["__error__"])
+        get = record.get
+        for field, column in required:
+            if get(field) in EMPTY and get(column) in EMPTY:
+                raise RowError(f"не заполнено поле {field}")
+        for field in dates:
+            value = get(field)
+            if value not in EMPTY:
+                error = kkurs.date_error(str(value))
+                if error:
+                    raise RowError(f"{field}: {error}")
+        values = [None if get(column) in EMPTY else get(column) for column in columns]
+        wrong = [column for column, value in zip(columns, values) if not isinstance(value, SCALARS)]
+        if wrong:
+            raise RowError(f"значения должны быть строками, числами или null: {', '.join(wrong)}")
+        for field in floats:
+            i = columns.index(field)
+            if values[i] is not None:
+                try:
+                    values[i] = float(values[i])
+                except (TypeError, ValueError):
+                    raise RowError(f"{field} должно быть числом (например, 55.7558).") from None
+        for field, i, table, lookup_column in refs:
+            value = get(field)
+            if not isinstance(value, SCALARS):
+                raise RowError(f"{field} должно быть строкой или числом")
+            if value not in EMPTY:
+                ref_id = lookups.get(table, lookup_column, value)
+                if ref_id is None:
+                    raise RowError(f"{field} не найден: {value}")
+                values[i] = ref_id
+        return values
+
+    return convert
+
+def pause_fts(conn, table):
+    """Отключает построчное обновление FTS-индекса при вставке; возвращает id, после которого пойдут новые строки."""
+    conn.execute(f"DROP TRIGGER IF EXISTS {table}_fts_ai")
+    return conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+
+def resume_fts(conn, table, after_id):
+    """Добавляет в FTS-индекс строки с id > after_id одним запросом и возвращает триггер на место."""
+    columns = ", ".join(kkurs.FTS_TABLES[table])
+    conn.execute(f"INSERT INTO {table}_fts (rowid, {columns}) SELECT id, {columns} FROM {table} WHERE id > ?", (after_id,))
+    insert_trigger = kkurs.fts_migration(table, kkurs.FTS_TABLES[table])[1]
+    conn.execute(insert_trigger)
+
+def import_file(conn, table, path, reject_path=None, fmt=None, batch_size=BATCH_SIZE, commit_every=COMMIT_EVERY):
+    """Загружает файл в таблицу пачками executemany в больших транзакциях.
+
+    Плохие строки не останавливают загрузку: они пишутся в reject_path (JSONL с номером строки и причиной).
+    На время транзакции увеличивается кэш страниц, а FTS-индекс пополняется одним запросом перед каждым
+    commit вместо триггера на каждую строку. Возвращает словарь со счётчиками.
+    """
+    spec = TABLES[table]
+    sql = f"INSERT INTO {table} ({', '.join(spec['columns'])}) VALUES ({', '.join('?' * len(spec['columns']))})"
+    lookups = LookupCache(conn)
+    convert = make_converter(spec, lookups)
+    has_fts = table in kkurs.FTS_TABLES
+    stats = {"read": 0, "inserted": 0, "rejected": 0}
+    rejects = open(reject_path, "w", encoding="utf-8") if reject_path else None
+
+    def reject(line_no, record, error):
+        stats["rejected"] += 1
+        if rejects:
+            rejects.write(json.dumps({"line": line_no, "error": error, "record": record}, ensure_ascii=False) + "\n")
+
+    def flush(batch):
+        # Пачка вставляется целиком; если мешает ограничение или значение, которое нельзя передать
+        # в SQLite, пачка повторяется по строкам, чтобы отбраковать только плохие строки
+        conn.execute("SAVEPOINT import_batch")
+        try:
+            conn.executemany(sql, (values for _, _, values in batch))
+            stats["inserted"] += len(batch)
+        except (sqlite3.IntegrityError, sqlite3.ProgrammingError, sqlite3.InterfaceError):
+            conn.execute("ROLLBACK TO import_batch")
+            for line_no, record, values in batch:
+                try:
+                    conn.execute(sql, values)
+                    stats["inserted"] += 1
+                except sqlite3.IntegrityError as e:
+                    reject(line_no, record, constraint_error(e))
+                except (sqlite3.ProgrammingError, sqlite3.InterfaceError) as e:
+                    reject(line_no, record, f"значение нельзя записать в базу ({e})")
+        conn.execute("RELEASE import_batch")
+
+    def begin():
+        conn.execute("BEGIN")
+        return pause_fts(conn, table) if has_fts else None
+
+    def commit(fts_after):
+        if has_fts:
+            resume_fts(conn, table, fts_after)
+        conn.commit()
+        kkurs.invalidate_reference(conn, table)
+
+    old_cache_size = conn.execute("PRAGMA cache_size").fetchone()[0]
+    conn.execute(f"PRAGMA cache_size = {-IMPORT_CACHE_KB}")
+    start = time.perf_counter()
+    try:
+        fts_after = begin()
+        batch = []
+        in_transaction = 0
+        for line_no, record in read_records(path, fmt):
+            stats["read"] += 1
+            try:
+                batch.append((line_no, record, convert(record)))
+            except RowError as e:
+                reject(line_no, record, str(e))
+                continue
+            if len(batch) >= batch_size:
+                flush(batch)
+                in_transaction += len(batch)
+                batch = []
+                if in_transaction >= commit_every:
+                    commit(fts_after)
+                    fts_after = begin()
+                    in_transaction = 0
+        if batch:
+            flush(batch)
+        commit(fts_after)
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute(f"PRAGMA cache_size = {old_cache_size}")
+        if rejects:
+            rejects.close()
+    stats["seconds"] = time.perf_counter() - start
+    stats["lookup_hits"] = lookups.hits
+    stats["lookup_misses"] = lookups.misses
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная загрузка CSV/JSONL в базу KKurs.")
+    parser.add_argument("table", choices=sorted(TABLES), help="в какую таблицу загружать")
+    parser.add_argument("path", help="CSV с заголовком или JSONL")
+    parser.add_argument("--db", default=kkurs.DB_NAME, help="путь к базе данных")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="формат файла (по умолчанию по расширению)")
+    parser.add_argument("--rejects", help="куда писать отбракованные строки (JSONL)")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="строк в одном executemany")
+    args = parser.parse_args()
+    if not os.path.exists(args.path):
+        sys.exit(f"Ошибка: файл {args.path} не найден.")
+    conn = kkurs.get_connection(args.db)
+    try:
+        stats = import_file(conn, args.table, args.path, args.rejects, args.format, args.batch)
+    finally:
+        conn.close()
+    rate = stats["inserted"] / stats["seconds"] if stats["seconds"] else 0
+    print(f"Прочитано: {stats['read']}, добавлено: {stats['inserted']}, отбраковано: {stats['rejected']}, "
+          f"{stats['seconds']:.1f} с ({rate:,.0f} строк/с)")
+
+if __name__ == "__main__":
+    main()
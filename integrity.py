@@ -0,0 +1,177 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import Soshina_1 as kkurs
+
+REPAIR_ACTIONS = {"cascade": "delete", "set-null": "null"}  # Режим связи -> исправление по умолчанию
+SAMPLE_VALUES = 10  # Сколько повисших значений показывать в отчёте
+
+# Повисшая ссылка (сирота) - значение столбца, для которого нет строки в таблице, на которую он ссылается.
+# Поиск - один запрос на связь: сначала группировка по индексу на столбце ссылки (миграция 1) даёт
+# различные значения с числом строк, а затем только эти значения проверяются по первичному ключу. Проверок
+# столько, сколько различных значений, а не строк, и таблицы не читаются - только индексы.
+
+def orphan_values_sql(child, column, parent):
+    """SQL: повисшие значения столбца column таблицы child и число строк с каждым (value, rows)."""
+    return (f"SELECT value, rows FROM (SELECT {column} AS value, count(*) AS rows FROM {child} "
+            f"WHERE {column} IS NOT NULL GROUP BY {column}) WHERE value NOT IN (SELECT id FROM {parent})")
+
+def scan(conn, modes=None):
+    """Ищет повисшие ссылки по всем связям kkurs.REFERENCES.
+
+    Возвращает список словарей: child, column, parent, mode (режим связи), values (число различных
+    повисших значений), rows (строк с ними), sample (первые SAMPLE_VALUES значений).
+    """
+    modes = modes or kkurs.integrity_modes()
+    found = []
+    for child, column, parent in kkurs.REFERENCES:
+        orphans = conn.execute(orphan_values_sql(child, column, parent)).fetchall()
+        found.append({"child": child, "column": column, "parent": parent, "mode": modes[(child, column)],
+                      "values": len(orphans), "rows": sum(rows for _, rows in orphans),
+                      "sample": [value for value, _ in orphans[:SAMPLE_VALUES]]})
+    return found
+
+def repair(conn, actions):
+    """Исправляет повисшие ссылки: actions - {(таблица, столбец): "delete" или "null"}; связи без действия не трогаются.
+
+    На связь - три запроса: повисшие значения во временную таблицу и один DELETE или UPDATE строк с ними
+    (по индексу на столбце). commit не вызывает. Возвращает {(таблица, столбец): (действие, строк)}.
+    """
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS orphan_values (value PRIMARY KEY)")
+    done = {}
+    for child, column, parent in kkurs.REFERENCES:
+        action = actions.get((child, column))
+        if action is None:
+            continue
+        conn.execute("DELETE FROM temp.orphan_values")
+        conn.execute(f"INSERT INTO temp.orphan_values SELECT value FROM ({orphan_values_sql(child, column, parent)})")
+        if action == "delete":
+            sql = f"DELETE FROM {child} WHERE {column} IN (SELECT value FROM temp.orphan_values)"
+        else:
+            sql = f"UPDATE {child} SET {column} = NULL WHERE {column} IN (SELECT value FROM temp.orphan_values)"
+        count = conn.execute(sql).rowcount
+        if count:
+            done[(child, column)] = (action, count)
+            kkurs.invalidate_reference(conn, child)
+            if child == "PeopleInteractions" and isinstance(conn, kkurs.KKursConnection):
+                conn.graph = None
+    return done
+
+def repair_actions(modes, action=None, only=()):
+    """Что исправлять: по умолчанию по режиму связи (cascade - удалить строки, set-null - очистить ссылку,
+    restrict - не трогать); action ("delete" или "null") - одно действие для всех связей; only - только эти связи."""
+    actions = {}
+    for key, mode in modes.items():
+        if only and f"{key[0]}.{key[1]}" not in only:
+            continue
+        chosen = action or REPAIR_ACTIONS.get(mode)
+        if chosen:
+            actions[key] = chosen
+    return actions
+
+def dedupe(conn, indexes=None):
+    """Объединяет повторяющиеся строки, которые не дают создать уникальные индексы (kkurs.UNIQUE_INDEXES).
+
+    В каждой группе остаётся строка с меньшим id: ссылки на остальные (kkurs.REFERENCES) переводятся на неё,
+    а сами остальные удаляются вместе со значениями своих столбцов. commit не вызывает.
+    Возвращает {индекс: (групп, удалено строк)}.
+    """
+    done = {}
+    for index in indexes or kkurs.UNIQUE_INDEXES:
+        table, _ = kkurs.UNIQUE_INDEXES[index]
+        groups = kkurs.duplicate_rows(conn, index, limit=None)
+        if not groups:
+            continue
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS duplicate_ids (id INTEGER PRIMARY KEY, keep INTEGER NOT NULL)")
+        conn.execute("DELETE FROM temp.duplicate_ids")
+        conn.executemany("INSERT INTO temp.duplicate_ids VALUES (?, ?)",
+                         ((row_id, ids[0]) for ids in groups for row_id in ids[1:]))
+        for child, column, parent in kkurs.REFERENCES:
+            if parent == table:
+                conn.execute(f"UPDATE {child} SET {column} = (SELECT keep FROM temp.duplicate_ids WHERE id = {column}) "
+                             f"WHERE {column} IN (SELECT id FROM temp.duplicate_ids)")
+                kkurs.invalidate_reference(conn, child)
+        count = conn.execute(f"DELETE FROM {table} WHERE id IN (SELECT id FROM temp.duplicate_ids)").rowcount
+        kkurs.invalidate_reference(conn, table)
+        if table == "Persons" and isinstance(conn, kkurs.KKursConnection):
+            conn.graph = None
+        done[index] = (len(groups), count)
+    return done
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Повисшие ссылки KKurs (resource_id, coordinate_id, person_id без строки, на которую они ссылаются).",
+        epilog="Режимы связей задаёт KKURS_INTEGRITY, например \"*=restrict,Places.coordinate_id=set-null\".")
+    parser.add_argument("--db", default=kkurs.DB_NAME, help="путь к базе данных")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("scan", help="найти повисшие ссылки")
+    command.add_argument("--json", action="store_true", help="отчёт одним JSON-массивом")
+    command = commands.add_parser("repair", help="исправить повисшие ссылки одной транзакцией")
+    command.add_argument("--action", choices=("delete", "null"),
+                         help="удалить строки или очистить ссылку во всех связях (по умолчанию - по режиму связи; "
+                              "связи restrict без --action не трогаются)")
+    command.add_argument("--only", action="append", default=[], metavar="ТАБЛИЦА.СТОЛБЕЦ", help="только эта связь")
+    command.add_argument("--dry-run", action="store_true", help="посчитать и откатить")
+    command = commands.add_parser("dedupe", help="объединить повторяющиеся строки, из-за которых не применяется миграция")
+    command.add_argument("--dry-run", action="store_true", help="посчитать и откатить")
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        sys.exit(f"Ошибка: база {args.db} не найдена.")
+    # dedupe нужен, когда миграция не применяется, поэтому подключается без них
+    conn = sqlite3.connect(args.db) if args.command == "dedupe" else kkurs.get_connection(args.db)
+    start = time.perf_counter()
+    try:
+        modes = kkurs.integrity_modes()
+        if args.command == "scan":
+            found = scan(conn, modes)
+            if args.json:
+                print(json.dumps(found, ensure_ascii=False))
+            for item in [] if args.json else found:
+                print(f"{item['child']}.{item['column']} -> {item['parent']} ({item['mode']}): "
+                      + (f"строк {item['rows']:,} с {item['values']:,} значениями, например "
+                         f"{', '.join(map(str, item['sample']))}" if item["rows"] else "нет"))
+            print(f"Проверено за {time.perf_counter() - start:.2f} с", file=sys.stderr)
+            if any(item["rows"] for item in found):
+                sys.exit(1)
+            return
+        if args.command == "dedupe":
+            conn.execute("BEGIN")
+            done = dedupe(conn)
+            if args.dry_run:
+                conn.rollback()
+            else:
+                conn.commit()
+            for index, (groups, count) in done.items():
+                table, key = kkurs.UNIQUE_INDEXES[index]
+                print(f"{table} ({', '.join(key)}): групп {groups:,}, удалено строк {count:,}")
+            print(f"{'Пробный запуск: ' if args.dry_run else ''}объединено индексов: {len(done)}, "
+                  f"{time.perf_counter() - start:.2f} с")
+            return
+        unknown = [name for name in args.only if tuple(name.split(".", 1)) not in modes]
+        if unknown:
+            raise ValueError(f"нет такой связи: {', '.join(unknown)}")
+        actions = repair_actions(modes, args.action, args.only)
+        if not actions:
+            raise ValueError("нечего исправлять: все связи restrict, укажите --action")
+        conn.execute("BEGIN")
+        done = repair(conn, actions)
+        if args.dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+        for (child, column), (action, count) in done.items():
+            print(f"{child}.{column}: {'удалено строк' if action == 'delete' else 'очищено ссылок'} {count:,}")
+        print(f"{'Пробный запуск: ' if args.dry_run else ''}исправлено связей: {len(done)}, "
+              f"{time.perf_counter() - start:.2f} с")
+    except (ValueError, sqlite3.Error) as e:
+        conn.rollback()
+        sys.exit(f"Ошибка: {str(e).rstrip('.')}.{' Ничего не изменено.' if args.command != 'scan' else ''}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
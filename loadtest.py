@@ -0,0 +1,147 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from urllib.parse import quote
+
+import Soshina_1 as kkurs
+
+CLIENTS = 100  # Одновременных клиентов по умолчанию
+DURATION = 10.0  # Секунд нагрузки по умолчанию
+
+def request_mix(ids):
+    """Запросы к сервису вперемешку: в основном чтения, немного поиска и записей."""
+    views = [view for view in kkurs.TABLES if ids.get(view)]
+
+    def page(rnd):
+        return "GET", f"/{rnd.choice(views)}?limit=50", None
+
+    def one(rnd):
+        view = rnd.choice(views)
+        return "GET", f"/{view}/{rnd.choice(ids[view])}", None
+
+    def prefix(rnd):
+        return "GET", f"/sources/search?q={quote(rnd.choice('АБВГДКМПСТ'))}", None
+
+    def full_text(rnd):
+        return "GET", f"/search?q={quote(rnd.choice(('стихи', 'письмо', 'Москва', 'служба')))}", None
+
+    def add(rnd):
+        body = {"name": f"Нагрузочное событие {uuid.uuid4().hex}", "data": "1850-01-01",
+                "resource_id": rnd.choice(ids["sources"])}
+        return "POST", "/events", json.dumps(body, ensure_ascii=False).encode()
+
+    return [(0.35, page), (0.40, one), (0.10, prefix), (0.10, full_text), (0.05, add)]
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+async def call(reader, writer, method, path, body):
+    """Отправляет один запрос по открытому keep-alive соединению; возвращает код ответа."""
+    head = f"{method} {path} HTTP/1.1\r\nHost: kkurs\r\nContent-Length: {len(body or b'')}\r\n\r\n"
+    writer.write(head.encode() + (body or b""))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    if length:
+        await reader.readexactly(length)
+    return status
+
+async def client(host, port, mix, deadline, seed, latencies, statuses):
+    rnd = random.Random(seed)
+    weights = [weight for weight, _ in mix]
+    makers = [maker for _, maker in mix]
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            method, path, body = rnd.choices(makers, weights)[0](rnd)
+            start = time.perf_counter()
+            status = await call(reader, writer, method, path, body)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+async def run(host, port, ids, clients=CLIENTS, duration=DURATION, writes=True):
+    """Нагружает сервис clients клиентами duration секунд; возвращает словарь с p50/p99 (мс) и запросами в секунду."""
+    mix = request_mix(ids)
+    if not writes:
+        mix = [(weight, maker) for weight, maker in mix if maker.__name__ != "add"]
+    latencies = []
+    statuses = {}
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(client(host, port, mix, deadline, seed, latencies, statuses) for seed in range(clients)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "clients": clients, "requests": len(latencies), "seconds": elapsed,
+        "rps": len(latencies) / elapsed, "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000, "max_ms": (latencies[-1] if latencies else 0) * 1000,
+        "statuses": statuses,
+    }
+
+def sample_ids(db_name, count=1000):
+    """Случайные id каждой таблицы для запросов одной записи."""
+    conn = kkurs.get_connection(db_name)
+    try:
+        return {view: [row[0] for row in conn.execute(f"SELECT id FROM {table} ORDER BY random() LIMIT ?", (count,))]
+                for view, (table, _) in kkurs.TABLES.items()}
+    finally:
+        conn.close()
+
+async def self_hosted(db_name, clients, duration, writes, readers):
+    """Поднимает сервис в этом же процессе на свободном порту и нагружает его."""
+    import service
+    svc = service.Service(db_name, readers=readers)
+    server = await svc.start(port=0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        result = await run("127.0.0.1", port, sample_ids(db_name), clients, duration, writes)
+        result["pool"] = svc.pool.metrics()
+        return result
+    finally:
+        server.close()
+        await server.wait_closed()
+        svc.close()
+
+def report(result):
+    print(f"Клиентов: {result['clients']}, запросов: {result['requests']} за {result['seconds']:.1f} с")
+    print(f"  {result['rps']:,.0f} запросов/с, p50 {result['p50_ms']:.1f} мс, p99 {result['p99_ms']:.1f} мс, "
+          f"макс. {result['max_ms']:.1f} мс")
+    print("  коды ответов: " + ", ".join(f"{status}: {count}" for status, count in sorted(result["statuses"].items())))
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест HTTP-сервиса KKurs: p50/p99 и запросы в секунду.")
+    parser.add_argument("--db", default=kkurs.DB_NAME, help="база, id из которой берутся для запросов")
+    parser.add_argument("--url", help="адрес запущенного сервиса (host:port); без него сервис поднимается здесь же")
+    parser.add_argument("--clients", type=int, default=CLIENTS, help="одновременных клиентов")
+    parser.add_argument("--duration", type=float, default=DURATION, help="секунд нагрузки")
+    parser.add_argument("--readers", type=int, help="подключений для чтения у поднятого здесь сервиса")
+    parser.add_argument("--read-only", action="store_true", help="не посылать запросы на запись")
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        sys.exit(f"Ошибка: база {args.db} не найдена.")
+    if args.url:
+        host, _, port = args.url.removeprefix("http://").rstrip("/").partition(":")
+        result = asyncio.run(run(host, int(port or 80), sample_ids(args.db), args.clients, args.duration,
+                                 not args.read_only))
+    else:
+        result = asyncio.run(self_hosted(args.db, args.clients, args.duration, not args.read_only, args.readers))
+    report(result)
+
+if __name__ == "__main__":
+    main()
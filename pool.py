@@ -0,0 +1,200 @@
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+
+import Soshina_1 as kkurs
+
+MAX_READERS = 8  # Сколько подключений для чтения может быть открыто одновременно
+ACQUIRE_TIMEOUT = 5.0  # Сколько секунд ждать свободное подключение или очередь записи
+
+class PoolTimeout(Exception):
+    """Не дождались свободного подключения за отведённое время."""
+
+class PoolClosed(Exception):
+    """Пул уже закрыт."""
+
+class ConnectionPool:
+    """Пул подключений к KKurs: несколько читателей и один писатель.
+
+    Читатели берут подключения из очереди (не больше max_readers одновременно); в режиме WAL
+    они не мешают друг другу и писателю, а sqlite3 отпускает GIL на время запроса, так что чтения
+    из разных потоков идут параллельно. SQLite допускает только одного писателя, поэтому все записи
+    выполняет один поток со своим подключением, по очереди. Функции чтения и записи получают
+    подключение первым аргументом, как функции Soshina_1.
+    """
+
+    def __init__(self, db_name=None, profile=None, max_readers=MAX_READERS, timeout=ACQUIRE_TIMEOUT):
+        self.db_name = db_name or kkurs.DB_NAME
+        self.profile = profile
+        self.max_readers = max_readers
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.closed = False
+        self.stats = {
+            "readers_created": 0, "readers_in_use": 0, "read_acquires": 0, "read_timeouts": 0,
+            "read_wait_seconds": 0.0, "writes": 0, "write_errors": 0, "write_timeouts": 0,
+            "write_queue_max": 0, "write_seconds": 0.0,
+        }
+        # Миграции схемы применяются до того, как появятся читатели
+        kkurs.get_connection(self.db_name, profile).close()
+        self.jobs = queue.Queue()
+        # Писатель открывает подключение в своём потоке; если это не удалось, пул не создаётся,
+        # иначе каждая запись ждала бы мёртвый поток и заканчивалась PoolTimeout
+        opened = Future()
+        self.writer = threading.Thread(target=self._write_loop, args=(opened,), name="kkurs-writer", daemon=True)
+        self.writer.start()
+        try:
+            opened.result()
+        except BaseException:
+            self.closed = True
+            self.writer.join()
+            raise
+
+    # --- Чтение ---
+
+    def _open_reader(self):
+        conn = sqlite3.connect(self.db_name, check_same_thread=False, cached_statements=kkurs.CACHED_STATEMENTS,
+                               factory=kkurs.KKursConnection)
+        kkurs.apply_pragmas(conn, kkurs.connection_pragmas(self.profile))
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    @contextmanager
+    def reader(self, timeout=None):
+        """Выдаёт подключение только для чтения на время блока with."""
+        if self.closed:
+            raise PoolClosed("пул закрыт")
+        timeout = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+        conn = None
+        with self.lock:
+            self.stats["read_acquires"] += 1
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                if self.stats["readers_created"] < self.max_readers:
+                    self.stats["readers_created"] += 1
+                    conn = False  # Создадим вне блокировки
+        if conn is False:
+            try:
+                conn = self._open_reader()
+            except Exception:
+                with self.lock:
+                    self.stats["readers_created"] -= 1
+                raise
+        elif conn is None:
+            try:
+                conn = self.idle.get(timeout=timeout)
+            except queue.Empty:
+                with self.lock:
+                    self.stats["read_timeouts"] += 1
+                raise PoolTimeout(f"нет свободного подключения для чтения за {timeout} с") from None
+        with self.lock:
+            self.stats["read_wait_seconds"] += time.perf_counter() - start
+            self.stats["readers_in_use"] += 1
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            with self.lock:
+                self.stats["readers_in_use"] -= 1
+            if self.closed:
+                conn.close()
+            else:
+                self.idle.put(conn)
+
+    def read(self, func, *args, timeout=None):
+        """Выполняет func(conn, *args) на подключении для чтения и возвращает результат."""
+        with self.reader(timeout) as conn:
+            return func(conn, *args)
+
+    # --- Запись ---
+
+    def _write_loop(self, opened):
+        try:
+            conn = kkurs.get_connection(self.db_name, self.profile)
+        except BaseException as e:
+            opened.set_exception(e)
+            return
+        opened.set_result(None)
+        try:
+            while True:
+                job = self.jobs.get()
+                if job is None:
+                    return
+                future, func, args = job
+                if not future.set_running_or_notify_cancel():
+                    continue
+                start = time.perf_counter()
+                try:
+                    result = func(conn, *args)
+                    conn.commit()
+                except BaseException as e:
+                    conn.rollback()
+                    with self.lock:
+                        self.stats["write_errors"] += 1
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+                with self.lock:
+                    self.stats["writes"] += 1
+                    self.stats["write_seconds"] += time.perf_counter() - start
+        finally:
+            conn.close()
+
+    def submit(self, func, *args):
+        """Ставит func(conn, *args) в очередь писателя; возвращает Future. Транзакция фиксируется после func."""
+        if self.closed:
+            raise PoolClosed("пул закрыт")
+        future = Future()
+        self.jobs.put((future, func, args))
+        with self.lock:
+            self.stats["write_queue_max"] = max(self.stats["write_queue_max"], self.jobs.qsize())
+        return future
+
+    def write(self, func, *args, timeout=None):
+        """Выполняет func(conn, *args) в потоке писателя и ждёт результат не дольше timeout секунд."""
+        timeout = self.timeout if timeout is None else timeout
+        future = self.submit(func, *args)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:  # До Python 3.11 это не встроенный TimeoutError
+            # Если запись ещё не началась, отменяем её, чтобы она не выполнилась после ошибки
+            future.cancel()
+            with self.lock:
+                self.stats["write_timeouts"] += 1
+            raise PoolTimeout(f"запись не выполнена за {timeout} с") from None
+
+    # --- Общее ---
+
+    def metrics(self):
+        """Снимок счётчиков пула."""
+        with self.lock:
+            stats = dict(self.stats)
+        stats["readers_idle"] = self.idle.qsize()
+        stats["write_queue"] = self.jobs.qsize()
+        return stats
+
+    def close(self):
+        """Дожидается очереди записей и закрывает все подключения."""
+        if self.closed:
+            return
+        self.closed = True
+        self.jobs.put(None)
+        self.writer.join()
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
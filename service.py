@@ -0,0 +1,337 @@
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sqlite3
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import Soshina_1 as kkurs
+from pool import MAX_READERS, ConnectionPool, PoolClosed, PoolTimeout
+
+HOST = "127.0.0.1"
+PORT = 8080
+MAX_BODY = 1024 * 1024  # Наибольший размер тела запроса, байт
+MAX_LIMIT = 1000  # Наибольший размер страницы, который можно запросить
+IDLE_TIMEOUT = 30.0  # Сколько секунд держать keep-alive соединение без запросов
+SCALARS = (str, int, float, type(None))  # Типы значений полей, которые можно передать в SQLite
+
+class HttpError(Exception):
+    """Ошибка, которая отдаётся клиенту как ответ с кодом status и {"error": текст}."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def encode_after(after):
+    """Позиция (ключ, id) следующей страницы -> строка для параметра after."""
+    if after is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(after, ensure_ascii=False).encode()).decode().rstrip("=")
+
+def decode_after(token):
+    """Обратное к encode_after; на испорченной строке - ошибка 400."""
+    try:
+        after = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if not isinstance(after, list):
+            raise TypeError
+        key, row_id = after
+        if not isinstance(key, SCALARS):
+            raise TypeError
+        return key, int(row_id)
+    except (ValueError, TypeError):
+        raise HttpError(400, "некорректный параметр after") from None
+
+def int_param(query, name, default, low=1, high=MAX_LIMIT):
+    """Целый параметр строки запроса в пределах [low, high]."""
+    value = query.get(name, [None])[0]
+    if value is None:
+        return default
+    if not value.isdigit() or not low <= int(value) <= high:
+        raise HttpError(400, f"{name} должно быть числом от {low} до {high}")
+    return int(value)
+
+def float_param(query, name, low, high):
+    """Дробный параметр строки запроса в пределах [low, high]."""
+    try:
+        value = float(query[name][0])
+    except (KeyError, ValueError):
+        raise HttpError(400, f"{name} должно быть числом") from None
+    if not low <= value <= high:
+        raise HttpError(400, f"{name} должно быть от {low} до {high}")
+    return value
+
+def row_dict(view, row):
+    return dict(zip(kkurs.list_columns(view), row))
+
+# --- Обработчики (выполняются в потоках пула) ---
+
+def list_view(conn, view, limit, after):
+    rows, next_after = kkurs.list_page(conn, view, limit, after)
+    return {"items": [row_dict(view, row) for row in rows], "next": encode_after(next_after)}
+
+def get_view_row(conn, view, row_id):
+    row = kkurs.get_row(conn, view, row_id)
+    if row is None:
+        raise HttpError(404, "запись не найдена")
+    return row_dict(view, row)
+
+def search_view(conn, view, text, limit):
+    table, _ = kkurs.TABLES[view]
+    rows = kkurs.find_matches(conn, table, text, limit)
+    return {"items": [{"id": row_id, "title": title} for row_id, title, _ in rows]}
+
+def search_all(conn, text, limit):
+    rows = kkurs.search_text(conn, text, limit)
+    return {"items": [{"table": table, "id": row_id, "title": title, "fragment": fragment}
+                      for table, row_id, title, fragment in rows]}
+
+def near_places(conn, lat, lon, radius, k):
+    rows = kkurs.places_within(conn, lat, lon, radius) if radius else kkurs.nearest_places(conn, lat, lon, k)
+    return {"items": [{"distance_km": round(distance, 3), "id": place_id, "name": name, "latitude": place_lat,
+                       "longitude": place_lon} for distance, place_id, name, place_lat, place_lon in rows]}
+
+def cited_sources(conn, limit):
+    columns = ["id", "title", "name", "total"] + list(kkurs.SOURCE_REFERENCES.values())
+    return {"items": [dict(zip(columns, row)) for row in kkurs.most_cited_sources(conn, limit)]}
+
+def update_view_row(conn, view, row_id, values):
+    if not kkurs.update_row(conn, view, row_id, values):
+        raise HttpError(404, "запись не найдена")
+    return get_view_row(conn, view, row_id)
+
+def delete_view_row(conn, view, row_id):
+    if not kkurs.delete_row(conn, view, row_id):
+        raise HttpError(404, "запись не найдена")
+    return None
+
+def prometheus_text(metrics, prefix="kkurs"):
+    """Числовые счётчики из словаря (вложенные словари - через "_") в текстовом формате Prometheus."""
+    lines = []
+    for name, value in metrics.items():
+        if isinstance(value, dict):
+            lines.append(prometheus_text(value, f"{prefix}_{name}"))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            lines.append(f"# TYPE {prefix}_{name} gauge\n{prefix}_{name} {value}\n")
+    return "".join(lines)
+
+# --- Сервис ---
+
+class Service:
+    """HTTP-сервис над функциями доступа к данным Soshina_1.
+
+    Соединения обслуживает asyncio, а запросы к SQLite выполняются в потоках: чтения - в пуле
+    исполнителей на подключениях ConnectionPool, записи - в единственном потоке-писателе пула.
+    Адреса:
+        GET    /{представление}?limit=&after=  - страница (after - значение next из прошлой страницы)
+        GET    /{представление}/{id}           - одна запись
+        GET    /{представление}/search?q=      - поиск по началу или части названия
+        GET    /search?q=                      - полнотекстовый поиск
+        GET    /sources/cited?limit=           - самые цитируемые источники
+        GET    /places/near?lat=&lon=&radius=  - места в радиусе, км (без radius - k ближайших, &k=)
+        POST   /{представление}                - добавить (тело - JSON-объект полей), ответ 201 и id
+        PATCH  /{представление}/{id}           - изменить переданные поля
+        DELETE /{представление}/{id}           - удалить (источник, на который есть ссылки, - 409)
+        GET    /metrics                        - счётчики пула, кэша и запросов (?format=prometheus - для Prometheus)
+    Представления: ключи kkurs.TABLES (sources, coordinates, persons, events, texts, places, interactions).
+    """
+
+    def __init__(self, db_name=None, profile=None, readers=None):
+        self.pool = ConnectionPool(db_name, profile, readers or MAX_READERS)
+        self.executor = ThreadPoolExecutor(max_workers=self.pool.max_readers, thread_name_prefix="kkurs-read")
+        self.requests = 0
+
+    async def read(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.pool.read, func, *args)
+
+    async def write(self, func, *args):
+        return await asyncio.wrap_future(self.pool.submit(func, *args))
+
+    async def dispatch(self, method, path, query, body):
+        """Выбирает обработчик по методу и пути; возвращает (код, JSON-ответ)."""
+        parts = [unquote(part) for part in path.strip("/").split("/") if part]
+        if parts == ["metrics"] and method == "GET":
+            metrics = dict(self.pool.metrics(), requests=self.requests, cache=kkurs.reference_cache.stats())
+            if query.get("format", [""])[0] == "prometheus":
+                return 200, prometheus_text(metrics) + kkurs.query_stats.prometheus()
+            return 200, dict(metrics, queries=kkurs.query_stats.stats())
+        if parts == ["search"] and method == "GET":
+            text = query.get("q", [""])[0]
+            return 200, await self.read(search_all, text, int_param(query, "limit", kkurs.FTS_LIMIT))
+        if not parts or parts[0] not in kkurs.TABLES or len(parts) > 2:
+            raise HttpError(404, "нет такого адреса")
+        view = parts[0]
+        if len(parts) == 1:
+            if method == "GET":
+                after = decode_after(query["after"][0]) if "after" in query else None
+                limit = int_param(query, "limit", kkurs.PAGE_SIZE or 50)
+                return 200, await self.read(list_view, view, limit, after)
+            if method == "POST":
+                row_id = await self.write(kkurs.insert_row, view, self.values(body))
+                return 201, {"id": row_id}
+            raise HttpError(405, "метод не поддерживается")
+        if parts[1] == "search":
+            if method != "GET":
+                raise HttpError(405, "метод не поддерживается")
+            text = query.get("q", [""])[0]
+            return 200, await self.read(search_view, view, text, int_param(query, "limit", kkurs.PICK_LIMIT))
+        if view == "sources" and parts[1] == "cited":
+            if method != "GET":
+                raise HttpError(405, "метод не поддерживается")
+            return 200, await self.read(cited_sources, int_param(query, "limit", kkurs.CITED_LIMIT))
+        if view == "places" and parts[1] == "near":
+            if method != "GET":
+                raise HttpError(405, "метод не поддерживается")
+            lat = float_param(query, "lat", -90, 90)
+            lon = float_param(query, "lon", -180, 180)
+            radius = float_param(query, "radius", 0, 20_000) if "radius" in query else None
+            k = int_param(query, "k", kkurs.NEAREST_LIMIT)
+            return 200, await self.read(near_places, lat, lon, radius, k)
+        if not parts[1].isdigit():
+            raise HttpError(404, "нет такого адреса")
+        row_id = int(parts[1])
+        if method == "GET":
+            return 200, await self.read(get_view_row, view, row_id)
+        if method == "PATCH":
+            return 200, await self.write(update_view_row, view, row_id, self.values(body))
+        if method == "DELETE":
+            await self.write(delete_view_row, view, row_id)
+            return 204, None
+        raise HttpError(405, "метод не поддерживается")
+
+    @staticmethod
+    def values(body):
+        try:
+            values = json.loads(body or b"{}")
+        except ValueError:
+            raise HttpError(400, "тело запроса должно быть JSON-объектом") from None
+        if not isinstance(values, dict):
+            raise HttpError(400, "тело запроса должно быть JSON-объектом")
+        wrong = [name for name, value in values.items() if not isinstance(value, SCALARS)]
+        if wrong:
+            raise HttpError(400, f"значения полей должны быть строками, числами или null: {', '.join(wrong)}")
+        return values
+
+    async def respond(self, method, target, body):
+        """Выполняет запрос и переводит исключения в коды ответа."""
+        url = urlsplit(target)
+        try:
+            return await self.dispatch(method, url.path, parse_qs(url.query), body)
+        except HttpError as e:
+            return e.status, {"error": str(e)}
+        except (ValueError, TypeError, sqlite3.ProgrammingError) as e:
+            return 400, {"error": str(e)}
+        except sqlite3.IntegrityError as e:
+            return 409, {"error": f"нарушено ограничение: {e}"}
+        except (PoolTimeout, sqlite3.OperationalError) as e:
+            return 503, {"error": str(e)}
+        except PoolClosed:
+            return 503, {"error": "сервис останавливается"}
+        except Exception:
+            traceback.print_exc()  # Ответ всё равно нужен, иначе клиент получит закрытое соединение
+            return 500, {"error": "внутренняя ошибка сервиса"}
+
+    async def handle(self, reader, writer):
+        """Обслуживает одно TCP-соединение: запросы HTTP/1.1 по очереди, пока клиент не закроет или не попросит close."""
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+                try:
+                    # Делим байты: в latin-1 байт 0x85 стал бы пробельным символом
+                    method, target, version = (part.decode("latin-1") for part in request_line.split())
+                except ValueError:
+                    await self.send(writer, 400, {"error": "некорректный запрос"}, False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                try:
+                    length = int(headers.get("content-length", "0") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self.send(writer, 400, {"error": "некорректный Content-Length"}, False)
+                    break
+                if length > MAX_BODY:
+                    await self.send(writer, 413, {"error": "слишком большое тело запроса"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                self.requests += 1
+                status, payload = await self.respond(method.upper(), target, body)
+                await self.send(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def send(writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body = payload.encode()
+            content_type = "text/plain; version=0.0.4; charset=utf-8"  # Текстовый формат Prometheus
+        else:
+            body = b"" if payload is None else json.dumps(payload, ensure_ascii=False).encode()
+            content_type = "application/json; charset=utf-8"
+        head = (f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def start(self, host=HOST, port=PORT):
+        """Запускает сервер и возвращает объект asyncio.Server (port=0 - любой свободный порт)."""
+        return await asyncio.start_server(self.handle, host, port, backlog=1024)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.pool.close()
+
+async def serve(db_name, profile, host, port, readers):
+    service = Service(db_name, profile, readers)
+    server = await service.start(host, port)
+    print(f"KKurs: http://{host}:{server.sockets[0].getsockname()[1]}/ (Ctrl+C - остановить)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP-сервис с JSON над базой KKurs.")
+    parser.add_argument("--db", default=kkurs.DB_NAME, help="путь к базе данных")
+    parser.add_argument("--profile", choices=sorted(kkurs.PRAGMA_PROFILES), help="набор настроек PRAGMA")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--readers", type=int, default=MAX_READERS, help="подключений и потоков для чтения")
+    parser.add_argument("--query-stats", action="store_true",
+                        help="замерять запросы для /metrics (или KKURS_QUERY_STATS=1; по умолчанию выключено)")
+    args = parser.parse_args()
+    if args.query_stats:
+        kkurs.QUERY_STATS = True
+    if not os.path.exists(args.db):
+        sys.exit(f"Ошибка: база {args.db} не найдена.")
+    try:
+        asyncio.run(serve(args.db, args.profile, args.host, args.port, args.readers))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,472 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import sys
+import threading
+import time
+from array import array
+
+import Soshina_1 as kkurs
+
+MAGIC = b"KKSNAP1\n"
+SNAPSHOT_SUFFIX = ".snap"  # Снимок лежит рядом с базой: KKurs.db -> KKurs.db.snap
+CHUNK = 1024 * 1024  # Кусок при копировании данных во файл снимка, байт
+
+# Формат файла: MAGIC, длина заголовка (8 байт), заголовок JSON, затем данные столбцов; смещения в
+# заголовке отсчитываются от начала данных, каждый кусок выровнен на 8 байт. Заголовок описывает
+# секции - представления LIST_VIEWS ("view:events") и поиски PICKERS ("pick:Events"). Строки секции
+# идут в том же порядке, что ORDER BY в SQLite, а каждый столбец хранится отдельно: числа - массивом
+# int64/float64, строки - массивом смещений (n + 1 чисел) и общей кучей UTF-8. Отдельный массив байтов
+# отмечает NULL, если они есть. Файл отображается в память (mmap), массивы читаются через memoryview
+# без копирования, а строка декодируется, только когда она нужна.
+
+# --- Запись ---
+
+def snapshot_path(db_name):
+    return db_name + SNAPSHOT_SUFFIX
+
+def file_stamp(db_name):
+    """Отпечаток состояния базы: размер и время изменения файла базы и непустого журнала WAL.
+
+    Любой commit либо меняет файл базы (журнал отката), либо дописывает WAL, а контрольная точка
+    переписывает файл базы, так что после любой записи отпечаток другой. Пустой и отсутствующий WAL
+    считаются одинаковыми: подключение создаёт и удаляет его, ничего не меняя в данных.
+    """
+    stat = os.stat(db_name)
+    stamp = [stat.st_size, stat.st_mtime_ns]
+    try:
+        wal = os.stat(db_name + "-wal")
+    except FileNotFoundError:
+        wal = None
+    if wal is not None and wal.st_size:
+        stamp += [wal.st_size, wal.st_mtime_ns]
+    return stamp
+
+def layout():
+    """Хэш описаний LIST_VIEWS и PICKERS: снимок, построенный по другим описаниям, считается устаревшим."""
+    text = json.dumps([kkurs.LIST_VIEWS, kkurs.PICKERS], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+def section_queries():
+    """Секции снимка: имя -> (SQL, имена столбцов, номер столбца ключа сортировки).
+
+    Если ключ представления - один из его столбцов, он не хранится второй раз.
+    """
+    queries = {}
+    for view, (columns, source, key, id_column) in kkurs.LIST_VIEWS.items():
+        names = kkurs.list_columns(view)[:-1]
+        key_name = key.split(".")[-1]
+        if key_name in names:
+            queries[f"view:{view}"] = (f"SELECT {columns}, {id_column} FROM {source} ORDER BY {key}, {id_column}",
+                                       names + ["id"], names.index(key_name))
+        else:
+            queries[f"view:{view}"] = (f"SELECT {columns}, {key}, {id_column} FROM {source} ORDER BY {key}, {id_column}",
+                                       names + ["key", "id"], len(names))
+    for table, (column, display, _) in kkurs.PICKERS.items():
+        queries[f"pick:{table}"] = (f"SELECT id, {display}, {column} FROM {table} ORDER BY {column}, id",
+                                    ["id", "display", "value"], 2)
+    return queries
+
+class ColumnWriter:
+    """Столбец секции, который накапливается пачками строк сразу в виде для файла: числа - в массиве,
+    строки - в куче UTF-8, так что в памяти не держатся все строки запроса кортежами."""
+
+    def __init__(self):
+        self.type = "int"
+        self.values = array("q")
+        self.nulls = bytearray()
+        self.offsets = self.heap = None
+        self.mixed = False  # В текстовом столбце есть числа (SQLite ставит их перед строками)
+
+    def extend(self, values):
+        kinds = {type(value) for value in values if value is not None}
+        if self.type == "int" and not kinds <= {int}:
+            if kinds <= {int, float}:
+                self.type, self.values = "real", array("d", self.values)
+            else:
+                self.to_text()
+        elif self.type == "real" and not kinds <= {int, float}:
+            self.to_text()
+        self.nulls.extend(value is None for value in values)
+        if self.type == "text":
+            self.mixed = self.mixed or not kinds <= {str}
+            self.add_text(values)
+        else:
+            empty = 0 if self.type == "int" else 0.0
+            self.values.extend(empty if value is None else value for value in values)
+
+    def to_text(self):
+        """Столбец оказался текстовым: уже накопленные числа переводятся в строки."""
+        values = [None if null else value for value, null in zip(self.values, self.nulls)]
+        self.mixed = any(value is not None for value in values)
+        self.type, self.values, self.offsets, self.heap = "text", None, array("Q", [0]), bytearray()
+        self.add_text(values)
+
+    def add_text(self, values):
+        position = self.offsets[-1]
+        for value in values:
+            if value is not None:
+                item = str(value).encode("utf-8")
+                self.heap += item
+                position += len(item)
+            self.offsets.append(position)
+
+    def parts(self):
+        """Куски файла для столбца: {часть: байты}, части - values, offsets, heap, nulls."""
+        parts = {"nulls": bytes(self.nulls)} if any(self.nulls) else {}
+        if self.type == "text":
+            parts["offsets"] = self.offsets.tobytes()
+            parts["heap"] = bytes(self.heap)
+        else:
+            parts["values"] = self.values.tobytes()
+        return parts
+
+class OrderCheck:
+    """Проверяет пачками, совпадает ли порядок SQLite с порядком, в котором снимок ищет делением
+    пополам (NULL первыми)."""
+
+    def __init__(self):
+        self.ordered = True
+        self.last = None
+
+    def extend(self, values, ids):
+        if not self.ordered:
+            return
+        keys = [((0,) if value is None else (1, value), row_id) for value, row_id in zip(values, ids)]
+        if self.last is not None:
+            keys.insert(0, self.last)
+        try:
+            self.ordered = all(a <= b for a, b in zip(keys, keys[1:]))
+        except TypeError:
+            self.ordered = False  # Числа и строки в одном столбце
+        self.last = keys[-1] if keys else self.last
+
+def build(db_name, path=None, profile=None):
+    """Строит снимок базы db_name в файл path (по умолчанию рядом с базой); возвращает путь к снимку.
+
+    Данные читаются в одной транзакции чтения пачками по FETCH_BATCH строк: в памяти - только
+    столбцы текущей секции в виде для файла, готовые секции сразу пишутся во временный файл данных.
+    Файл снимка пишется во временный и подменяется целиком, так что читатели видят либо старый
+    снимок, либо новый.
+    """
+    path = path or snapshot_path(db_name)
+    temp = path + ".tmp"
+    conn = kkurs.get_connection(db_name, profile)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")  # Чтобы отпечаток не зависел от накопленного WAL
+        stamp = file_stamp(db_name)
+        header = {"version": 1, "byteorder": sys.byteorder, "layout": layout(), "stamp": stamp,
+                  "built": time.time(), "sections": {}}
+        position = 0
+        conn.execute("BEGIN")
+        with open(temp + ".data", "wb") as data:
+            for name, (sql, columns, key) in section_queries().items():
+                writers = [ColumnWriter() for _ in columns]
+                order = OrderCheck()
+                count = 0
+                cursor = conn.execute(sql)
+                while True:
+                    rows = cursor.fetchmany(kkurs.FETCH_BATCH)
+                    if not rows:
+                        break
+                    count += len(rows)
+                    values_by_column = list(zip(*rows))
+                    for writer, values in zip(writers, values_by_column):
+                        writer.extend(values)
+                    order.extend(values_by_column[key], values_by_column[-1])
+                section = {"rows": count, "key": key, "key_stored": columns[key] == "key", "columns": []}
+                for column, writer in zip(columns, writers):
+                    meta = {"name": column, "type": writer.type}
+                    for part, chunk in writer.parts().items():
+                        meta[part] = [position, len(chunk)]
+                        padding = -len(chunk) % 8
+                        data.write(chunk + b"\0" * padding)
+                        position += len(chunk) + padding
+                    section["columns"].append(meta)
+                section["ordered"] = order.ordered and not writers[key].mixed
+                header["sections"][name] = section
+        conn.rollback()
+        if file_stamp(db_name) != stamp:
+            raise RuntimeError("база изменилась во время построения снимка, постройте его ещё раз")
+        head = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        head += b" " * (-(len(MAGIC) + 8 + len(head)) % 8)  # Данные начинаются с границы 8 байт
+        with open(temp, "wb") as f, open(temp + ".data", "rb") as data:
+            f.write(MAGIC)
+            f.write(len(head).to_bytes(8, "little"))
+            f.write(head)
+            shutil.copyfileobj(data, f, CHUNK)
+    finally:
+        conn.close()
+        if os.path.exists(temp + ".data"):
+            os.remove(temp + ".data")
+    forget(db_name)
+    os.replace(temp, path)
+    return path
+
+# --- Чтение ---
+
+class Column:
+    """Один столбец секции поверх отображённого в память файла."""
+
+    def __init__(self, buffer, meta):
+        """buffer - memoryview области данных файла, meta - описание столбца из заголовка."""
+        self.name = meta["name"]
+        self.type = meta["type"]
+        self.views = []
+        self.nulls = self.part(buffer, meta, "nulls")
+        if self.type == "text":
+            self.offsets = self.part(buffer, meta, "offsets", "Q")
+            self.heap = self.part(buffer, meta, "heap")
+            self.heap_start = meta["heap"][0]
+        else:
+            self.values = self.part(buffer, meta, "values", "q" if self.type == "int" else "d")
+
+    def part(self, buffer, meta, name, format_=None):
+        if name not in meta:
+            return None
+        start, length = meta[name]
+        view = buffer[start:start + length]
+        self.views.append(view)
+        if format_:
+            view = view.cast(format_)
+            self.views.append(view)
+        return view
+
+    def get(self, i):
+        if self.nulls is not None and self.nulls[i]:
+            return None
+        if self.type == "text":
+            return str(self.heap[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+        return self.values[i]
+
+    def slice(self, start, stop):
+        """Значения строк start..stop-1 списком; строки декодируются подряд из одного куска кучи."""
+        if self.type == "text":
+            offsets = self.offsets[start:stop + 1].tolist()
+            heap = self.heap
+            values = [str(heap[a:b], "utf-8") for a, b in zip(offsets, offsets[1:])]
+        else:
+            values = self.values[start:stop].tolist()
+        if self.nulls is not None:
+            nulls = self.nulls[start:stop]
+            values = [None if null else value for value, null in zip(values, nulls)]
+        return values
+
+    def sort_key(self, i):
+        """Ключ для сравнения как в ORDER BY: NULL, затем числа, затем строки - по байтам UTF-8 (то же, что BINARY)."""
+        if self.nulls is not None and self.nulls[i]:
+            return (0,)
+        if self.type == "text":
+            return (2, self.heap[self.offsets[i]:self.offsets[i + 1]].tobytes())
+        return (1, self.values[i])
+
+    def release(self):
+        for view in reversed(self.views):
+            view.release()
+        self.views = []
+
+def number(text):
+    """Строка как число (int или float) или None, если она на число не похожа."""
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return None
+
+def lower_bound(count, key, target):
+    """Первый номер i из range(count), для которого key(i) >= target (key не убывает)."""
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        if key(middle) < target:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+class Section:
+    """Секция снимка: строки одного представления или поиска в порядке (ключ, id)."""
+
+    def __init__(self, buffer, meta):
+        self.rows = meta["rows"]
+        self.ordered = meta["ordered"]
+        self.columns = [Column(buffer, column) for column in meta["columns"]]
+        self.key_index = meta["key"]
+        self.key_stored = meta["key_stored"]
+        self.key = self.columns[self.key_index]
+        self.ids = self.columns[-1]
+
+    def row(self, i):
+        return tuple(column.get(i) for column in self.columns)
+
+    def rows_between(self, start, stop):
+        """Строки start..stop-1: столбцы разбираются целиком по куску, затем собираются в кортежи."""
+        return list(zip(*(column.slice(start, stop) for column in self.columns)))
+
+    def seek(self, target_key, target_id=None):
+        """Номер первой строки, у которой (ключ, id) не меньше (target_key, target_id).
+
+        Ключ приводится к типу столбца, как это делает SQLite для столбцов с TEXT и REAL/INTEGER:
+        число для текстового столбца - строка, строка для числового - число, если она на него похожа,
+        иначе она больше любого числа. Ключ не строка, не число и не None - ValueError (например,
+        из испорченной позиции страницы).
+        """
+        if target_key is not None and not isinstance(target_key, (str, int, float)):
+            raise ValueError(f"ключ должен быть строкой, числом или None, а не {type(target_key).__name__}")
+        if isinstance(target_key, bool):
+            target_key = int(target_key)  # sqlite3 передаёт True и False как 1 и 0
+        if target_key is None:
+            target = (0,)
+        elif self.key.type == "text":
+            target = (2, str(target_key).encode("utf-8"))
+        elif isinstance(target_key, str):
+            target = (1, number(target_key)) if number(target_key) is not None else (2, target_key.encode("utf-8"))
+        else:
+            target = (1, target_key)
+        if target_id is None:
+            return lower_bound(self.rows, self.key.sort_key, target)
+        return lower_bound(self.rows, lambda i: (self.key.sort_key(i), self.ids.values[i]), (target, target_id))
+
+class Snapshot:
+    """Снимок, открытый только для чтения. Строки - кортежи как у keyset_page и load_matches."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} - не снимок KKurs")
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.mmap)
+        length = int.from_bytes(self.buffer[len(MAGIC):len(MAGIC) + 8], "little")
+        self.header = json.loads(str(self.buffer[len(MAGIC) + 8:len(MAGIC) + 8 + length], "utf-8"))
+        self.data_start = len(MAGIC) + 8 + length
+        self.data = self.buffer[self.data_start:]
+        self.sections = {name: Section(self.data, meta) for name, meta in self.header["sections"].items()}
+
+    def is_fresh(self, db_name):
+        """Соответствует ли снимок текущему состоянию базы и описаниям представлений."""
+        header = self.header
+        return (header["byteorder"] == sys.byteorder and header["layout"] == layout()
+                and header["stamp"] == file_stamp(db_name))
+
+    def view_rows(self, view, start=0, stop=None):
+        """Строки представления с номера start до stop: столбцы list_columns, затем ключ и id (как у keyset_page)."""
+        section = self.sections[f"view:{view}"]
+        key = section.key_index
+        stop = section.rows if stop is None else min(stop, section.rows)
+        for block in range(start, stop, kkurs.FETCH_BATCH):
+            rows = section.rows_between(block, min(block + kkurs.FETCH_BATCH, stop))
+            if section.key_stored:
+                yield from rows
+            else:
+                yield from (row[:-1] + (row[key], row[-1]) for row in rows)
+
+    def view_page(self, view, limit, after=None):
+        """Страница представления после позиции after = (ключ, id), как keyset_page; None - если искать нельзя."""
+        section = self.sections[f"view:{view}"]
+        if after is None:
+            start = 0
+        elif not section.ordered:
+            return None
+        else:
+            if not isinstance(after[1], int):
+                raise ValueError("id позиции страницы должен быть целым числом")
+            start = section.seek(after[0], after[1] + 1)
+        return list(self.view_rows(view, start, start + limit))
+
+    def matches(self, table, text, limit):
+        """То же, что load_matches, по снимку: сначала совпадения по началу, затем по подстроке; None - если искать нельзя."""
+        section = self.sections[f"pick:{table}"]
+        if not section.ordered or section.key.type != "text":
+            return None
+        value = section.key
+        needle = text.encode("utf-8")
+        rows = []
+        # По началу: деление пополам до первой строки >= text, дальше подряд, пока строки начинаются с text
+        i = section.seek(text)
+        while i < section.rows and len(rows) < limit and value.sort_key(i)[1].startswith(needle):
+            rows.append(section.row(i))
+            i += 1
+        if not needle or len(rows) >= limit:
+            return rows
+        # По подстроке не с начала (instr > 1): поиск сразу по всей куче в mmap, затем номер строки
+        # по смещению совпадения. Куча упорядочена так же, как строки, поэтому находки идут в порядке (значение, id).
+        offsets = value.offsets
+        heap_start = self.data_start + value.heap_start
+        heap_end = heap_start + offsets[section.rows]
+        position = self.mmap.find(needle, heap_start, heap_end)
+        while position != -1 and len(rows) < limit:
+            i = lower_bound(section.rows, lambda j: offsets[j + 1], position - heap_start + 1)
+            start, end = heap_start + offsets[i], heap_start + offsets[i + 1]
+            if position + len(needle) > end:
+                position = self.mmap.find(needle, position + 1, heap_end)  # Совпадение на стыке двух строк
+                continue
+            if position > start:
+                rows.append(section.row(i))
+            position = self.mmap.find(needle, end, heap_end)
+        return rows
+
+    def close(self):
+        for section in self.sections.values():
+            for column in section.columns:
+                column.release()
+        self.data.release()
+        self.buffer.release()
+        self.mmap.close()
+
+# Открытые снимки: путь к базе -> (время изменения файла снимка, Snapshot)
+_opened = {}
+_lock = threading.Lock()
+
+def forget(db_name):
+    """Забывает открытый снимок базы; файл закроется, когда снимок перестанут использовать."""
+    with _lock:
+        _opened.pop(db_name, None)
+
+def fresh(db_name):
+    """Открытый снимок базы, если файл снимка есть и не устарел, иначе None."""
+    path = snapshot_path(db_name)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        forget(db_name)
+        return None
+    with _lock:
+        entry = _opened.get(db_name)
+        if entry is None or entry[0] != mtime:
+            try:
+                entry = (mtime, Snapshot(path))
+            except (OSError, ValueError):
+                return None
+            _opened[db_name] = entry
+    snapshot = entry[1]
+    return snapshot if snapshot.is_fresh(db_name) else None
+
+def main():
+    parser = argparse.ArgumentParser(description="Снимок базы KKurs для быстрого просмотра списков и поиска.")
+    parser.add_argument("command", choices=("build", "check"), help="build - построить снимок, check - проверить")
+    parser.add_argument("--db", default=kkurs.DB_NAME, help="путь к базе данных")
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        sys.exit(f"Ошибка: база {args.db} не найдена.")
+    db_name = os.path.realpath(args.db)
+    if args.command == "build":
+        start = time.perf_counter()
+        try:
+            path = build(db_name)
+        except RuntimeError as e:
+            sys.exit(f"Ошибка: {e}")
+        print(f"Снимок {path}: {os.path.getsize(path) / 1024 / 1024:.1f} МБ за {time.perf_counter() - start:.1f} с")
+    else:
+        snapshot = fresh(db_name)
+        if snapshot is None:
+            sys.exit("Снимка нет или он устарел: python snapshot.py build")
+        for name, section in snapshot.sections.items():
+            print(f"{name}: {section.rows} строк")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import Soshina_1 as kkurs
+import bulk
+import datagen
+import timeline
+from loadtest import percentile
+
+REPEAT = 200  # Вызовов каждого замера по умолчанию
+HEAVY_SHARE = 20  # Тяжёлые замеры (гистограмма, построение графа, ...) выполняются в столько раз реже
+THRESHOLD = 0.2  # На сколько может вырасти p50, прежде чем --compare сочтёт это ухудшением
+NOISE_MS = 0.1  # Разница p50 меньше этого не считается ухудшением
+SAMPLE = 1000  # Сколько случайных id каждой таблицы брать для запросов
+
+# Значения для insert_row и update_row: названия уникальны (индексы миграции 1), ссылки - из выборки id
+NEW_ROWS = {
+    "sources": lambda rnd, ids: {"title": f"Замер {rnd.random()}", "type": "Книга", "name": "Автор замера"},
+    "coordinates": lambda rnd, ids: {"latitude": rnd.uniform(-90, 90), "longitude": rnd.uniform(-180, 180),
+                                     "name": f"Точка замера {rnd.random()}"},
+    "persons": lambda rnd, ids: {"surname": f"Замеров-{rnd.random()}", "name": "Иван", "date_of_birth": "1850-01-01"},
+    "events": lambda rnd, ids: {"name": f"Событие замера {rnd.random()}", "data": "1850-01-01",
+                                "resource_id": rnd.choice(ids["sources"])},
+    "texts": lambda rnd, ids: {"name": f"Текст замера {rnd.random()}", "data": "1850-06-01",
+                               "resource_id": rnd.choice(ids["sources"])},
+    "places": lambda rnd, ids: {"name": f"Место замера {rnd.random()}", "resource_id": rnd.choice(ids["sources"]),
+                                "coordinate_id": rnd.choice(ids["coordinates"])},
+    "interactions": lambda rnd, ids: {"description": "Взаимодействие замера", "resource_id": rnd.choice(ids["sources"]),
+                                      "person_id": rnd.choice(ids["persons"])},
+}
+
+def git_version():
+    """Короткий хеш текущего коммита (с + при незафиксированных изменениях) или None вне git."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=here, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=here,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("+" if dirty else "")
+
+def sample_ids(conn, rnd):
+    """Случайные id каждой таблицы; берутся через случайные rowid, без ORDER BY random() по всей таблице."""
+    ids = {}
+    for view, (table, _) in kkurs.TABLES.items():
+        top = conn.execute(f"SELECT max(id) FROM {table}").fetchone()[0] or 0
+        found = set()
+        for _ in range(SAMPLE * 2):
+            row = conn.execute(f"SELECT id FROM {table} WHERE id >= ? ORDER BY id LIMIT 1",
+                               (rnd.randint(1, max(top, 1)),)).fetchone()
+            if row:
+                found.add(row[0])
+            if len(found) >= SAMPLE:
+                break
+        ids[view] = sorted(found)
+    return ids
+
+def middle_position(conn, view):
+    """Позиция (ключ, id) из середины представления - для страницы на глубине половины таблицы."""
+    _, source, key, id_column = kkurs.LIST_VIEWS[view]
+    table, _ = kkurs.TABLES[view]
+    count = conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+    return conn.execute(f"SELECT {key}, {id_column} FROM {source} ORDER BY {key}, {id_column} LIMIT 1 OFFSET ?",
+                        (count // 2,)).fetchone()
+
+def read_cases(conn, ids):
+    """Замеры чтения: имя -> (функция от Random, тяжёлый ли)."""
+    cases = {}
+    for view in kkurs.TABLES:
+        if not ids[view]:
+            continue
+        cases[f"get_row.{view}"] = (lambda rnd, view=view: kkurs.get_row(conn, view, rnd.choice(ids[view])), False)
+        cases[f"list_page.{view}"] = (lambda rnd, view=view: kkurs.list_page(conn, view, 50), False)
+        after = middle_position(conn, view)
+        cases[f"list_page.{view}.deep"] = (lambda rnd, view=view, after=after: kkurs.list_page(conn, view, 50, after),
+                                           False)
+    titles = [row[0] for row in conn.execute(
+        f"SELECT title FROM Sources WHERE id IN ({', '.join('?' * len(ids['sources']))})", ids["sources"])]
+    surnames = [row[0] for row in conn.execute(
+        f"SELECT surname FROM Persons WHERE id IN ({', '.join('?' * len(ids['persons']))})", ids["persons"])]
+    cases["find_matches.sources.prefix"] = (lambda rnd: kkurs.find_matches(conn, "Sources", rnd.choice(titles)[:-2]),
+                                            False)
+    cases["find_matches.sources.substring"] = (lambda rnd: kkurs.find_matches(conn, "Sources", rnd.choice(titles)[-5:]),
+                                               False)
+    cases["find_matches.persons"] = (lambda rnd: kkurs.find_matches(conn, "Persons", rnd.choice(surnames)[:4]), False)
+    cases["search_text"] = (lambda rnd: kkurs.search_text(conn, rnd.choice(datagen.WORDS)), False)
+    cases["places_within"] = (lambda rnd: kkurs.places_within(conn, rnd.uniform(-60, 60), rnd.uniform(-180, 180), 50),
+                              False)
+    cases["nearest_places"] = (lambda rnd: kkurs.nearest_places(conn, rnd.uniform(-60, 60), rnd.uniform(-180, 180)),
+                               False)
+
+    def date_range(rnd):
+        year = rnd.randint(1700, 2015)
+        return list(timeline.date_range(conn, "Events", str(year), str(year + 10), 100))
+
+    cases["timeline.date_range"] = (date_range, False)
+    cases["timeline.stream"] = (lambda rnd: [row for row, _ in zip(timeline.stream(conn), range(100))], False)
+    cases["timeline.histogram"] = (lambda rnd: timeline.histogram(conn, "Events"), True)
+    cases["source_usage"] = (lambda rnd: kkurs.source_usage(conn, rnd.choice(ids["sources"])), False)
+    cases["most_cited_sources"] = (lambda rnd: kkurs.most_cited_sources(conn), False)
+
+    def graph_build(rnd):
+        conn.graph = None
+        return kkurs.person_graph(conn)
+
+    cases["graph.build"] = (graph_build, True)
+    cases["graph.neighbours"] = (lambda rnd: kkurs.person_graph(conn).neighbours(rnd.choice(ids["persons"]),
+                                                                               kkurs.NEIGHBOURS_LIMIT), False)
+    cases["graph.shortest_path"] = (lambda rnd: kkurs.person_graph(conn).shortest_path(rnd.choice(ids["persons"]),
+                                                                                      rnd.choice(ids["persons"])), False)
+    return cases
+
+def write_cases(conn, ids):
+    """Замеры записи, как из меню - по строке с commit: имя -> (функция от Random, тяжёлый ли).
+
+    Порядок важен: сначала добавления, потом изменения, потом удаление добавленных строк.
+    """
+    cases = {}
+    added = {view: [] for view in kkurs.TABLES}
+
+    def insert(rnd, view):
+        added[view].append(kkurs.insert_row(conn, view, NEW_ROWS[view](rnd, ids)))
+        conn.commit()
+
+    def update(rnd, view):
+        values = NEW_ROWS[view](rnd, ids)
+        kkurs.update_row(conn, view, rnd.choice(added[view]), values)
+        conn.commit()
+
+    def delete(rnd, view):
+        if added[view]:
+            kkurs.delete_row(conn, view, added[view].pop())
+            conn.commit()
+
+    def bulk_update(rnd):
+        conn.execute("BEGIN")
+        bulk.bulk_update(conn, "events", {"description": "Массовое изменение"}, ids=ids["events"])
+        conn.rollback()
+
+    for name, func in (("insert_row", insert), ("update_row", update)):
+        for view in kkurs.TABLES:
+            cases[f"{name}.{view}"] = (lambda rnd, view=view, func=func: func(rnd, view), False)
+    # Удаление в обратном порядке: сначала строки, которые ссылаются на источники, персоны и точки
+    for view in reversed(kkurs.TABLES):
+        cases[f"delete_row.{view}"] = (lambda rnd, view=view: delete(rnd, view), False)
+    cases["bulk_update.events"] = (bulk_update, True)
+    return cases
+
+def measure(cases, repeat, seed):
+    """Выполняет каждый замер repeat раз (тяжёлые - в HEAVY_SHARE раз реже); возвращает статистику в мс."""
+    results = {}
+    for name, (func, heavy) in cases.items():
+        rnd = random.Random(f"{seed}:{name}")
+        calls = max(1, repeat // HEAVY_SHARE) if heavy else repeat
+        times = []
+        for _ in range(calls):
+            start = time.perf_counter()
+            func(rnd)
+            times.append(time.perf_counter() - start)
+        times.sort()
+        results[name] = {"calls": calls, "mean_ms": sum(times) / calls * 1000, "p50_ms": percentile(times, 0.50) * 1000,
+                         "p95_ms": percentile(times, 0.95) * 1000, "min_ms": times[0] * 1000,
+                         "max_ms": times[-1] * 1000}
+        print(f"{name:<36} {results[name]['p50_ms']:>10.3f} мс (p95 {results[name]['p95_ms']:.3f}, {calls} раз)",
+              flush=True)
+    return results
+
+def run(db_name, repeat=REPEAT, seed=1, writes=True):
+    """Все замеры на базе db_name; возвращает словарь для JSON: meta и results."""
+    conn = kkurs.get_connection(db_name)
+    try:
+        rnd = random.Random(seed)
+        ids = sample_ids(conn, rnd)
+        meta = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "version": git_version(),
+                "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                "profile": kkurs.PRAGMA_PROFILE, "query_stats": kkurs.QUERY_STATS, "repeat": repeat, "seed": seed,
+                "rows": {view: conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+                         for view, (table, _) in kkurs.TABLES.items()}}
+        results = measure(read_cases(conn, ids), repeat, seed)
+        if writes:
+            results.update(measure(write_cases(conn, ids), repeat, seed))
+        return {"meta": meta, "results": results}
+    finally:
+        conn.close()
+
+def compare(old, new, threshold=THRESHOLD):
+    """Печатает изменение p50 по замерам, которые есть в обоих прогонах; возвращает имена ухудшившихся."""
+    worse = []
+    print(f"\n{'замер':<36} {'было, мс':>10} {'стало, мс':>10} {'раз':>7}")
+    for name, result in new["results"].items():
+        if name not in old["results"]:
+            continue
+        before, after = old["results"][name]["p50_ms"], result["p50_ms"]
+        ratio = after / before if before else float("inf")
+        mark = ""
+        if after > before * (1 + threshold) and after - before > NOISE_MS:
+            worse.append(name)
+            mark = "  хуже"
+        print(f"{name:<36} {before:>10.3f} {after:>10.3f} {ratio:>7.2f}{mark}")
+    if old["meta"].get("rows") != new["meta"].get("rows"):
+        print("Внимание: размеры таблиц в прогонах разные.")
+    return worse
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры всех чтений и записей Soshina_1 с результатом в JSON.")
+    parser.add_argument("--db", help="готовая база (например, из datagen.py); для замеров записи копируется")
+    parser.add_argument("--rows", type=float, default=10_000,
+                        help="без --db: размер синтетической базы (см. datagen.py --rows)")
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="вызовов каждого замера")
+    parser.add_argument("--seed", type=int, default=1, help="зерно случайных запросов")
+    parser.add_argument("--read-only", action="store_true", help="только чтения (база --db не копируется)")
+    parser.add_argument("--json", metavar="ФАЙЛ", help="записать результат в файл")
+    parser.add_argument("--compare", metavar="ФАЙЛ", help="сравнить с прошлым результатом; код выхода 1 при ухудшении")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="допустимый рост p50, доля")
+    args = parser.parse_args()
+    if args.db and not os.path.exists(args.db):
+        sys.exit(f"Ошибка: база {args.db} не найдена.")
+    baseline = None
+    if args.compare:
+        try:
+            with open(args.compare, encoding="utf-8") as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            sys.exit(f"Ошибка: не удалось прочитать {args.compare}: {e}")
+    with tempfile.TemporaryDirectory() as tmp:
+        db_name = args.db
+        if db_name is None:
+            db_name = os.path.join(tmp, "suite.db")
+            print(f"Синтетическая база: {int(args.rows):,} строк ...", flush=True)
+            datagen.generate(db_name, datagen.table_sizes(int(args.rows)))
+        elif not args.read_only:
+            copy = os.path.join(tmp, "suite.db")
+            source = kkurs.get_connection(db_name)
+            try:
+                source.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            finally:
+                source.close()
+            shutil.copyfile(db_name, copy)
+            db_name = copy
+        result = run(db_name, args.repeat, args.seed, not args.read_only)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=1)
+        print(f"Результат: {args.json}")
+    if baseline is not None:
+        worse = compare(baseline, result, args.threshold)
+        if worse:
+            sys.exit(f"Хуже на {args.threshold:.0%} и больше: {', '.join(worse)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import Soshina_1 as kkurs
+
+SYNC_BATCH = 10_000  # Сколько записей журнала читать и применять за одну транзакцию
+COMPACT_ROWS = 100_000  # После синхронизации журнал сжимается, если в нём больше стольких записей
+READER_DAYS = 30  # Реплика, которая не синхронизировалась столько дней, больше не держит журнал от сжатия
+
+# Журнал ChangeLog (миграция 6) хранит только (seq, номер таблицы, id): что строка менялась. Значения
+# берутся из самой таблицы в момент чтения журнала, поэтому применять изменения можно повторно и в любой
+# момент, а для строки важна только её последняя запись в журнале - на этом держится сжатие.
+
+def last_seq(conn):
+    """Номер последней записи журнала (0, если записей ещё не было); сжатие её не удаляет, так что он не уменьшается."""
+    return conn.execute("SELECT COALESCE(max(seq), 0) FROM ChangeLog").fetchone()[0]
+
+def horizon(conn):
+    """До какого seq журнал обрезан: читатель, остановившийся раньше, пропустил изменения."""
+    row = conn.execute("SELECT value FROM ChangeLogState WHERE name = 'truncated'").fetchone()
+    return row[0] if row else 0
+
+def read_batch(conn, after, limit=SYNC_BATCH):
+    """Изменения после seq after: (seq последней прочитанной записи, [(seq, таблица, id, {столбец: значение} или None)]).
+
+    None - строки уже нет (удалена). Строка, которая встречается в пачке несколько раз, берётся один раз,
+    с последним seq. Чтобы журнал и строки были согласованы, вызывать внутри транзакции чтения.
+    """
+    entries = conn.execute("SELECT seq, tbl, row_id FROM ChangeLog WHERE seq > ? ORDER BY seq LIMIT ?",
+                           (after, limit)).fetchall()
+    if not entries:
+        return after, []
+    latest = {}
+    for seq, code, row_id in entries:
+        latest[(code, row_id)] = seq
+    rows = {}
+    for code in {code for code, _ in latest}:
+        table = kkurs.CHANGELOG_TABLES[code]
+        ids = [row_id for (row_code, row_id) in latest if row_code == code]
+        cursor = conn.execute(f"SELECT * FROM {table} WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(ids),))
+        columns = [column[0] for column in cursor.description]
+        for row in cursor:
+            values = dict(zip(columns, row))
+            rows[(code, values["id"])] = values
+    changes = sorted((seq, kkurs.CHANGELOG_TABLES[code], row_id, rows.get((code, row_id)))
+                     for (code, row_id), seq in latest.items())
+    return entries[-1][0], changes
+
+def set_reader(conn, name, seq):
+    """Запоминает, докуда дочитал читатель name: журнал до этого места можно сжимать."""
+    conn.execute("INSERT INTO ChangeLogReaders (name, seq, updated) VALUES (?, ?, datetime('now')) "
+                 "ON CONFLICT (name) DO UPDATE SET seq = excluded.seq, updated = excluded.updated", (name, seq))
+
+def compact(conn):
+    """Сжимает журнал: оставляет по последней записи на строку и удаляет записи, которые прочитали все читатели.
+
+    Читатели, не обновлявшиеся READER_DAYS дней, забываются. Без читателей журнал не обрезается, только
+    убираются повторы, так что он не больше числа изменённых строк. Последняя запись остаётся всегда:
+    по ней SQLite выбирает следующий seq. Возвращает (повторов, обрезано).
+    """
+    with conn:
+        conn.execute("DELETE FROM ChangeLogReaders WHERE updated < datetime('now', ?)", (f"-{READER_DAYS} days",))
+        duplicates = conn.execute(
+            "DELETE FROM ChangeLog WHERE seq NOT IN (SELECT max(seq) FROM ChangeLog GROUP BY tbl, row_id)").rowcount
+        slowest = conn.execute("SELECT min(seq) FROM ChangeLogReaders").fetchone()[0]
+        truncated = 0
+        if slowest is not None and slowest > horizon(conn):
+            truncated = conn.execute("DELETE FROM ChangeLog WHERE seq <= ? AND seq < (SELECT max(seq) FROM ChangeLog)",
+                                     (slowest,)).rowcount
+            conn.execute("INSERT INTO ChangeLogState (name, value) VALUES ('truncated', ?) "
+                         "ON CONFLICT (name) DO UPDATE SET value = excluded.value", (slowest,))
+    return duplicates, truncated
+
+def maybe_compact(conn):
+    """compact, если в журнале больше COMPACT_ROWS записей (оценка по крайним seq, без подсчёта строк)."""
+    low, high = conn.execute("SELECT min(seq), max(seq) FROM ChangeLog").fetchone()
+    if low is not None and high - low + 1 > COMPACT_ROWS:
+        return compact(conn)
+    return None
+
+# --- Реплика ---
+
+def unique_keys(conn, table):
+    """Ключи уникальных индексов таблицы, кроме id: списки выражений SQL.
+
+    PRAGMA index_info не знает выражений (у столбца ifnull(name, '') имени нет), поэтому ключи индексов
+    из kkurs.UNIQUE_INDEXES берутся оттуда; индекс с выражением, которого там нет, - ValueError.
+    """
+    keys = []
+    for _, name, unique, origin, _ in conn.execute(f"PRAGMA index_list({table})").fetchall():
+        if not unique or origin == "pk":
+            continue
+        if name in kkurs.UNIQUE_INDEXES:
+            keys.append(list(kkurs.UNIQUE_INDEXES[name][1]))
+            continue
+        columns = [row[2] for row in conn.execute(f"PRAGMA index_info({name})")]
+        if None in columns:
+            raise ValueError(f"неизвестно выражение уникального индекса {name}")
+        keys.append(columns)
+    return keys
+
+def conflict_sql(table, key, columns):
+    """DELETE строк table с тем же ключом key, что у новой строки (значения columns), кроме её самой.
+
+    Выражения ключа вычисляются над значениями новой строки во вложенном SELECT, где имена столбцов -
+    это её значения, так что ifnull(name, '') и подобные сравниваются так же, как в индексе.
+    """
+    values = ", ".join(f"? AS {column}" for column in columns)
+    return (f"DELETE FROM {table} WHERE ({', '.join(key)}) = (SELECT {', '.join(key)} FROM (SELECT {values})) "
+            f"AND id <> ?")
+
+def upsert_sql(table, columns):
+    """INSERT ... ON CONFLICT (id) DO UPDATE; строка, в которой ничего не поменялось, не обновляется (и не трогает FTS)."""
+    others = [column for column in columns if column != "id"]
+    return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT (id) DO UPDATE SET {', '.join(f'{column} = excluded.{column}' for column in others)} "
+            f"WHERE ({', '.join(others)}) IS NOT ({', '.join(f'excluded.{column}' for column in others)})")
+
+def apply_changes(replica, changes):
+    """Применяет изменения read_batch к реплике: удаления, затем вставки или обновления (UPSERT по id).
+
+    UPSERT, а не REPLACE: так в реплике срабатывают её собственные триггеры FTS, R*Tree и SourceUsage.
+    Если значение уникального столбца сейчас занято в реплике другой строкой, та строка удаляется:
+    в источнике у неё значение уже другое, значит, она тоже есть в журнале дальше и вернётся.
+    """
+    for table in kkurs.CHANGELOG_TABLES:
+        deleted = [(row_id,) for _, row_table, row_id, values in changes if row_table == table and values is None]
+        # По возрастанию id: соседние строки лежат на одних страницах таблицы
+        upserts = sorted((values for _, row_table, _, values in changes if row_table == table and values is not None),
+                         key=lambda values: values["id"])
+        if deleted:
+            replica.executemany(f"DELETE FROM {table} WHERE id = ?", deleted)
+        if not upserts:
+            continue
+        columns = list(upserts[0])
+        sql = upsert_sql(table, columns)
+        try:
+            replica.executemany(sql, ([values[column] for column in columns] for values in upserts))
+        except sqlite3.IntegrityError:
+            keys = unique_keys(replica, table)
+            for values in upserts:
+                try:
+                    replica.execute(sql, [values[column] for column in columns])
+                except sqlite3.IntegrityError:
+                    row = [values[column] for column in columns]
+                    for key in keys:
+                        replica.execute(conflict_sql(table, key, columns), row + [values["id"]])
+                    replica.execute(sql, row)
+
+def forget_applied(replica):
+    """Очищает журнал реплики, кроме последней записи (по ней SQLite выбирает следующий seq).
+
+    В журнал реплики пишут её триггеры, пока к ней применяются изменения источника. Без читателей у самой
+    реплики эти записи никому не нужны, а сжатие без читателей журнал не обрезает, и он рос бы с каждой
+    синхронизацией.
+    """
+    replica.execute("DELETE FROM ChangeLog WHERE seq < (SELECT max(seq) FROM ChangeLog)")
+
+def replica_checkpoint(replica, source):
+    """Докуда реплика применила журнал источника source, или None, если не применяла."""
+    replica.execute("CREATE TABLE IF NOT EXISTS SyncState (source TEXT PRIMARY KEY, seq INTEGER NOT NULL)")
+    row = replica.execute("SELECT seq FROM SyncState WHERE source = ?", (source,)).fetchone()
+    return row[0] if row else None
+
+def full_copy(conn, replica_path, source):
+    """Копирует базу целиком (sqlite3 backup) и возвращает seq, на котором копия согласована с журналом."""
+    replica = sqlite3.connect(replica_path)
+    try:
+        conn.backup(replica)
+        replica.execute("PRAGMA journal_mode = WAL")
+        with replica:
+            seq = last_seq(replica)
+            # У реплики свой журнал: то, что было в журнале источника, ей не нужно
+            replica.execute("DELETE FROM ChangeLog")
+            replica.execute("DELETE FROM ChangeLogReaders")
+            replica.execute("DELETE FROM ChangeLogState")
+            replica.execute("DROP TABLE IF EXISTS SyncState")
+            replica_checkpoint(replica, source)
+            replica.execute("INSERT INTO SyncState (source, seq) VALUES (?, ?)", (source, seq))
+    finally:
+        replica.close()
+    return seq
+
+def sync_replica(db_name, replica_path, name=None, batch=SYNC_BATCH, full=False):
+    """Доводит реплику до текущего состояния базы db_name; возвращает словарь с итогами.
+
+    Реплика копируется целиком, если её ещё нет, если она синхронизирована с другим источником или
+    отстала дальше границы сжатия журнала; иначе применяются только изменения после её seq.
+    """
+    start = time.perf_counter()
+    conn = kkurs.get_connection(db_name)
+    source = kkurs.database_path(conn)
+    name = name or os.path.realpath(replica_path)
+    result = {"full_copy": False, "changes": 0, "compacted": None}
+    try:
+        checkpoint = None
+        if not full and os.path.exists(replica_path):
+            replica = kkurs.get_connection(replica_path)
+            checkpoint = replica_checkpoint(replica, source)
+            replica.close()
+        if checkpoint is None or checkpoint < horizon(conn):
+            checkpoint = full_copy(conn, replica_path, source)
+            result["full_copy"] = True
+        replica = kkurs.get_connection(replica_path)
+        try:
+            # Внешние ключи не проверяются: изменения разных таблиц приходят не в том порядке, в каком их можно проверить
+            replica.execute("PRAGMA foreign_keys = OFF")
+            # Свои читатели у реплики есть, если с неё синхронизируют другие реплики: тогда журнал нужен им
+            chained = replica.execute("SELECT 1 FROM ChangeLogReaders LIMIT 1").fetchone() is not None
+            while True:
+                conn.execute("BEGIN")
+                try:
+                    seq, changes = read_batch(conn, checkpoint, batch)
+                finally:
+                    conn.rollback()
+                if not changes:
+                    break
+                with replica:
+                    apply_changes(replica, changes)
+                    if not chained:
+                        forget_applied(replica)
+                    replica.execute("UPDATE SyncState SET seq = ? WHERE source = ?", (seq, source))
+                    kkurs.reference_cache.invalidate(kkurs.database_path(replica))
+                checkpoint = seq
+                result["changes"] += len(changes)
+            if chained:
+                maybe_compact(replica)
+        finally:
+            replica.close()
+        with conn:
+            set_reader(conn, name, checkpoint)
+        result["compacted"] = maybe_compact(conn)
+        result["seq"] = checkpoint
+    finally:
+        conn.close()
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+# --- JSONL ---
+
+def emit_jsonl(conn, out, after=0, name=None, batch=SYNC_BATCH):
+    """Пишет изменения после seq after строками JSON: seq, table, id, op (upsert/delete) и row - строка целиком.
+
+    Строки берутся в текущем состоянии, а не в том, что было на момент изменения. С name запоминает
+    прочитанное как у реплики. Возвращает (seq последнего изменения, число строк).
+    """
+    if after < horizon(conn):
+        raise ValueError(f"журнал сжат до seq {horizon(conn)}, а чтение начинается с {after}: "
+                         "нужна полная выгрузка (exporter.py или sync.py replica)")
+    count = 0
+    while True:
+        conn.execute("BEGIN")
+        try:
+            seq, changes = read_batch(conn, after, batch)
+        finally:
+            conn.rollback()
+        if not changes:
+            break
+        for change_seq, table, row_id, values in changes:
+            out.write(json.dumps({"seq": change_seq, "table": table, "id": row_id,
+                                  "op": "delete" if values is None else "upsert", "row": values},
+                                 ensure_ascii=False) + "\n")
+        after = seq
+        count += len(changes)
+    if name:
+        with conn:
+            set_reader(conn, name, after)
+    return after, count
+
+def status(conn):
+    """Состояние журнала: последний seq, записей, граница сжатия и читатели с отставанием."""
+    last = last_seq(conn)
+    return {"seq": last, "rows": conn.execute("SELECT count(*) FROM ChangeLog").fetchone()[0],
+            "truncated": horizon(conn),
+            "readers": [{"name": name, "seq": seq, "behind": last - seq, "updated": updated}
+                        for name, seq, updated in conn.execute("SELECT name, seq, updated FROM ChangeLogReaders "
+                                                               "ORDER BY seq")]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Журнал изменений KKurs: реплика, выгрузка изменений в JSONL, сжатие.")
+    parser.add_argument("--db", default=kkurs.DB_NAME, help="путь к базе данных (источнику)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser("replica", help="довести реплику до состояния источника")
+    command.add_argument("replica", help="файл реплики (создаётся, если его нет)")
+    command.add_argument("--name", help="имя читателя в ChangeLogReaders (по умолчанию - путь к реплике)")
+    command.add_argument("--full", action="store_true", help="скопировать базу целиком, даже если можно догнать журнал")
+    command.add_argument("--batch", type=int, default=SYNC_BATCH, help="записей журнала на транзакцию")
+    command = commands.add_parser("jsonl", help="изменения после seq строками JSON")
+    command.add_argument("--from", dest="after", type=int, help="seq, после которого читать (по умолчанию - где "
+                                                                "остановился --name, иначе с начала)")
+    command.add_argument("--name", help="запомнить прочитанное под этим именем")
+    command.add_argument("--out", help="файл (дописывается); без него - stdout")
+    commands.add_parser("compact", help="сжать журнал")
+    commands.add_parser("status", help="состояние журнала и читателей")
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        sys.exit(f"Ошибка: база {args.db} не найдена.")
+    try:
+        if args.command == "replica":
+            result = sync_replica(args.db, args.replica, args.name, args.batch, args.full)
+            print(f"{'Полная копия, затем ' if result['full_copy'] else ''}применено изменений: {result['changes']}, "
+                  f"seq {result['seq']}, {result['seconds']:.2f} с")
+            if result["compacted"]:
+                print(f"Журнал сжат: повторов удалено {result['compacted'][0]}, прочитанных - {result['compacted'][1]}")
+            return
+        conn = kkurs.get_connection(args.db)
+        try:
+            if args.command == "jsonl":
+                after = args.after
+                if after is None:
+                    row = conn.execute("SELECT seq FROM ChangeLogReaders WHERE name = ?", (args.name,)).fetchone()
+                    after = row[0] if row else 0
+                out = open(args.out, "a", encoding="utf-8") if args.out else sys.stdout
+                try:
+                    seq, count = emit_jsonl(conn, out, after, args.name)
+                finally:
+                    if args.out:
+                        out.close()
+                print(f"Изменений: {count}, seq {seq}", file=sys.stderr)
+            elif args.command == "compact":
+                duplicates, truncated = compact(conn)
+                print(f"Удалено повторов: {duplicates}, прочитанных всеми читателями: {truncated}")
+            else:
+                print(json.dumps(status(conn), ensure_ascii=False, indent=1))
+        finally:
+            conn.close()
+    except (ValueError, sqlite3.Error) as e:
+        sys.exit(f"Ошибка: {str(e).rstrip('.')}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+import asyncio
+import io
+import json
+import os
+import shutil
+import sqlite3
+import threading
+
+import pytest
+
+import Soshina_1 as kkurs
+import aiokkurs
+import backup
+import cli
+import datagen
+import exporter
+import importer
+import integrity
+import pool
+import service
+import snapshot
+import sync
+
+# Проверки поведения на маленькой синтетической базе datagen (запуск: python -m pytest -q)
+
+@pytest.fixture
+def db(tmp_path):
+    path = str(tmp_path / "kkurs.db")
+    datagen.generate(path, datagen.table_sizes(2000))
+    return path
+
+@pytest.fixture
+def conn(db):
+    conn = kkurs.get_connection(db)
+    yield conn
+    conn.close()
+
+# --- Реплика ---
+
+def test_sync_replica_swaps_unique_keys(db, tmp_path):
+    replica_path = str(tmp_path / "replica.db")
+    conn = kkurs.get_connection(db)
+    # Одинаковое имя автора: названия ключа (title, ifnull(name, '')) пересекаются при обмене
+    conn.execute("UPDATE Sources SET title = 'BBB', name = NULL WHERE id = 101")
+    conn.execute("UPDATE Sources SET title = 'CCC', name = NULL WHERE id = 102")
+    conn.commit()
+    assert sync.sync_replica(db, replica_path)["full_copy"]
+    conn.execute("UPDATE Sources SET title = 'tmp' WHERE id = 102")
+    conn.execute("UPDATE Sources SET title = 'CCC' WHERE id = 101")
+    conn.execute("UPDATE Sources SET title = 'BBB' WHERE id = 102")
+    conn.commit()
+    count = conn.execute("SELECT count(*) FROM Sources").fetchone()[0]
+    conn.close()
+    result = sync.sync_replica(db, replica_path)
+    assert not result["full_copy"] and result["changes"] == 2
+    replica = kkurs.get_connection(replica_path)
+    try:
+        rows = replica.execute("SELECT id, title FROM Sources WHERE id IN (101, 102) ORDER BY id").fetchall()
+        assert rows == [(101, "CCC"), (102, "BBB")]
+        assert replica.execute("SELECT count(*) FROM Sources").fetchone()[0] == count
+    finally:
+        replica.close()
+
+# --- Загрузка ---
+
+def test_import_rejects_bad_rows(conn, tmp_path):
+    path = tmp_path / "sources.jsonl"
+    rejects = tmp_path / "rejects.jsonl"
+    path.write_text('42\n{"title": {"x": 1}}\n{"title": ["x"]}\nне JSON\n{"type": "Книга"}\n'
+                    '{"title": "Новый источник"}\n{"title": "Новый источник"}\n', encoding="utf-8")
+    stats = importer.import_file(conn, "Sources", str(path), str(rejects))
+    assert (stats["read"], stats["inserted"], stats["rejected"]) == (7, 1, 6)
+    errors = [json.loads(line) for line in rejects.read_text(encoding="utf-8").splitlines()]
+    assert [error["line"] for error in errors] == [1, 2, 3, 4, 5, 7]
+    assert errors[-1]["error"].startswith("такая запись уже есть")
+
+def test_import_rejects_ambiguous_and_missing_references(conn, tmp_path):
+    conn.execute("UPDATE Sources SET title = 'Дубль' WHERE id IN (1, 2)")
+    conn.commit()
+    path = tmp_path / "events.jsonl"
+    rejects = tmp_path / "rejects.jsonl"
+    path.write_text('{"name": "С1", "data": "1850-01-01", "source": "Дубль"}\n'
+                    '{"name": "С2", "data": "1850-01-01", "source": "Нет такого"}\n'
+                    '{"name": "С3", "data": "1850-01-01", "resource_id": 999999}\n'
+                    '{"name": "С4", "data": "1850-01-01", "source": "Источник 00000005"}\n', encoding="utf-8")
+    stats = importer.import_file(conn, "Events", str(path), str(rejects))
+    assert (stats["inserted"], stats["rejected"]) == (1, 3)
+    errors = [json.loads(line)["error"] for line in rejects.read_text(encoding="utf-8").splitlines()]
+    assert errors[0].startswith("неоднозначная ссылка")
+    assert errors[1].startswith("source не найден")
+    assert errors[2].startswith("нет связанной записи")
+
+# --- Граф персон ---
+
+def graph_pairs(graph):
+    """Пары (персона, источник) графа."""
+    return {(person_id, source_id) for person_id in graph.person_ids
+            for source_id in graph.sources_of(person_id)}
+
+def fresh_pairs(db):
+    conn = kkurs.get_connection(db)
+    try:
+        return graph_pairs(kkurs.person_graph(conn))
+    finally:
+        conn.close()
+
+def unused_pair(conn):
+    """Персона и источник, у которых ещё нет общего взаимодействия."""
+    return conn.execute("SELECT p.id, s.id FROM Persons p, Sources s WHERE NOT EXISTS (SELECT 1 FROM PeopleInteractions i "
+                        "WHERE i.person_id = p.id AND i.resource_id = s.id) ORDER BY p.id DESC, s.id DESC LIMIT 1").fetchone()
+
+def test_graph_follows_row_writes(db, conn):
+    kkurs.person_graph(conn)
+    person_id, source_id = unused_pair(conn)
+    row_id = kkurs.insert_row(conn, "interactions", {"description": "т", "person_id": person_id, "resource_id": source_id})
+    conn.commit()
+    assert (person_id, source_id) in graph_pairs(kkurs.person_graph(conn))
+    kkurs.update_row(conn, "interactions", row_id, {"person_id": 1})
+    conn.commit()
+    assert graph_pairs(kkurs.person_graph(conn)) == fresh_pairs(db)
+    kkurs.delete_row(conn, "interactions", row_id)
+    conn.commit()
+    assert graph_pairs(kkurs.person_graph(conn)) == fresh_pairs(db)
+    person_id, source_id = unused_pair(conn)
+    kkurs.insert_row(conn, "interactions", {"description": "т", "person_id": person_id, "resource_id": source_id})
+    conn.rollback()
+    assert graph_pairs(kkurs.person_graph(conn)) == fresh_pairs(db)
+
+def test_async_interactions_update_graph(db):
+    async def scenario():
+        async with aiokkurs.Database(db) as adb:
+            first = await adb.interactions.add(description="а", person_id=1, resource_id=1)
+            await adb.interactions.add(description="б", person_id=2, resource_id=2)
+            await adb.interactions.path(1, 2)  # Граф построен до изменения
+            await adb.interactions.update(first, resource_id=2)
+            return await adb.interactions.path(1, 2)
+
+    conn = kkurs.get_connection(db)
+    conn.execute("DELETE FROM PeopleInteractions WHERE person_id IN (1, 2) OR resource_id IN (1, 2)")
+    conn.commit()
+    conn.close()
+    assert asyncio.run(scenario()) == [1, 2, 2]
+    assert fresh_pairs(db) >= {(1, 2), (2, 2)}
+
+# --- Миграции ---
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "KKurs.db")
+
+@pytest.fixture
+def baseline(tmp_path):
+    path = str(tmp_path / "baseline.db")
+    shutil.copyfile(BASELINE, path)
+    return path
+
+def test_migrations_on_baseline(baseline):
+    conn = kkurs.get_connection(baseline)
+    try:
+        assert kkurs.schema_version(conn) == len(kkurs.MIGRATIONS)
+        assert conn.execute("PRAGMA integrity_check").fetchone() == ("ok",)
+        conn.execute("INSERT INTO Sources (title, name) VALUES ('Без автора', NULL)")
+        with pytest.raises(sqlite3.IntegrityError):
+            conn.execute("INSERT INTO Sources (title, name) VALUES ('Без автора', NULL)")
+        conn.execute("INSERT INTO Persons (surname, name) VALUES ('Без отчества', 'Имя')")
+        with pytest.raises(sqlite3.IntegrityError):
+            conn.execute("INSERT INTO Persons (surname, name) VALUES ('Без отчества', 'Имя')")
+    finally:
+        conn.close()
+
+def test_migration_reports_duplicates(baseline):
+    conn = sqlite3.connect(baseline)
+    conn.execute("INSERT INTO Sources (title, name) VALUES ('Дубль', NULL), ('Дубль', NULL)")
+    conn.commit()
+    conn.close()
+    with pytest.raises(sqlite3.DatabaseError, match="Миграция 1 не применена: повторяются строки Sources"):
+        kkurs.get_connection(baseline)
+    conn = sqlite3.connect(baseline)
+    conn.execute("BEGIN")
+    assert integrity.dedupe(conn) == {"idx_sources_title_name": (1, 1)}
+    conn.commit()
+    conn.close()
+    kkurs.get_connection(baseline).close()
+
+# --- Постраничный вывод ---
+
+def all_pages(conn, view, limit):
+    """id строк представления, собранные по страницам list_page; каждая непоследняя страница полная."""
+    ids = []
+    after = None
+    while True:
+        rows, after = kkurs.list_page(conn, view, limit, after)
+        assert len(rows) <= limit
+        ids += [row[-1] for row in rows]
+        if after is None:
+            return ids
+        assert len(rows) == limit
+
+@pytest.mark.parametrize("use_snapshot", [False, True])
+@pytest.mark.parametrize("limit", [1, 7, 45, 1000])
+def test_keyset_pages_cover_view_in_order(db, monkeypatch, use_snapshot, limit):
+    conn = kkurs.get_connection(db)
+    # NULL в ключе и повторы ключа: страницы переходят через границу NULL и через одинаковые ключи
+    conn.execute("UPDATE Events SET data = NULL WHERE id % 17 = 0")
+    conn.execute("UPDATE Events SET data = '1850-01-01' WHERE id % 5 = 0")
+    conn.execute("UPDATE Coordinates SET latitude = NULL WHERE id % 13 = 0")
+    conn.commit()
+    conn.close()
+    if use_snapshot:
+        snapshot.build(os.path.realpath(db))
+    monkeypatch.setattr(kkurs, "USE_SNAPSHOT", use_snapshot)
+    conn = kkurs.get_connection(db)
+    assert (kkurs.open_snapshot(conn) is not None) == use_snapshot
+    try:
+        for view, (columns, source, key, id_column) in kkurs.LIST_VIEWS.items():
+            expected = [row[0] for row in conn.execute(f"SELECT {id_column} FROM {source} ORDER BY {key}, {id_column}")]
+            assert all_pages(conn, view, limit) == expected, view
+    finally:
+        conn.close()
+
+def test_page_after_last_row_is_empty(conn):
+    count = conn.execute("SELECT count(*) FROM Sources").fetchone()[0]
+    rows, after = kkurs.list_page(conn, "sources", count)
+    assert len(rows) == count and after is not None
+    assert kkurs.list_page(conn, "sources", count, after) == ([], None)
+
+# --- Граф персон: запись через cli.py и HTTP-сервис ---
+
+def test_graph_follows_cli_writes(db, conn):
+    kkurs.person_graph(conn)
+    person_id, source_id = unused_pair(conn)
+    out = io.StringIO()
+    cli.run_batch(conn, [f"interactions add --person {person_id} --source {source_id} --description т"], out)
+    row_id = int(out.getvalue())
+    assert graph_pairs(kkurs.person_graph(conn)) == fresh_pairs(db)
+    cli.run_batch(conn, [f"interactions update {row_id} --person 1"], io.StringIO())
+    assert graph_pairs(kkurs.person_graph(conn)) == fresh_pairs(db)
+    cli.run_batch(conn, [f"interactions delete {row_id}"], io.StringIO())
+    assert graph_pairs(kkurs.person_graph(conn)) == fresh_pairs(db)
+    with pytest.raises(ValueError):
+        cli.run_batch(conn, [f"interactions add --person {person_id} --source {source_id}", "interactions get 0"],
+                      io.StringIO())
+    assert graph_pairs(kkurs.person_graph(conn)) == fresh_pairs(db)
+
+def test_graph_follows_service_writes(db, conn):
+    person_id, source_id = unused_pair(conn)
+
+    async def scenario():
+        svc = service.Service(db)
+        try:
+            def pairs():
+                return svc.read(lambda c: graph_pairs(kkurs.person_graph(c)))
+            def writer_pairs():
+                return svc.write(lambda c: graph_pairs(kkurs.person_graph(c)))
+            await pairs()
+            await writer_pairs()
+            body = json.dumps({"person_id": person_id, "resource_id": source_id}).encode()
+            status, payload = await svc.respond("POST", "/interactions", body)
+            assert status == 201
+            assert await pairs() == await writer_pairs() == fresh_pairs(db)
+            status, _ = await svc.respond("PATCH", f"/interactions/{payload['id']}", b'{"person_id": 1}')
+            assert status == 200
+            assert await pairs() == await writer_pairs() == fresh_pairs(db)
+            status, _ = await svc.respond("DELETE", f"/interactions/{payload['id']}", b"")
+            assert status == 204
+            assert await pairs() == await writer_pairs() == fresh_pairs(db)
+        finally:
+            svc.close()
+
+    asyncio.run(scenario())
+
+# --- Экспорт ---
+
+def test_storage_classes_see_mixed_values_past_first_chunk(db, conn):
+    conn.execute("UPDATE Coordinates SET latitude = 'north' WHERE id = (SELECT max(id) FROM Coordinates)")
+    conn.commit()
+    query = exporter.dataset_query("Coordinates")
+    columns = ["id", "latitude", "longitude", "name"]
+    assert exporter.storage_classes(conn, query, columns) == [{"integer"}, {"real", "text"}, {"real"}, {"text"}]
+
+def test_parquet_export_with_mixed_column(db, conn, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    conn.execute("UPDATE Coordinates SET latitude = 'north' WHERE id = (SELECT max(id) FROM Coordinates)")
+    conn.commit()
+    exporter.export_all(db, tmp_path, "parquet", ["Coordinates"], chunk_size=50)
+    table = pq.read_table(tmp_path / "Coordinates.parquet")
+    assert table.num_rows == conn.execute("SELECT count(*) FROM Coordinates").fetchone()[0]
+    assert table.column("latitude").to_pylist()[-1] == "north"
+
+# --- Резервная копия в фоне ---
+
+def test_backup_job_reports_unexpected_error(db, tmp_path, monkeypatch):
+    def broken(*args, **kwargs):
+        raise TypeError("сломано")
+
+    monkeypatch.setattr(backup, "backup_database", broken)
+    job = backup.BackupJob(db, str(tmp_path))
+    job.start()
+    job.join()
+    assert job.describe() == "Копия не снята: непредвиденная ошибка TypeError: сломано"
+
+# --- Пул подключений ---
+
+def test_pool_fails_when_writer_cannot_connect(db, monkeypatch):
+    get_connection = kkurs.get_connection
+
+    def failing(db_name=None, profile=None):
+        if threading.current_thread().name == "kkurs-writer":
+            raise sqlite3.OperationalError("unable to open database file")
+        return get_connection(db_name, profile)
+
+    monkeypatch.setattr(kkurs, "get_connection", failing)
+    with pytest.raises(sqlite3.OperationalError):
+        pool.ConnectionPool(db)
+    assert not any(thread.name == "kkurs-writer" for thread in threading.enumerate())
@@ -0,0 +1,126 @@
+import argparse
+import heapq
+import os
+import sys
+
+import Soshina_1 as kkurs
+
+# Таблица -> что показывать в хронологии; у обеих таблиц есть индекс по data (миграция 2)
+TIMELINE_TABLES = {"Events": "событие", "Tex": "текст"}
+BUCKETS = {"year": 1, "decade": 10, "century": 100}
+END_OF_PREFIX = "\U0010ffff"  # Больше любого символа: "1850" + он больше всех дат, начинающихся с 1850
+
+# Даты хранятся строками ГГГГ-ММ-ДД, а в Tex часто только год (ГГГГ). Такие строки сравниваются
+# как даты, поэтому диапазон дат - это диапазон по индексу data. Границы можно задавать с любой
+# точностью: "1840" - с начала 1840 года, до "1850" - до конца 1850 года включительно.
+
+def range_bounds(start=None, end=None):
+    """Условие WHERE по data и его параметры для диапазона [start, end] (границы - префиксы дат)."""
+    conditions = ["data IS NOT NULL"]
+    params = []
+    if start:
+        conditions.append("data >= ?")
+        params.append(start)
+    if end:
+        conditions.append("data < ?")
+        params.append(end + END_OF_PREFIX)
+    return " AND ".join(conditions), params
+
+def date_range(conn, table, start=None, end=None, limit=None):
+    """Строки (data, id, name) таблицы в диапазоне дат по возрастанию (data, id).
+
+    Запрос идёт по индексу data: поиск начала диапазона O(log n), затем k строк подряд, без сортировки.
+    Возвращает курсор, строки читаются по мере перебора.
+    """
+    where, params = range_bounds(start, end)
+    sql = f"SELECT data, id, name FROM {table} WHERE {where} ORDER BY data, id"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return conn.execute(sql, params)
+
+def histogram(conn, table, bucket="decade", start=None, end=None):
+    """Число строк по годам, десятилетиям или векам: список (первый год периода, количество) без пустых периодов.
+
+    Первый и последний год берутся из концов индекса data, затем для каждого периода выполняется
+    COUNT(*) по диапазону индекса. Это в разы быстрее GROUP BY по вычисленному году: SQLite считает
+    строки диапазона, не разбирая каждую дату. Год - первые четыре символа даты.
+    """
+    size = BUCKETS[bucket]
+    where, params = range_bounds(start, end)
+    where += " AND data GLOB '[0-9][0-9][0-9][0-9]*'"
+    first = conn.execute(f"SELECT data FROM {table} WHERE {where} ORDER BY data LIMIT 1", params).fetchone()
+    if first is None:
+        return []
+    last = conn.execute(f"SELECT data FROM {table} WHERE {where} ORDER BY data DESC LIMIT 1", params).fetchone()
+    rows = []
+    for period in range(int(first[0][:4]) // size * size, int(last[0][:4]) + 1, size):
+        lower = f"{period:04d}"
+        upper = f"{period + size:04d}"
+        if start:
+            lower = max(lower, start)
+        if end:
+            upper = min(upper, end + END_OF_PREFIX)
+        count = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE data >= ? AND data < ?", (lower, upper)).fetchone()[0]
+        if count:
+            rows.append((period, count))
+    return rows
+
+def stream(conn, start=None, end=None, tables=None):
+    """Общая хронология событий и текстов: строки (data, таблица, id, name) по возрастанию даты.
+
+    Каждая таблица читается своим курсором уже в порядке индекса, а heapq.merge сливает курсоры,
+    держа в памяти по одной строке от каждого, - без сортировки всей выборки в Python.
+    """
+    cursors = []
+    for table in tables or TIMELINE_TABLES:
+        where, params = range_bounds(start, end)
+        cursors.append(conn.execute(
+            f"SELECT data, '{table}', id, name FROM {table} WHERE {where} ORDER BY data, id", params))
+    return heapq.merge(*cursors, key=lambda row: row[0])
+
+def print_histogram(rows, bucket):
+    if not rows:
+        print("Нет записей.")
+        return
+    width = 50
+    top = max(count for _, count in rows)
+    for period, count in rows:
+        label = f"{period}" if bucket == "year" else f"{period}-{period + BUCKETS[bucket] - 1}"
+        print(f"{label:>9} {count:>8} {'#' * max(1, count * width // top)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Хронология событий и текстов KKurs.")
+    parser.add_argument("--db", default=kkurs.DB_NAME, help="путь к базе данных")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, help_ in (("range", "записи за период"), ("histogram", "число записей по периодам"),
+                        ("stream", "события и тексты вместе по дате")):
+        command = commands.add_parser(name, help=help_)
+        command.add_argument("--from", dest="start", help="начало периода: ГГГГ, ГГГГ-ММ или ГГГГ-ММ-ДД")
+        command.add_argument("--to", dest="end", help="конец периода включительно, так же")
+        if name != "stream":
+            command.add_argument("--table", choices=sorted(TIMELINE_TABLES), default="Events")
+        if name == "histogram":
+            command.add_argument("--by", choices=sorted(BUCKETS), default="decade", help="размер периода")
+        else:
+            command.add_argument("--limit", type=int, help="сколько записей показать")
+    args = parser.parse_args()
+    if not os.path.exists(args.db):
+        sys.exit(f"Ошибка: база {args.db} не найдена.")
+    conn = kkurs.get_connection(args.db)
+    try:
+        if args.command == "histogram":
+            print_histogram(histogram(conn, args.table, args.by, args.start, args.end), args.by)
+        elif args.command == "range":
+            for data, _, name in date_range(conn, args.table, args.start, args.end, args.limit):
+                print(f"{data}  {name}")
+        else:
+            for i, (data, table, _, name) in enumerate(stream(conn, args.start, args.end)):
+                if args.limit and i >= args.limit:
+                    break
+                print(f"{data}  {TIMELINE_TABLES[table]}: {name}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()